@@ -0,0 +1,469 @@
+"""
+DatabaseManager 微基准测试
+
+    python benchmark.py run --scales 1k,100k --out bench.json
+    python benchmark.py run --scales 1m --only footprint --out bench_1m.json
+    python benchmark.py compare base.json bench.json --threshold 0.10
+    python benchmark.py startup --runs 5
+
+按足迹数量构建不同规模的临时数据库 (datagen.py, 固定 seed), 对每个操作先预热再重复计时,
+报告 p50/p90/p99, 结果保存为 JSON. compare 比较两次结果的 p50, 超过阈值的变慢视为回归并以非零状态退出
+startup 测量 create_app() 到第一个请求完成的时间, 比较重建数据库、复制模板和使用已有数据库三种启动方式
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from datetime import date, datetime, timedelta
+
+import datagen
+from models import DatabaseManager
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+CASES = []
+
+
+def case(group, heavy=False):
+    """注册一个基准用例; heavy 的用例 (全表读取) 重复次数更少"""
+    def register(func):
+        CASES.append((group, func.__name__, heavy, func))
+        return func
+    return register
+
+
+class Context:
+    """各用例需要的样本 id, 在数据生成后从数据库中选出"""
+
+    def __init__(self, db):
+        self.db = db
+        self.counter = itertools.count()
+        with db.pool.connection() as conn:
+            def one(sql):
+                row = conn.execute(sql).fetchone()
+                return row[0] if row else None
+
+            self.busy_user = one('SELECT user_id FROM footprints GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1')
+            self.quiet_user = one('SELECT user_id FROM footprints GROUP BY user_id ORDER BY COUNT(*) LIMIT 1')
+            self.busy_username = one(f'SELECT username FROM users WHERE user_id = {self.busy_user}')
+            self.traveler = one('SELECT user_id FROM trip_participants GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1')
+            self.rare_traveler = one('SELECT user_id FROM trip_participants GROUP BY user_id ORDER BY COUNT(*) LIMIT 1')
+            self.hot_footprint = one('SELECT footprint_id FROM comments GROUP BY footprint_id ORDER BY COUNT(*) DESC LIMIT 1')
+            self.footprint = one('SELECT footprint_id FROM footprints ORDER BY footprint_id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM footprints)')
+            self.location = one('SELECT location_id FROM footprints GROUP BY location_id ORDER BY COUNT(*) DESC LIMIT 1')
+            self.point = conn.execute(
+                f'SELECT latitude, longitude FROM locations WHERE location_id = {self.location}').fetchone()
+            self.collector = one('SELECT user_id FROM collections GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1')
+            self.middle_day = one('SELECT start_day FROM trips ORDER BY start_day LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM trips)')
+        middle = date.fromisoformat(self.middle_day)
+        self.week_after = (middle + timedelta(days=6)).isoformat()
+        self.year_after = (middle + timedelta(days=365)).isoformat()
+        # 深翻页: 从中间位置开始的游标
+        first = db.get_footprints_page(page_size=200)
+        self.deep_cursor = first['next_cursor']
+
+    def unique(self, prefix):
+        return f'{prefix}_{os.getpid()}_{next(self.counter)}'
+
+
+###########################
+##        reads          ##
+###########################
+
+@case('user', heavy=True)
+def get_all_users(ctx):
+    ctx.db.get_all_users()
+
+
+@case('user')
+def get_users_page(ctx):
+    ctx.db.get_users_page(page_size=20)
+
+
+@case('user')
+def get_feed_page_traveler(ctx):
+    ctx.db.get_feed_page(ctx.traveler, page_size=20)
+
+
+@case('location', heavy=True)
+def get_all_locations(ctx):
+    ctx.db.get_all_locations()
+
+
+@case('location')
+def get_nearest_locations(ctx):
+    ctx.db.get_nearest_locations(*ctx.point, k=10)
+
+
+@case('location')
+def get_locations_in_bbox_city(ctx):
+    lat, lon = ctx.point
+    ctx.db.get_locations_in_bbox(lat - 0.1, lon - 0.1, lat + 0.1, lon + 0.1, limit=50)
+
+
+@case('location')
+def get_footprints_within_2km(ctx):
+    ctx.db.get_footprints_within(*ctx.point, 2.0, page_size=20)
+
+
+@case('trip')
+def get_trips_overlapping_week(ctx):
+    ctx.db.get_trips_overlapping(ctx.middle_day, ctx.week_after, limit=20)
+
+
+@case('trip')
+def find_trip_conflicts_busy_travelers(ctx):
+    ctx.db.find_trip_conflicts([ctx.traveler, ctx.rare_traveler], ctx.middle_day, ctx.week_after)
+
+
+@case('trip')
+def get_user_availability_year(ctx):
+    ctx.db.get_user_availability(ctx.traveler, ctx.middle_day, ctx.year_after)
+
+
+@case('trip', heavy=True)
+def get_all_trips(ctx):
+    ctx.db.get_all_trips()
+
+
+@case('trip')
+def get_trips_page(ctx):
+    ctx.db.get_trips_page(page_size=20)
+
+
+@case('trip')
+def get_trips_by_filters_popular_participant(ctx):
+    ctx.db.get_trips_by_filters([ctx.traveler])
+
+
+@case('trip')
+def get_trips_by_filters_rare_participant(ctx):
+    ctx.db.get_trips_by_filters([ctx.rare_traveler])
+
+
+@case('trip')
+def get_trips_by_filters_date_range(ctx):
+    ctx.db.get_trips_by_filters(None, start_after=ctx.middle_day, limit=20)
+
+
+@case('footprint', heavy=True)
+def get_all_footprints(ctx):
+    ctx.db.get_all_footprints()
+
+
+@case('footprint')
+def get_footprints_page_first(ctx):
+    ctx.db.get_footprints_page(page_size=20)
+
+
+@case('footprint')
+def get_footprints_page_deep(ctx):
+    ctx.db.get_footprints_page(ctx.deep_cursor, page_size=20)
+
+
+@case('footprint')
+def get_footprints_by_filters_username(ctx):
+    ctx.db.get_footprints_by_filters(username=ctx.busy_username)
+
+
+@case('footprint', heavy=True)
+def get_footprints_by_filters_type(ctx):
+    ctx.db.get_footprints_by_filters(location_types=['restaurant'])
+
+
+@case('footprint', heavy=True)
+def get_footprints_by_filters_time_window(ctx):
+    ctx.db.get_footprints_by_filters(created_after='2024-06-01', created_before='2024-06-08')
+
+
+@case('footprint')
+def get_popular_footprints(ctx):
+    ctx.db.get_popular_footprints(page_size=20)
+
+
+@case('footprint')
+def search_footprints_common_word(ctx):
+    ctx.db.search_footprints('sunset')
+
+
+@case('footprint')
+def search_footprints_two_words(ctx):
+    ctx.db.search_footprints('river coffee')
+
+
+@case('footprint')
+def get_footprint_detail(ctx):
+    ctx.db.get_footprint_detail(ctx.footprint)
+
+
+@case('comment')
+def get_comments_by_footprint_hot(ctx):
+    ctx.db.get_comments_by_footprint(ctx.hot_footprint)
+
+
+@case('comment')
+def get_comments_page_hot(ctx):
+    ctx.db.get_comments_page(ctx.hot_footprint, page_size=20)
+
+
+@case('comment')
+def get_comment_threads_hot(ctx):
+    ctx.db.get_comment_threads(ctx.hot_footprint, page_size=20)
+
+
+@case('collection')
+def get_collections_by_user(ctx):
+    ctx.db.get_collections_by_user(ctx.collector)
+
+
+@case('collection')
+def is_collected(ctx):
+    ctx.db.is_collected(ctx.collector, ctx.footprint)
+
+
+###########################
+##        writes         ##
+###########################
+
+@case('user')
+def create_user(ctx):
+    name = ctx.unique('bench')
+    ctx.db.create_user(name, f'{name}@example.com')
+
+
+@case('trip')
+def create_and_delete_trip(ctx):
+    trip_id = ctx.db.create_trip([ctx.traveler, ctx.quiet_user], '2030-01-01', '2030-01-05', [ctx.location])
+    ctx.db.delete_trip(trip_id)
+
+
+@case('footprint')
+def create_footprint(ctx):
+    ctx.db.create_footprint(ctx.quiet_user, 'bench footprint', 'benchmark content', ctx.location)
+
+
+@case('footprint')
+def update_footprint(ctx):
+    ctx.db.update_footprint(ctx.footprint, ctx.unique('title'), 'updated by benchmark', ctx.location)
+
+
+@case('comment')
+def create_comment(ctx):
+    ctx.db.create_comment(ctx.quiet_user, ctx.hot_footprint, 'benchmark comment')
+
+
+@case('collection')
+def collect_and_uncollect(ctx):
+    ctx.db.create_collection(ctx.quiet_user, ctx.footprint)
+    ctx.db.delete_collection(ctx.quiet_user, ctx.footprint)
+
+
+###########################
+##        runner         ##
+###########################
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def measure(func, ctx, warmup, repeat, budget):
+    """先预热 warmup 次, 再重复最多 repeat 次 (至少 3 次, 总时间不超过 budget 秒)"""
+    for _ in range(warmup):
+        func(ctx)
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < repeat and (len(samples) < 3 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        func(ctx)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': len(samples),
+        'mean_ms': statistics.fmean(samples),
+        'min_ms': min(samples),
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+    }
+
+
+def build_database(directory, footprints, seed):
+    path = os.path.join(directory, f'bench_{footprints}.db')
+    scale = footprints / datagen.BASE_COUNTS['footprints']
+    datagen.generate(path, seed=seed, scale=scale, progress=None, with_feed=True)
+    return path
+
+
+def run(scales, seed=0, warmup=3, repeat=50, budget=5.0, only=None, keep=None, cache_size=0):
+    """cache_size: 读缓存大小, 默认 0 (关闭), 计时的是查询本身而不是缓存命中"""
+    directory = keep or tempfile.mkdtemp(prefix='mygo_bench_')
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': seed,
+            'cache_size': cache_size,
+        },
+        'results': {},
+    }
+    try:
+        for scale in scales:
+            footprints = SCALES[scale]
+            print(f"== {scale}: building database with {footprints} footprints ...")
+            started = time.perf_counter()
+            path = build_database(directory, footprints, seed)
+            print(f"   built in {time.perf_counter() - started:.1f}s")
+
+            db = DatabaseManager(path, cache_size=cache_size)
+            ctx = Context(db)
+            scale_results = results['results'][scale] = {}
+            for group, name, heavy, func in CASES:
+                if only and only not in (group, name):
+                    continue
+                stats = measure(func, ctx,
+                                warmup=1 if heavy else warmup,
+                                repeat=max(3, repeat // 10) if heavy else repeat,
+                                budget=budget)
+                stats['group'] = group
+                scale_results[name] = stats
+                print(f"   {name:<45} p50 {stats['p50_ms']:10.3f} ms   "
+                      f"p99 {stats['p99_ms']:10.3f} ms   ({stats['runs']} runs)")
+            db.close()
+    finally:
+        if keep is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def startup(runs=5, template=None):
+    """返回 {启动方式: {'create_app_ms', 'first_request_ms', 'total_ms'}} (各取中位数)"""
+    import bootstrap
+    import config
+    from mygo import create_app
+
+    directory = tempfile.mkdtemp(prefix='mygo_startup_')
+    try:
+        template = template or bootstrap.build_template(os.path.join(directory, 'template.db'))
+        path = os.path.join(directory, 'database.db')
+        profiles = [
+            # 之前 create_app 的行为: 删除数据库, 建表, 插入示例数据
+            ('reset + fake data', {'DB_RESET': True, 'DB_FAKE_DATA': True}),
+            ('template copy', {'DB_RESET': True, 'DB_TEMPLATE': template}),
+            # 重启: 数据库已是最新结构, 已有用户时不再插入示例数据
+            ('existing database', {'DB_FAKE_DATA': True}),
+        ]
+        results = {}
+        for name, overrides in profiles:
+            settings = type('StartupConfig', (config.Config,),
+                            dict(overrides, DATABASE_PATH=path, SLOW_QUERY_LOG=None))
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                app = create_app(settings)
+                created = time.perf_counter()
+                response = app.test_client().get('/user/')
+                finished = time.perf_counter()
+                app.extensions['mygo_db'].close()
+                if response.status_code != 200:
+                    raise Exception(f"{name}: first request returned {response.status_code}")
+                samples.append(((created - started) * 1000, (finished - created) * 1000,
+                                (finished - started) * 1000))
+            results[name] = {
+                key: statistics.median(sample[i] for sample in samples)
+                for i, key in enumerate(('create_app_ms', 'first_request_ms', 'total_ms'))
+            }
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(base, new, threshold):
+    """返回 p50 变慢超过 threshold (比例) 的用例列表"""
+    regressions = []
+    for scale, cases in new['results'].items():
+        for name, stats in cases.items():
+            old = base['results'].get(scale, {}).get(name)
+            if old is None:
+                print(f"  {scale:>5} {name:<45} (new)")
+                continue
+            change = stats['p50_ms'] / old['p50_ms'] - 1 if old['p50_ms'] else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append((scale, name, change))
+            elif change < -threshold:
+                flag = '  faster'
+            print(f"  {scale:>5} {name:<45} {old['p50_ms']:10.3f} -> {stats['p50_ms']:10.3f} ms "
+                  f"({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DatabaseManager micro-benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run')
+    run_parser.add_argument('--scales', default='1k,100k',
+                            help=f"comma separated, from {', '.join(SCALES)}")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--warmup', type=int, default=3)
+    run_parser.add_argument('--repeat', type=int, default=50)
+    run_parser.add_argument('--budget', type=float, default=5.0,
+                            help='max seconds spent timing a single case')
+    run_parser.add_argument('--only', help='run a single group or case')
+    run_parser.add_argument('--keep', help='build databases in this directory and keep them')
+    run_parser.add_argument('--out', help='write JSON results to this file')
+    run_parser.add_argument('--cache-size', type=int, default=0,
+                            help='read cache entries (default 0: time the queries, not cache hits)')
+
+    compare_parser = sub.add_parser('compare')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative p50 slowdown counted as a regression')
+
+    startup_parser = sub.add_parser('startup', help='time from create_app() to the first response')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.add_argument('--template', help='use this template database instead of building one')
+
+    args = parser.parse_args()
+    if args.command == 'startup':
+        for name, stats in startup(args.runs, args.template).items():
+            print(f"  {name:<20} create_app {stats['create_app_ms']:8.1f} ms   "
+                  f"first request {stats['first_request_ms']:8.1f} ms   "
+                  f"total {stats['total_ms']:8.1f} ms")
+    elif args.command == 'run':
+        scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+        unknown = [s for s in scales if s not in SCALES]
+        if unknown:
+            parser.error(f"unknown scale(s): {', '.join(unknown)}")
+        if args.keep:
+            os.makedirs(args.keep, exist_ok=True)
+        results = run(scales, seed=args.seed, warmup=args.warmup, repeat=args.repeat,
+                      budget=args.budget, only=args.only, keep=args.keep, cache_size=args.cache_size)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"results written to {args.out}")
+    else:
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+        print("no regressions")
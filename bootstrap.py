@@ -0,0 +1,164 @@
+"""
+启动时的数据库准备
+
+    bootstrap.init_app(app)             # 按 app.config 创建共享的 DatabaseManager, 放在 app.extensions['mygo_db']
+
+    python bootstrap.py template [template.db] [--scale 0.01] [--seed 0]
+
+启动不再删除数据库: 文件不存在时复制 DB_TEMPLATE (模板不存在时先生成; 未设置模板则建空库), 已有数据库只执行尚未执行的迁移
+(已是最新版本时只读一次 user_version), DB_FAKE_DATA 只在数据库还没有用户时插入示例数据
+DB_LAZY_INIT 为 True 时迁移和示例数据推迟到第一个请求
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+
+import datagen
+from models import DatabaseManager
+
+TEMPLATE_NAME = 'template.db'
+
+
+def remove_database(path):
+    for name in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def copy_template(template, path):
+    """把模板复制为 path; 先复制到同目录的临时文件再改名, 同时启动的 worker 不会读到一半的文件"""
+    if not os.path.exists(template):
+        raise Exception(f"Template database {template} does not exist")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copyfile(template, tmp)
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+def ensure_template(template):
+    """模板不存在时用示例数据建一个; 先建在同目录的临时文件再改名, 同时启动的 worker 不会读到一半的模板"""
+    if os.path.exists(template):
+        return False
+    directory = os.path.dirname(os.path.abspath(template))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        build_template(tmp)
+        os.replace(tmp, template)
+    finally:
+        remove_database(tmp)
+    return True
+
+
+def prepare_file(path, template=None, reset=False):
+    """
+    连接数据库之前的文件操作: reset 时删除旧文件, 文件不存在且有模板时复制模板
+    模板文件还不存在时先按 build_template 生成
+    """
+    if reset:
+        remove_database(path)
+    if template and not os.path.exists(path):
+        ensure_template(template)
+        copy_template(template, path)
+
+
+def prepare(db, fake_data=False):
+    """迁移到最新结构; fake_data 且没有用户时插入示例数据, 返回是否插入了示例数据"""
+    db.migrate()
+    if not fake_data:
+        return False
+    with db._get_connection() as conn:
+        if conn.execute('SELECT 1 FROM users LIMIT 1').fetchone() is not None:
+            return False
+    db.insert_fake_data()
+    return True
+
+
+def create_sharded_db(config):
+    """DB_SHARDS > 0 时创建 ShardedDatabaseManager; 打开时即迁移各分片"""
+    from sharding import ShardedDatabaseManager
+
+    if config.get('DB_TEMPLATE') or config.get('DB_REPLICA'):
+        raise Exception("DB_TEMPLATE and DB_REPLICA are not supported with DB_SHARDS")
+    return ShardedDatabaseManager(config.get('DB_SHARD_DIR', 'shards'),
+                                  shards=config['DB_SHARDS'],
+                                  initial=config.get('DB_RESET', False),
+                                  pool_size=config.get('DB_POOL_SIZE', 5),
+                                  concurrent=config.get('DB_CONCURRENT', False))
+
+
+def create_db(config):
+    """按配置 (app.config 或同样的 dict) 创建 DatabaseManager, 只做文件准备, 不连接数据库"""
+    if config.get('DB_SHARDS'):
+        return create_sharded_db(config)
+    path = config.get('DATABASE_PATH', 'database.db')
+    prepare_file(path, config.get('DB_TEMPLATE'), config.get('DB_RESET', False))
+    return DatabaseManager(path,
+                           pool_size=config.get('DB_POOL_SIZE', 5),
+                           concurrent=config.get('DB_CONCURRENT', False),
+                           replica=config.get('DB_REPLICA', False),
+                           replica_staleness=config.get('DB_REPLICA_STALENESS', 1.0))
+
+
+def init_app(app):
+    """创建 app 共享的 DatabaseManager; 视图通过 routers.get_db() 取得"""
+    db = create_db(app.config)
+    app.extensions['mygo_db'] = db
+    fake_data = app.config.get('DB_FAKE_DATA', False)
+    if not app.config.get('DB_LAZY_INIT', True):
+        prepare(db, fake_data)
+        return db
+
+    lock = threading.Lock()
+    ready = threading.Event()
+
+    def before_request():
+        if ready.is_set():
+            return None
+        with lock:
+            if not ready.is_set():
+                prepare(db, fake_data)
+                ready.set()
+        return None
+
+    # 要在其他 before_request (如条件请求的表版本查询) 之前执行
+    app.before_request_funcs.setdefault(None, []).insert(0, before_request)
+    return db
+
+
+def build_template(path=TEMPLATE_NAME, scale=None, seed=0, progress=print):
+    """
+    新建模板数据库: 最新结构 + 示例数据; scale 不为空时改用 datagen 按该比例生成压测数据
+    完成后 VACUUM, 模板是不带 -wal 的单个文件
+    """
+    remove_database(path)
+    if scale is None:
+        db = DatabaseManager(path)
+        db.migrate()
+        db.insert_fake_data()
+    else:
+        datagen.generate(path, seed=seed, scale=scale, progress=progress, with_feed=True)
+        db = DatabaseManager(path)
+    with db.pool.connection() as conn:
+        conn.execute('VACUUM')
+    db.close()
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MyGO database bootstrap')
+    sub = parser.add_subparsers(dest='command', required=True)
+    template_parser = sub.add_parser('template', help='build a template database to copy at startup')
+    template_parser.add_argument('path', nargs='?', default=TEMPLATE_NAME)
+    template_parser.add_argument('--scale', type=float, help='use datagen load-test data at this scale')
+    template_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"built {build_template(args.path, args.scale, args.seed)}")
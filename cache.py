@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
+from pool import abandon
+
+
+class LRUCache:
+    """线程安全的有界 LRU 缓存"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
+
+
+def _copy(value):
+    # 缓存中的对象被多个请求共享, 返回副本以免调用方修改缓存内容
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+class ReadCache:
+    """
+    DatabaseManager 的读缓存
+    缓存键中带有所依赖各表的代数 (generation), 表被写入后代数加一, 旧条目不再命中, 随 LRU 淘汰
+    代数的来源:
+        1. 本进程的写方法直接调用 bump()
+        2. 其他连接/进程的写入: 每次读取前检查 PRAGMA data_version, 变化时读取
+           table_versions (由触发器维护) 找出被修改的表
+    """
+
+    def __init__(self, pool, maxsize=1024):
+        self.pool = pool
+        self.lru = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._db_versions = {}
+        self._db_updated = {}
+        self._data_version = None
+        self._watch = None
+        self._watch_generation = None
+        self.invalidations = 0
+
+    def _watch_connection(self):
+        if self._watch is None or self._watch_generation != self.pool.generation:
+            if self._watch is not None:
+                self._watch.close()
+            self._watch = self.pool._connect(observed=False)
+            self._watch_generation = self.pool.generation
+            self._data_version = None
+        return self._watch
+
+    def sync(self):
+        """检查其他连接的提交, 把有变化的表的代数加一"""
+        with self._lock:
+            conn = self._watch_connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            try:
+                rows = conn.execute('SELECT name, version, updated_at FROM table_versions').fetchall()
+            except sqlite3.OperationalError:
+                # 还没有迁移到带 table_versions (updated_at) 的版本
+                rows = []
+            versions = {name: version for name, version, _ in rows}
+            for name, version in versions.items():
+                if name in self._db_versions and self._db_versions[name] != version:
+                    self._generations[name] = self._generations.get(name, 0) + 1
+                    self.invalidations += 1
+            self._db_versions = versions
+            self._db_updated = {name: updated_at for name, _, updated_at in rows}
+            self._data_version = data_version
+
+    def after_fork(self):
+        """在 fork 出的子进程中调用: 丢弃继承的检查连接 (不关闭), 换掉可能被父进程线程持有的锁"""
+        abandon(self._watch)
+        self._watch = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self.lru = LRUCache(self.lru.maxsize)
+
+    def table_state(self, tables):
+        """数据库中 tables 的 ({表: 版本号}, 最近修改时间); 没有新提交时只检查一次 data_version"""
+        self.sync()
+        with self._lock:
+            versions = {name: self._db_versions.get(name, 0) for name in tables}
+            updated = max((self._db_updated.get(name, 0) for name in tables), default=0)
+        return versions, updated
+
+    def bump(self, *tables):
+        with self._lock:
+            for name in tables:
+                self._generations[name] = self._generations.get(name, 0) + 1
+                self.invalidations += 1
+
+    def generations(self, tables):
+        return tuple(self._generations.get(name, 0) for name in tables)
+
+    def get_or_load(self, key, tables, loader):
+        self.sync()
+        full_key = (key, self.generations(tables))
+        found, value = self.lru.get(full_key)
+        if not found:
+            value = loader()
+            self.lru.set(full_key, value)
+        return _copy(value)
+
+    def clear(self):
+        self.lru.clear()
+        with self._lock:
+            self._db_versions = {}
+            self._db_updated = {}
+            self._data_version = None
+
+    def close(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+
+    def stats(self):
+        stats = self.lru.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
@@ -0,0 +1,98 @@
+"""
+应用配置
+
+    create_app('production')            # 或环境变量 MYGO_CONFIG=production
+    create_app(DevelopmentConfig)       # 也可以直接传配置类
+
+之后以 MYGO_ 开头的环境变量覆盖同名配置项, 如 MYGO_DATABASE_PATH=/data/mygo.db
+"""
+import httpcache
+
+from models import DB_NAME, DEFAULT_PAGE_SIZE
+
+
+class Config:
+    PAGE_SIZE = DEFAULT_PAGE_SIZE
+    # 评论树: 每条评论预先展开的回复数 / 最大层数, 其余通过"更多回复"加载
+    COMMENT_REPLIES = 3
+    COMMENT_MAX_DEPTH = 3
+    # /location/nearby 默认的足迹搜索半径 (公里)
+    NEARBY_RADIUS_KM = 5.0
+    # /user/<id>/availability 默认显示的天数
+    AVAILABILITY_DAYS = 90
+
+    ###########################
+    ##       database        ##
+    ###########################
+
+    DATABASE_PATH = DB_NAME
+    DB_POOL_SIZE = 5
+    # WAL + 单独的写线程 (DatabaseManager(concurrent=True))
+    DB_CONCURRENT = False
+    # 启动时删除数据库文件 (之前 create_app 的行为); 有 DB_TEMPLATE 时从模板重新复制
+    DB_RESET = False
+    # 数据库文件不存在时复制这个预先建好的数据库 (python bootstrap.py template), 代替建表和插入数据
+    DB_TEMPLATE = None
+    # 数据库中还没有用户时插入示例数据
+    DB_FAKE_DATA = False
+    # 迁移和示例数据推迟到第一个请求, create_app 不访问数据库
+    DB_LAZY_INIT = True
+    # 读请求走内存只读副本, 副本最多落后 DB_REPLICA_STALENESS 秒
+    DB_REPLICA = False
+    DB_REPLICA_STALENESS = 1.0
+    # 大于 0 时按用户分片存储 (sharding.py), DB_SHARD_DIR 下为 catalog.db 和各分片; 不支持 DB_TEMPLATE / DB_REPLICA
+    DB_SHARDS = 0
+    DB_SHARD_DIR = 'shards'
+
+    ###########################
+    ##     observability     ##
+    ###########################
+
+    METRICS_ENABLED = True
+    # 在响应头 X-DB-Stats 中给出本次请求的查询次数和数据库耗时
+    DB_DEBUG_HEADER = True
+    # 超过 SLOW_QUERY_MS 的语句连同 EXPLAIN QUERY PLAN 写入 SLOW_QUERY_LOG (JSONL), 默认不记录
+    # 例如 SLOW_QUERY_LOG = 'logs/slow_queries.jsonl'; 超过 SLOW_QUERY_LOG_MAX_BYTES 时轮转, 保留 SLOW_QUERY_LOG_BACKUPS 份
+    SLOW_QUERY_LOG = None
+    SLOW_QUERY_MS = 100.0
+    SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 3
+
+    ###########################
+    ##        caching        ##
+    ###########################
+
+    # 列表/详情页的 ETag 与 Last-Modified, 内容未变化时返回 304; Cache-Control 按 blueprint 配置
+    HTTP_CACHE_ENABLED = True
+    HTTP_CACHE_CONTROL = dict(httpcache.DEFAULT_CACHE_CONTROL)
+    # 足迹卡片/行程行/评论的渲染结果缓存 (条目数); FRAGMENT_CACHE_DIR 非空时多个 worker 通过磁盘共享
+    FRAGMENT_CACHE_SIZE = 4096
+    FRAGMENT_CACHE_DIR = None
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DB_FAKE_DATA = True
+
+
+class ProductionConfig(Config):
+    DB_CONCURRENT = True
+    DB_POOL_SIZE = 8
+    DB_LAZY_INIT = False
+    DB_DEBUG_HEADER = False
+
+
+class TestingConfig(Config):
+    TESTING = True
+    DATABASE_PATH = 'test.db'
+    # 每次创建 app 都从模板得到一份干净的数据库
+    DB_RESET = True
+    DB_TEMPLATE = 'template.db'
+    FRAGMENT_CACHE_SIZE = 0
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
@@ -0,0 +1,370 @@
+"""
+可复现的大规模测试数据生成器
+
+    python datagen.py database.db --seed 42 --scale 1
+    python datagen.py database.db --seed 7 --scale 10 --append
+
+同一个 seed + scale 总是生成相同的数据. scale=1 约一百万行, 各表行数见 BASE_COUNTS
+用户/地点/足迹的热度服从 Zipf 分布, 评论会形成回复链
+导入时先删除二级索引和触发器, 用 executemany 在一个事务里批量写入, 最后重建索引和派生数据
+"""
+import argparse
+import itertools
+import math
+import random
+import sqlite3
+import time
+
+import feed
+
+from datetime import datetime, timedelta, timezone, date
+
+from migrations import (COUNTERS, counter_backfill_sql, rebuild_location_index, rebuild_trip_intervals,
+                        rebuild_trip_summaries)
+from models import DatabaseManager, DB_NAME
+
+BASE_COUNTS = {
+    'users': 20000,
+    'locations': 5000,
+    'trips': 50000,
+    'footprints': 200000,
+    'comments': 400000,
+    'collections': 100000,
+}
+
+LOCATION_TYPES = ['attraction', 'restaurant', 'transport']
+CITIES = ['Paris', 'London', 'Beijing', 'Tokyo', 'Shanghai', 'New York', 'Rome', 'Kyoto',
+          'Berlin', 'Seoul', 'Bangkok', 'Sydney', 'Chengdu', 'Barcelona', 'Istanbul']
+# 城市中心坐标 (纬度, 经度), 地点散布在中心附近
+CITY_CENTERS = {
+    'Paris': (48.8566, 2.3522), 'London': (51.5074, -0.1278), 'Beijing': (39.9042, 116.4074),
+    'Tokyo': (35.6762, 139.6503), 'Shanghai': (31.2304, 121.4737), 'New York': (40.7128, -74.0060),
+    'Rome': (41.9028, 12.4964), 'Kyoto': (35.0116, 135.7681), 'Berlin': (52.5200, 13.4050),
+    'Seoul': (37.5665, 126.9780), 'Bangkok': (13.7563, 100.5018), 'Sydney': (-33.8688, 151.2093),
+    'Chengdu': (30.5728, 104.0668), 'Barcelona': (41.3874, 2.1686), 'Istanbul': (41.0082, 28.9784),
+}
+# 地点到城市中心距离的标准差 (纬度方向的度数, 约 9 公里)
+CITY_SPREAD = 0.08
+PLACE_WORDS = {
+    'attraction': ['Tower', 'Museum', 'Park', 'Temple', 'Palace', 'Bridge', 'Garden', 'Square'],
+    'restaurant': ['Noodle House', 'Bistro', 'Sushi Bar', 'Dumpling Shop', 'Cafe', 'Grill'],
+    'transport': ['Station', 'Airport', 'Ferry Terminal', 'Bus Depot'],
+}
+ADJECTIVES = ['Old', 'Grand', 'Royal', 'Little', 'Golden', 'Hidden', 'Central', 'Riverside',
+              'Sunny', 'Quiet', 'Famous', 'Ancient', 'Modern', 'Lucky']
+WORDS = ['amazing', 'crowded', 'quiet', 'sunset', 'morning', 'view', 'food', 'queue', 'rain',
+         'friends', 'walk', 'photo', 'history', 'tasty', 'expensive', 'cheap', 'again', 'night',
+         'river', 'street', 'market', 'train', 'coffee', 'tea', 'lovely', 'tired', 'happy']
+
+# created_at 以 UTC 秒数存储
+EPOCH_START = int(datetime(2022, 1, 1, tzinfo=timezone.utc).timestamp())
+EPOCH_SPAN = 3 * 365 * 24 * 3600
+
+
+def zipf_cum_weights(n, s=1.1):
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+class ZipfSampler:
+    """按 Zipf 分布抽取 ids 中的元素; 热门元素随机打散, 不集中在小 id 上"""
+
+    def __init__(self, rng, ids, s=1.1):
+        self.rng = rng
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum = zipf_cum_weights(len(self.ids), s)
+
+    def sample(self, k=1):
+        return self.rng.choices(self.ids, cum_weights=self.cum, k=k)
+
+    def distinct(self, k):
+        k = min(k, len(self.ids))
+        picked = set()
+        while len(picked) < k:
+            picked.update(self.sample(k - len(picked)))
+        return list(picked)
+
+
+def _batched(rows, size):
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def _timestamp(rng, after=None):
+    if after is None:
+        return EPOCH_START + rng.randrange(EPOCH_SPAN)
+    return after + rng.randrange(1, 30 * 24 * 3600)
+
+
+class Generator:
+    def __init__(self, conn, seed, scale, batch_size=50000, progress=print):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        # 坐标用单独的随机数序列, 加入坐标之前同一个 seed 生成的其他数据保持不变
+        self.coordinate_rng = random.Random(f'{seed}:coordinates')
+        self.counts = {name: max(1, int(n * scale)) for name, n in BASE_COUNTS.items()}
+        self.batch_size = batch_size
+        self.progress = progress
+        self.loaded = {}
+
+    def _next_id(self, table, column):
+        return self.conn.execute(f'SELECT IFNULL(MAX({column}), 0) + 1 FROM {table}').fetchone()[0]
+
+    def _insert(self, table, sql, rows):
+        started = time.perf_counter()
+        count = 0
+        for batch in _batched(rows, self.batch_size):
+            self.conn.executemany(sql, batch)
+            count += len(batch)
+        self.loaded[table] = self.loaded.get(table, 0) + count
+        self.progress(f"  {table}: {count} rows in {time.perf_counter() - started:.1f}s")
+
+    def users(self):
+        first = self._next_id('users', 'user_id')
+        self.user_ids = range(first, first + self.counts['users'])
+        self._insert('users', 'INSERT INTO users (user_id, username, email) VALUES (?, ?, ?)', (
+            (uid, f'user_{uid}', f'user_{uid}@example.com') for uid in self.user_ids
+        ))
+        self.popular_users = ZipfSampler(self.rng, self.user_ids)
+
+    def coordinates(self, city):
+        rng = self.coordinate_rng
+        lat, lon = CITY_CENTERS[city]
+        lat = min(90.0, max(-90.0, rng.gauss(lat, CITY_SPREAD)))
+        lon = rng.gauss(lon, CITY_SPREAD / max(math.cos(math.radians(lat)), 0.01))
+        return round(lat, 6), round((lon + 180.0) % 360.0 - 180.0, 6)
+
+    def locations(self):
+        rng = self.rng
+        first = self._next_id('locations', 'location_id')
+        self.location_ids = range(first, first + self.counts['locations'])
+
+        def rows():
+            for lid in self.location_ids:
+                location_type = rng.choice(LOCATION_TYPES)
+                name = f'{rng.choice(ADJECTIVES)} {rng.choice(PLACE_WORDS[location_type])} #{lid}'
+                city = rng.choice(CITIES)
+                yield (lid, name, city, location_type) + self.coordinates(city)
+
+        self._insert('locations', '''
+            INSERT INTO locations (location_id, name, address, type, latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?)''', rows())
+        self.popular_locations = ZipfSampler(rng, self.location_ids)
+
+    def trips(self):
+        rng = self.rng
+        first = self._next_id('trips', 'trip_id')
+        trip_ids = range(first, first + self.counts['trips'])
+        participants = []
+        trip_locations = []
+
+        def rows():
+            for tid in trip_ids:
+                start = date(2022, 1, 1) + timedelta(days=rng.randrange(5 * 365))
+                end = start + timedelta(days=rng.randint(1, 14))
+                for uid in self.popular_users.distinct(rng.randint(1, 5)):
+                    participants.append((uid, tid))
+                for lid in self.popular_locations.distinct(rng.randint(0, 4)):
+                    trip_locations.append((lid, tid))
+                yield tid, start.isoformat(), end.isoformat()
+
+        self._insert('trips', 'INSERT INTO trips (trip_id, start_day, end_day) VALUES (?, ?, ?)', rows())
+        self._insert('trip_participants', 'INSERT INTO trip_participants (user_id, trip_id) VALUES (?, ?)', participants)
+        self._insert('trip_locations', 'INSERT INTO trip_locations (location_id, trip_id) VALUES (?, ?)', trip_locations)
+
+    def footprints(self):
+        rng = self.rng
+        first = self._next_id('footprints', 'footprint_id')
+        self.footprint_ids = range(first, first + self.counts['footprints'])
+        self.footprint_times = {}
+        authors = self.popular_users.sample(len(self.footprint_ids))
+        places = self.popular_locations.sample(len(self.footprint_ids))
+
+        def rows():
+            for fid, uid, lid in zip(self.footprint_ids, authors, places):
+                created_at = _timestamp(rng)
+                self.footprint_times[fid] = created_at
+                title = f'{rng.choice(WORDS).title()} {rng.choice(WORDS)}'
+                yield (fid, title, _sentence(rng, rng.randint(5, 30)),
+                       f'img_{fid}.jpg', created_at, uid, lid)
+
+        self._insert('footprints', '''
+            INSERT INTO footprints
+            (footprint_id, title, content, image_url, created_at, user_id, location_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows())
+        self.popular_footprints = ZipfSampler(rng, self.footprint_ids)
+
+    def comments(self):
+        rng = self.rng
+        comment_id = self._next_id('comments', 'comment_id')
+        per_footprint = {}
+        for fid in self.popular_footprints.sample(self.counts['comments']):
+            per_footprint[fid] = per_footprint.get(fid, 0) + 1
+
+        def rows():
+            nonlocal comment_id
+            for fid in sorted(per_footprint):
+                created_at = self.footprint_times[fid]
+                thread = []
+                for _ in range(per_footprint[fid]):
+                    created_at = _timestamp(rng, created_at)
+                    parent = None
+                    # 一半左右是回复, 更倾向于回复最近的评论, 形成回复链
+                    if thread and rng.random() < 0.5:
+                        parent = thread[-1] if rng.random() < 0.6 else rng.choice(thread)
+                    yield (comment_id, _sentence(rng, rng.randint(2, 15)),
+                           created_at, self.popular_users.sample()[0],
+                           fid, parent)
+                    thread.append(comment_id)
+                    comment_id += 1
+
+        self._insert('comments', '''
+            INSERT INTO comments
+            (comment_id, content, created_at, user_id, footprint_id, parent_comment_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows())
+
+    def collections(self):
+        rng = self.rng
+        seen = set()
+        users = self.popular_users.sample(self.counts['collections'])
+        footprints = self.popular_footprints.sample(self.counts['collections'])
+
+        def rows():
+            for uid, fid in zip(users, footprints):
+                if (uid, fid) in seen:
+                    continue
+                seen.add((uid, fid))
+                yield uid, fid, _timestamp(rng, self.footprint_times[fid])
+
+        self._insert('collections', '''
+            INSERT OR IGNORE INTO collections (user_id, footprint_id, created_at) VALUES (?, ?, ?)
+        ''', rows())
+
+    def run(self):
+        self.users()
+        self.locations()
+        self.trips()
+        self.footprints()
+        self.comments()
+        self.collections()
+        return self.loaded
+
+
+###########################
+##   deferred indexes    ##
+###########################
+
+def _drop_indexes_and_triggers(conn):
+    """删除二级索引和触发器并返回其定义, 导入完成后按原样重建"""
+    objects = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''').fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} IF EXISTS "{name}"')
+    return objects
+
+
+def _restore_indexes_and_triggers(conn, objects, types=('index', 'trigger')):
+    for object_type, _, sql in objects:
+        if object_type in types:
+            conn.execute(sql)
+
+
+def rebuild_derived(conn):
+    """重建由触发器维护的派生数据 (导入时触发器被临时删除)"""
+    conn.execute('DELETE FROM footprint_fts')
+    conn.execute('''
+        INSERT INTO footprint_fts(rowid, title, content, location_name, location_address)
+        SELECT f.footprint_id, f.title, f.content, l.name, l.address
+        FROM footprints f JOIN locations l ON f.location_id = l.location_id
+    ''')
+    for counter in COUNTERS:
+        conn.execute(counter_backfill_sql(*counter))
+    rebuild_trip_summaries(conn)
+    rebuild_location_index(conn)
+    rebuild_trip_intervals(conn)
+    # 让其他进程中的读缓存失效
+    conn.execute('''
+        UPDATE table_versions
+        SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+    ''')
+
+
+def generate(db_path=DB_NAME, seed=0, scale=1.0, reset=True, batch_size=50000, progress=print,
+             with_feed=False):
+    """
+    生成测试数据并写入 db_path
+    参数:
+        reset: 为 True 时先删除旧数据库; 否则追加到已有数据之后
+        with_feed: 同时重建同行者时间线 (行数约为足迹数乘以平均同行人数, 默认不生成)
+    返回: 每张表写入的行数
+    """
+    progress = progress or (lambda *args: None)
+    db = DatabaseManager(db_path, initial=reset)
+    db.migrate()
+    db.close()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # 导入期间放宽持久性要求, 整个导入是一个事务, 中途失败会整体回滚
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA foreign_keys = OFF')
+        conn.execute('BEGIN')
+        try:
+            deferred = _drop_indexes_and_triggers(conn)
+            loaded = Generator(conn, seed, scale, batch_size, progress).run()
+
+            index_started = time.perf_counter()
+            # 派生数据的重建依赖索引, 但不应触发触发器
+            _restore_indexes_and_triggers(conn, deferred, ('index',))
+            rebuild_derived(conn)
+            if with_feed:
+                feed.rebuild(conn)
+            _restore_indexes_and_triggers(conn, deferred, ('trigger',))
+            progress(f"  indexes and derived data: {time.perf_counter() - index_started:.1f}s")
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+    total = sum(loaded.values())
+    elapsed = time.perf_counter() - started
+    progress(f"loaded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    return loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate reproducible synthetic MyGO data')
+    parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='1.0 is roughly one million rows, see BASE_COUNTS')
+    parser.add_argument('--append', action='store_true', help='keep existing data')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--with-feed', action='store_true',
+                        help='also build every co-traveler timeline (large)')
+    args = parser.parse_args()
+    generate(args.db_path, seed=args.seed, scale=args.scale, reset=not args.append,
+             batch_size=args.batch_size, with_feed=args.with_feed)
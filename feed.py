@@ -0,0 +1,212 @@
+"""
+同行者动态 (feed)
+
+每个用户的时间线是与其一起参加过行程的人 (co_travelers 视图) 发布的足迹, 按时间倒序
+写扩散: 新足迹由触发器写入 feed_outbox, 由 drain() 批量展开到各读者的 feed_items
+    - sync: create_footprint 在同一事务中展开
+    - background: 后台线程定期 (或被唤醒时) 按批展开
+    - None: 只写 outbox, 由其他进程执行 python feed.py work
+读扩散: 同行者超过 fanout_limit 的作者记入 feed_pull_authors, 不再展开, 读取时直接从 footprints 合并
+
+    python feed.py rebuild [database.db]
+    python feed.py work [database.db] [--interval 1.0]
+"""
+import argparse
+import threading
+import time
+
+# 同行者多于该值的作者改为读时合并
+FANOUT_LIMIT = 500
+# 新建立同行关系时, 每位作者补入的最近足迹数
+BACKFILL = 200
+BATCH_SIZE = 500
+
+
+def _pairs(users):
+    users = sorted(set(users))
+    return [(a, b) for a in users for b in users if a != b]
+
+
+def mark_pull_authors(conn, authors, fanout_limit=FANOUT_LIMIT):
+    """把同行者数超过 fanout_limit 的作者加入 feed_pull_authors, 返回这些作者"""
+    heavy = []
+    known = {row[0] for row in conn.execute('SELECT user_id FROM feed_pull_authors')}
+    for author in set(authors) - known:
+        audience = conn.execute(
+            'SELECT COUNT(*) FROM co_travelers WHERE other_id = ?', (author,)
+        ).fetchone()[0]
+        if audience > fanout_limit:
+            heavy.append(author)
+    conn.executemany('INSERT OR IGNORE INTO feed_pull_authors (user_id) VALUES (?)',
+                     [(author,) for author in heavy])
+    return heavy
+
+
+def pending(conn):
+    """outbox 中是否有待展开的足迹 (只读, 空轮询不必进入写方法)"""
+    return conn.execute('SELECT EXISTS (SELECT 1 FROM feed_outbox)').fetchone()[0] == 1
+
+
+def drain(conn, fanout_limit=FANOUT_LIMIT, batch_size=BATCH_SIZE):
+    """
+    把 feed_outbox 中最早的 batch_size 条足迹展开到读者的 feed_items 并从 outbox 删除
+    返回处理的足迹数
+    """
+    rows = conn.execute('''
+        SELECT o.footprint_id, f.user_id
+        FROM feed_outbox o
+        LEFT JOIN footprints f ON f.footprint_id = o.footprint_id
+        ORDER BY o.footprint_id
+        LIMIT ?
+    ''', (batch_size,)).fetchall()
+    if not rows:
+        return 0
+    last = rows[-1][0]
+    mark_pull_authors(conn, [author for _, author in rows if author is not None], fanout_limit)
+    conn.execute('''
+        INSERT OR IGNORE INTO feed_items (user_id, footprint_id, created_at)
+        SELECT c.user_id, f.footprint_id, f.created_at
+        FROM feed_outbox o
+        JOIN footprints f ON f.footprint_id = o.footprint_id
+        JOIN co_travelers c ON c.other_id = f.user_id
+        WHERE o.footprint_id <= ?
+          AND f.user_id NOT IN (SELECT user_id FROM feed_pull_authors)
+    ''', (last,))
+    conn.execute('DELETE FROM feed_outbox WHERE footprint_id <= ?', (last,))
+    return len(rows)
+
+
+def connect_users(conn, users, backfill=BACKFILL):
+    """
+    users 一起参加了新行程: 互相补入对方最近的 backfill 条足迹
+    (已经是同行者的, INSERT OR IGNORE 不会重复写入)
+    """
+    conn.executemany(f'''
+        INSERT OR IGNORE INTO feed_items (user_id, footprint_id, created_at)
+        SELECT ?, f.footprint_id, f.created_at
+        FROM footprints f
+        WHERE f.user_id = ?
+          AND f.user_id NOT IN (SELECT user_id FROM feed_pull_authors)
+        ORDER BY f.created_at DESC
+        LIMIT {int(backfill)}
+    ''', _pairs(users))
+
+
+def disconnect_users(conn, users):
+    """行程被删除后, 不再是同行者的两人互相移除对方的足迹"""
+    conn.executemany('''
+        DELETE FROM feed_items
+        WHERE user_id = ?1
+          AND footprint_id IN (SELECT footprint_id FROM footprints WHERE user_id = ?2)
+          AND NOT EXISTS (
+              SELECT 1 FROM co_travelers WHERE user_id = ?1 AND other_id = ?2
+          )
+    ''', _pairs(users))
+
+
+def remove_user(conn, user_id):
+    """删除用户: 该用户的时间线, 以及该用户出现在别人时间线中或尚未展开的足迹"""
+    conn.execute('DELETE FROM feed_items WHERE user_id = ?', (user_id,))
+    conn.execute('''
+        DELETE FROM feed_items
+        WHERE footprint_id IN (SELECT footprint_id FROM footprints WHERE user_id = ?)
+    ''', (user_id,))
+    conn.execute('''
+        DELETE FROM feed_outbox
+        WHERE footprint_id IN (SELECT footprint_id FROM footprints WHERE user_id = ?)
+    ''', (user_id,))
+    conn.execute('DELETE FROM feed_pull_authors WHERE user_id = ?', (user_id,))
+
+
+def rebuild(conn, fanout_limit=FANOUT_LIMIT, backfill=BACKFILL):
+    """按当前的行程和足迹全量重建 feed_items / feed_pull_authors, 清空 outbox"""
+    conn.execute('DELETE FROM feed_items')
+    conn.execute('DELETE FROM feed_pull_authors')
+    conn.execute('DELETE FROM feed_outbox')
+    conn.execute('''
+        INSERT INTO feed_pull_authors (user_id)
+        SELECT other_id FROM co_travelers GROUP BY other_id HAVING COUNT(*) > ?
+    ''', (fanout_limit,))
+    conn.execute(f'''
+        INSERT OR IGNORE INTO feed_items (user_id, footprint_id, created_at)
+        SELECT user_id, footprint_id, created_at FROM (
+            SELECT c.user_id, f.footprint_id, f.created_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY c.user_id, f.user_id
+                       ORDER BY f.created_at DESC, f.footprint_id DESC
+                   ) AS n
+            FROM co_travelers c
+            JOIN footprints f ON f.user_id = c.other_id
+            WHERE c.other_id NOT IN (SELECT user_id FROM feed_pull_authors)
+        )
+        WHERE n <= {int(backfill)}
+    ''')
+
+
+class FeedWorker:
+    """后台展开线程: notify() 唤醒, 否则每 interval 秒检查一次 outbox"""
+
+    def __init__(self, db, interval=1.0):
+        self.db = db
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.processed = 0
+        self._thread = threading.Thread(target=self._run, name='feed-fanout', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                # 先用只读查询检查 outbox: 空轮询不走写方法, 不会使读缓存和副本失效
+                while not self._stopped and self.db.feed_outbox_pending():
+                    count = self.db.process_feed_outbox()
+                    self.processed += count
+                    if not count:
+                        break
+            except Exception as e:
+                print(f"动态展开失败: {str(e)}")
+
+    def after_fork(self):
+        """在 fork 出的子进程中重新启动展开线程"""
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='feed-fanout', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+
+if __name__ == '__main__':
+    from models import DatabaseManager, DB_NAME
+
+    parser = argparse.ArgumentParser(description='MyGO feed maintenance')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = sub.add_parser('rebuild', help='rebuild every timeline from trips and footprints')
+    rebuild_parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    work_parser = sub.add_parser('work', help='fan out pending footprints until interrupted')
+    work_parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    work_parser.add_argument('--interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db_path, feed_mode=None)
+    if args.command == 'rebuild':
+        print(f"rebuilt {db.rebuild_feed()} feed items")
+    else:
+        try:
+            while True:
+                count = db.process_feed_outbox() if db.feed_outbox_pending() else 0
+                if count:
+                    print(f"fanned out {count} footprint(s)")
+                else:
+                    time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+    db.close()
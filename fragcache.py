@@ -0,0 +1,165 @@
+"""
+模板片段缓存
+
+    fragcache.init_app(app, db_manager)     # FRAGMENT_CACHE_SIZE / FRAGMENT_CACHE_DIR
+
+模板中:
+    {% cache 'footprint', fp.footprint_id, fp %} ... {% endcache %}
+
+参数为 (实体类型, 实体 id, 版本); 版本可以是任意可转为 JSON 的值 (通常是片段用到的实体字段列表),
+取其摘要, 与缓存中的不同时重新渲染. 版本中不能有随查询变化的值 (如搜索的 rank), 否则同一实体的片段不断被替换. 同一实体在不同模板/位置的片段分别保存
+片段内不能使用随请求变化的内容 (当前用户、request.full_path 等), 这些放在 cache 块之外
+进程内为有界 LRU; 设置 FRAGMENT_CACHE_DIR 后同时写入磁盘, 供多个 worker 共享
+DatabaseManager 的写方法修改实体后调用 invalidate(kind, ids), 立即清除对应片段
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import LRUCache
+
+
+def version_digest(value):
+    payload = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class FragmentCache:
+    """
+    (kind, id) -> {片段名: (版本摘要, html)}
+    按实体而不是按版本保存, 每个实体每个片段只有一份, invalidate 时可以直接找到
+    """
+
+    def __init__(self, maxsize=4096, directory=None):
+        self.lru = LRUCache(maxsize)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.disk_hits = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _entity_dir(self, kind, entity_id):
+        return os.path.join(self.directory, str(kind), str(entity_id))
+
+    def _disk_path(self, kind, entity_id, fragment):
+        name = hashlib.sha1(fragment.encode()).hexdigest()[:16] + '.html'
+        return os.path.join(self._entity_dir(kind, entity_id), name)
+
+    def _read_disk(self, kind, entity_id, fragment, version):
+        try:
+            with open(self._disk_path(kind, entity_id, fragment), encoding='utf-8') as f:
+                stored_version = f.readline().rstrip('\n')
+                if stored_version == version:
+                    return f.read()
+        except OSError:
+            pass
+        return None
+
+    def _write_disk(self, kind, entity_id, fragment, version, html):
+        path = self._disk_path(kind, entity_id, fragment)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名, 其他 worker 不会读到写了一半的内容
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(version + '\n' + html)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"片段缓存写入失败: {str(e)}")
+
+    def get_or_render(self, kind, entity_id, fragment, version, render):
+        key = (kind, entity_id)
+        found, fragments = self.lru.get(key)
+        if found:
+            cached = fragments.get(fragment)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        html = None
+        if self.directory:
+            html = self._read_disk(kind, entity_id, fragment, version)
+            if html is not None:
+                with self._lock:
+                    self.disk_hits += 1
+        if html is None:
+            html = str(render())
+            with self._lock:
+                self.renders += 1
+            if self.directory:
+                self._write_disk(kind, entity_id, fragment, version, html)
+        with self._lock:
+            found, fragments = self.lru.get(key)
+            fragments = dict(fragments) if found else {}
+            fragments[fragment] = (version, html)
+            self.lru.set(key, fragments)
+        return html
+
+    def invalidate(self, kind, ids=()):
+        """清除实体 kind 中 ids 的所有片段; kind 为 None 时全部清除"""
+        if kind is None:
+            self.clear()
+            return
+        for entity_id in ids:
+            self.lru.pop((kind, entity_id))
+            if self.directory:
+                shutil.rmtree(self._entity_dir(kind, entity_id), ignore_errors=True)
+
+    def clear(self):
+        self.lru.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def stats(self):
+        stats = self.lru.stats()
+        with self._lock:
+            stats['renders'] = self.renders
+            stats['disk_hits'] = self.disk_hits
+        return stats
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache kind, id, version %}...{% endcache %}; environment.fragment_cache 为 None 时照常渲染"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        if len(args) != 3:
+            parser.fail('cache expects three arguments: kind, id, version', lineno)
+        # 模板名和行号区分同一实体的不同片段
+        args.append(nodes.Const(f'{parser.name}:{lineno}'))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [], body).set_lineno(lineno)
+
+    def _cache(self, kind, entity_id, version, fragment, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return Markup(cache.get_or_render(kind, entity_id, fragment, version_digest(version), caller))
+
+
+def init_app(app, db):
+    """给 app 的 Jinja 环境加上 {% cache %}; FRAGMENT_CACHE_SIZE 为 0 时只解析标签, 不缓存"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    size = app.config.get('FRAGMENT_CACHE_SIZE', 4096)
+    if not size:
+        return None
+    cache = FragmentCache(size, app.config.get('FRAGMENT_CACHE_DIR'))
+    app.jinja_env.fragment_cache = cache
+    db.add_change_listener(cache.invalidate)
+    app.extensions['mygo_fragcache'] = cache
+    return cache
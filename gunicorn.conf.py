@@ -0,0 +1,38 @@
+"""
+gunicorn 配置
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    gunicorn -c gunicorn.conf.py -w 4 -b 0.0.0.0:8000 wsgi:app     # 命令行参数优先
+
+worker 数默认取 WEB_CONCURRENCY, 未设置时为 CPU 数 * 2 + 1
+"""
+import multiprocessing
+import os
+
+bind = '127.0.0.1:8000'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# 在 master 中加载 app 一次, 迁移只执行一次, 编译好的模板由 worker 共享
+preload_app = True
+# SIGTERM 后等待正在处理的请求完成的秒数
+graceful_timeout = 30
+timeout = 30
+
+
+def when_ready(server):
+    import wsgi
+    wsgi.before_fork(wsgi.app)
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.after_fork(wsgi.app)
+
+
+def post_worker_init(worker):
+    import wsgi
+    wsgi.warmup(wsgi.app)
+
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.shutdown(wsgi.app)
@@ -0,0 +1,119 @@
+"""
+条件请求 (ETag / Last-Modified / 304) 与按 blueprint 配置的 Cache-Control
+
+    httpcache.init_app(app, db_manager)     # HTTP_CACHE_ENABLED / HTTP_CACHE_CONTROL / HTTP_CACHE_SALT
+
+ROUTES 中的 GET 路由在执行前先取所依赖各表的版本号 (table_versions, 由触发器维护),
+与路由、完整的查询字符串一起算出 ETag; 与 If-None-Match (或 If-Modified-Since) 相符时
+直接返回 304, 不执行查询也不渲染模板
+版本号来自读缓存的同步结果, 数据库没有新提交时只需一次 PRAGMA data_version
+"""
+import hashlib
+import json
+import threading
+
+from email.utils import formatdate
+
+from flask import Response, g, request
+
+# endpoint -> 页面内容所依赖的表 (计数列、trip_summaries 等派生数据随这些表的写入更新)
+# /user/<id>/feed 依赖后台展开的 feed_items, 不在此列
+ROUTES = {
+    'user.user_list': ('users',),
+    'user.user_availability': ('trips', 'trip_participants'),
+    'trip.trip_list': ('trips', 'trip_participants', 'trip_locations', 'users', 'locations'),
+    'footprint.footprint_list': ('footprints', 'users', 'locations', 'collections'),
+    'footprint.popular_footprints': ('footprints', 'users', 'locations'),
+    'footprint.footprint_detail': ('footprints', 'users', 'locations', 'comments', 'collections'),
+    'footprint.comment_replies': ('comments', 'users'),
+    'footprint.user_collections': ('collections', 'footprints', 'users', 'locations'),
+    'location.nearby_locations': ('locations', 'footprints', 'users'),
+}
+
+# 默认: 浏览器和反向代理可以保存, 但每次使用前都要带 ETag 重新验证
+DEFAULT_CACHE_CONTROL = {
+    'user': 'no-cache',
+    'trip': 'no-cache',
+    'footprint': 'no-cache',
+    'location': 'no-cache',
+}
+
+
+class HttpCache:
+    def __init__(self, db, routes=None, cache_control=None, salt=''):
+        self.db = db
+        self.routes = dict(ROUTES if routes is None else routes)
+        self.cache_control = dict(DEFAULT_CACHE_CONTROL if cache_control is None else cache_control)
+        # 模板或页面格式变化后更换 salt, 让客户端手里的旧 ETag 失效
+        self.salt = salt
+        self._lock = threading.Lock()
+        self.not_modified = 0
+        self.rendered = 0
+
+    def validators(self, tables):
+        """当前请求的 (ETag, Last-Modified 秒数)"""
+        versions, last_modified = self.db.table_state(tables)
+        payload = json.dumps([self.salt, request.endpoint, request.full_path, sorted(versions.items())],
+                             separators=(',', ':'))
+        return hashlib.sha1(payload.encode()).hexdigest()[:32], last_modified
+
+    @staticmethod
+    def _is_fresh(etag, last_modified):
+        # 有 If-None-Match 时只看 ETag; Last-Modified 只精确到秒, 仅作后备
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        since = request.if_modified_since
+        if since is not None and last_modified:
+            return last_modified <= since.timestamp()
+        return False
+
+    def _set_headers(self, response, etag, last_modified):
+        response.set_etag(etag)
+        if last_modified:
+            response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+
+    def before_request(self):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        tables = self.routes.get(request.endpoint)
+        if not tables:
+            return None
+        etag, last_modified = self.validators(tables)
+        g.http_cache_validators = (etag, last_modified)
+        if not self._is_fresh(etag, last_modified):
+            return None
+        with self._lock:
+            self.not_modified += 1
+        response = Response(status=304)
+        self._set_headers(response, etag, last_modified)
+        return response
+
+    def after_request(self, response):
+        if request.method not in ('GET', 'HEAD'):
+            return response
+        policy = self.cache_control.get(request.blueprint)
+        if policy and 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = policy
+        validators = g.pop('http_cache_validators', None)
+        if validators is not None and response.status_code == 200:
+            self._set_headers(response, *validators)
+            with self._lock:
+                self.rendered += 1
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'not_modified': self.not_modified, 'rendered': self.rendered}
+
+
+def init_app(app, db):
+    """按 app.config 登记条件请求处理; HTTP_CACHE_ENABLED 为 False 时不启用"""
+    if not app.config.get('HTTP_CACHE_ENABLED', True):
+        return None
+    cache = HttpCache(db,
+                      cache_control=app.config.get('HTTP_CACHE_CONTROL'),
+                      salt=app.config.get('HTTP_CACHE_SALT', ''))
+    app.before_request(cache.before_request)
+    app.after_request(cache.after_request)
+    app.extensions['mygo_httpcache'] = cache
+    return cache
@@ -0,0 +1,125 @@
+"""
+多 worker 吞吐量测试
+
+    python loadtest.py [--workers 1,2,4] [--clients 8] [--seconds 10] [--scale 0.01]
+
+用 datagen 生成的数据建一个模板数据库, 对每个 worker 数启动 gunicorn (gunicorn.conf.py, production 配置),
+用 clients 个客户端进程持续请求 ROUTES 中的每个路由 (keep-alive, 不带 If-None-Match), 报告每秒请求数
+客户端与服务器在同一台机器上, 结果受 CPU 核数限制
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import bootstrap
+
+ROUTES = ['/footprint/', '/trip/']
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, port, directory, template):
+    env = dict(os.environ,
+               MYGO_CONFIG='production',
+               MYGO_DATABASE_PATH=os.path.join(directory, 'database.db'),
+               MYGO_DB_TEMPLATE=template,
+               MYGO_SLOW_QUERY_LOG='null')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '-w', str(workers), '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise Exception(f"gunicorn exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise Exception(f"gunicorn did not start on port {port}")
+
+
+def client(port, path, seconds):
+    """一个客户端进程: 在 seconds 秒内顺序请求 path, 返回 (成功数, 失败数)"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    ok = failed = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.close()
+    return ok, failed
+
+
+def measure(port, path, clients, seconds):
+    with multiprocessing.Pool(clients) as pool:
+        # 先预热一轮, 各 worker 的连接和缓存就绪
+        pool.starmap(client, [(port, path, 0.5)] * clients)
+        started = time.perf_counter()
+        results = pool.starmap(client, [(port, path, seconds)] * clients)
+        elapsed = time.perf_counter() - started
+    ok = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    return ok / elapsed, failed
+
+
+def run(worker_counts, clients=8, seconds=10.0, scale=0.01):
+    """返回 {worker 数: {路由: (每秒请求数, 失败数)}}"""
+    directory = tempfile.mkdtemp(prefix='mygo_loadtest_')
+    try:
+        template = bootstrap.build_template(os.path.join(directory, 'template.db'), scale=scale, progress=None)
+        results = {}
+        for workers in worker_counts:
+            run_directory = os.path.join(directory, f'w{workers}')
+            os.makedirs(run_directory)
+            port = free_port()
+            server = start_server(workers, port, run_directory, template)
+            try:
+                results[workers] = {path: measure(port, path, clients, seconds) for path in ROUTES}
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+            for path, (rate, failed) in results[workers].items():
+                print(f"  {workers} worker(s)  {path:<14} {rate:8.1f} req/s   {failed} failed")
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MyGO multi-worker throughput test')
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client processes')
+    parser.add_argument('--seconds', type=float, default=10.0, help='measured seconds per route')
+    parser.add_argument('--scale', type=float, default=0.01, help='datagen scale of the test database')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.clients} client(s)")
+    run([int(w) for w in args.workers.split(',') if w.strip()], args.clients, args.seconds, args.scale)
@@ -0,0 +1,63 @@
+"""
+派生数据的维护任务
+
+    python maintenance.py reconcile [database.db] [--dry-run]
+    python maintenance.py rebuild-trip-summaries [database.db]
+
+reconcile: 按 COUNTERS 重新统计各计数列, 修正与实际行数不一致的行
+rebuild-trip-summaries: 全量重建 trip_summaries
+(触发器在正常写入时保持这些数据准确; 绕过触发器的导入或手工修改之后需要执行)
+"""
+import argparse
+
+from migrations import COUNTERS
+
+
+def counter_drift(conn, table, pk, column, source, fk):
+    """返回 [(主键, 当前值, 实际行数)]"""
+    return conn.execute(f'''
+        SELECT t.{pk}, t.{column}, IFNULL(c.n, 0)
+        FROM {table} t
+        LEFT JOIN (SELECT {fk} AS id, COUNT(*) AS n FROM {source} GROUP BY {fk}) c ON c.id = t.{pk}
+        WHERE t.{column} IS NOT IFNULL(c.n, 0)
+    ''').fetchall()
+
+
+def reconcile_counters(conn, fix=True):
+    """
+    检查所有计数列, fix 为 True 时修正
+    返回: {'表.列': 不一致的行数}
+    """
+    report = {}
+    for table, pk, column, source, fk in COUNTERS:
+        drift = counter_drift(conn, table, pk, column, source, fk)
+        report[f'{table}.{column}'] = len(drift)
+        if fix and drift:
+            conn.executemany(
+                f'UPDATE {table} SET {column} = ? WHERE {pk} = ?',
+                [(actual, key) for key, _, actual in drift]
+            )
+    return report
+
+
+if __name__ == '__main__':
+    from models import DatabaseManager, DB_NAME
+
+    parser = argparse.ArgumentParser(description='MyGO maintenance tasks')
+    sub = parser.add_subparsers(dest='command', required=True)
+    reconcile_parser = sub.add_parser('reconcile', help='repair drifted counter columns')
+    reconcile_parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    reconcile_parser.add_argument('--dry-run', action='store_true', help='only report drift')
+    summaries_parser = sub.add_parser('rebuild-trip-summaries', help='rebuild trip_summaries from scratch')
+    summaries_parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db_path)
+    if args.command == 'reconcile':
+        report = db.reconcile_counters(fix=not args.dry_run)
+        for counter, drifted in report.items():
+            action = 'found' if args.dry_run else 'fixed'
+            print(f"  {counter:<30} {drifted} row(s) {action}")
+    else:
+        print(f"rebuilt {db.rebuild_trip_summaries()} trip summaries")
+    db.close()
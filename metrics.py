@@ -0,0 +1,254 @@
+"""
+SQL 统计与 Prometheus 格式的 /metrics
+
+    metrics = init_app(app, db_manager)
+
+- 每条 SQL 的文本、耗时、行数由连接池的语句回调记录, 归到正在执行的 DatabaseManager 方法下
+- 每次方法调用记录方法名、执行的 SQL、返回行数和耗时 (最近的调用保存在 recent_calls 中)
+- 每个请求汇总查询次数和数据库时间, 按 endpoint 记入直方图, 并写入 X-DB-Stats 响应头
+"""
+import contextvars
+import functools
+import threading
+import time
+
+from collections import deque
+
+from flask import Response, request
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 当前正在执行的 DatabaseManager 方法 / 当前请求的统计
+current_call = contextvars.ContextVar('mygo_db_call', default=None)
+current_request = contextvars.ContextVar('mygo_request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class CallRecord:
+    __slots__ = ('method', 'statements', 'rows', 'seconds')
+
+    def __init__(self, method):
+        self.method = method
+        self.statements = []
+        self.rows = None
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'sql': [sql for sql, _ in self.statements],
+            'rows': self.rows,
+            'ms': round(self.seconds * 1000, 3),
+        }
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.started = time.perf_counter()
+
+
+def _row_count(result):
+    if isinstance(result, (list, tuple, set)):
+        return len(result)
+    if isinstance(result, dict):
+        return len(result['items']) if isinstance(result.get('items'), list) else 1
+    if result is None:
+        return 0
+    return 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self, recent=200):
+        self._lock = threading.Lock()
+        self.query_counts = {}
+        self.query_seconds = {}
+        self.query_rows = {}
+        self.call_seconds = {}
+        self.call_rows = {}
+        self.request_counts = {}
+        self.request_seconds = {}
+        self.request_queries = {}
+        self.request_db_seconds = {}
+        self.recent_calls = deque(maxlen=recent)
+        self.db = None
+
+    ###########################
+    ##       recording       ##
+    ###########################
+
+    def observe_statement(self, conn, sql, params, seconds, rows):
+        call = current_call.get()
+        method = call.method if call is not None else '-'
+        if call is not None:
+            call.statements.append((sql, seconds))
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        with self._lock:
+            self.query_counts[method] = self.query_counts.get(method, 0) + 1
+            self.query_seconds.setdefault(method, Histogram()).observe(seconds)
+            if rows is not None and rows > 0:
+                self.query_rows[method] = self.query_rows.get(method, 0) + rows
+
+    def _record_call(self, call):
+        with self._lock:
+            self.call_seconds.setdefault(call.method, Histogram()).observe(call.seconds)
+            if call.rows is not None:
+                self.call_rows[call.method] = self.call_rows.get(call.method, 0) + call.rows
+            self.recent_calls.append(call)
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            call = CallRecord(name)
+            token = current_call.set(call)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                call.rows = _row_count(result)
+                return result
+            finally:
+                call.seconds = time.perf_counter() - started
+                current_call.reset(token)
+                self._record_call(call)
+        wrapper.__instrumented__ = True
+        return wrapper
+
+    def instrument(self, db):
+        """替换 db 实例上的公开方法, 记录每次调用; 并登记语句回调"""
+        self.db = db
+        for name in dir(type(db)):
+            if name.startswith('_'):
+                continue
+            attr = getattr(db, name)
+            if callable(attr) and not getattr(attr, '__instrumented__', False):
+                setattr(db, name, self.wrap(name, attr))
+        db.pool.add_observer(self.observe_statement)
+        return db
+
+    def before_request(self):
+        request.environ['mygo.db_stats_token'] = current_request.set(RequestStats())
+
+    def after_request(self, response, debug_header=True):
+        stats = current_request.get()
+        if stats is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        seconds = time.perf_counter() - stats.started
+        with self._lock:
+            key = (endpoint, request.method, response.status_code)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+            self.request_seconds.setdefault(endpoint, Histogram()).observe(seconds)
+            self.request_queries.setdefault(endpoint, Histogram(COUNT_BUCKETS)).observe(stats.queries)
+            self.request_db_seconds.setdefault(endpoint, Histogram()).observe(stats.db_seconds)
+        if debug_header:
+            response.headers['X-DB-Stats'] = (
+                f'queries={stats.queries}; db_ms={stats.db_seconds * 1000:.3f}; '
+                f'total_ms={seconds * 1000:.3f}'
+            )
+        token = request.environ.pop('mygo.db_stats_token', None)
+        if token is not None:
+            current_request.reset(token)
+        return response
+
+    ###########################
+    ##       exposition      ##
+    ###########################
+
+    @staticmethod
+    def _histogram_lines(name, label, histograms):
+        lines = [f'# TYPE {name} histogram']
+        for value, hist in sorted(histograms.items()):
+            labels = f'{label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.total}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {hist.total}')
+        return lines
+
+    @staticmethod
+    def _gauge_lines(name, values, metric_type='gauge'):
+        lines = [f'# TYPE {name} {metric_type}']
+        for key, value in sorted(values.items()):
+            lines.append(f'{name}{{{key}}} {value}')
+        return lines
+
+    def render(self):
+        with self._lock:
+            lines = self._gauge_lines('mygo_db_queries_total', {
+                f'method="{_escape(m)}"': v for m, v in self.query_counts.items()
+            }, 'counter')
+            lines += self._gauge_lines('mygo_db_rows_total', {
+                f'method="{_escape(m)}"': v for m, v in self.query_rows.items()
+            }, 'counter')
+            lines += self._histogram_lines('mygo_db_query_duration_seconds', 'method', self.query_seconds)
+            lines += self._histogram_lines('mygo_db_call_duration_seconds', 'method', self.call_seconds)
+            lines += self._gauge_lines('mygo_http_requests_total', {
+                f'endpoint="{_escape(e)}",method="{m}",status="{s}"': v
+                for (e, m, s), v in self.request_counts.items()
+            }, 'counter')
+            lines += self._histogram_lines('mygo_http_request_duration_seconds', 'endpoint', self.request_seconds)
+            lines += self._histogram_lines('mygo_http_request_db_queries', 'endpoint', self.request_queries)
+            lines += self._histogram_lines('mygo_http_request_db_seconds', 'endpoint', self.request_db_seconds)
+
+        if self.db is not None:
+            for prefix, stats in (('mygo_db_pool', self.db.pool_stats()),
+                                  ('mygo_db_cache', self.db.cache_stats()),
+                                  ('mygo_db_writer', self.db.write_stats()),
+                                  ('mygo_db_replica', self.db.replica_stats())):
+                for key, value in sorted((stats or {}).items()):
+                    if value is None:
+                        continue
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def recent(self, limit=50):
+        with self._lock:
+            calls = list(self.recent_calls)[-limit:]
+        return [call.as_dict() for call in calls]
+
+
+def init_app(app, db, metrics=None):
+    """给 db 加上统计, 注册请求钩子和 /metrics"""
+    metrics = metrics or Metrics()
+    metrics.instrument(db)
+    debug_header = app.config.get('DB_DEBUG_HEADER', True)
+
+    app.before_request(metrics.before_request)
+    app.after_request(lambda response: metrics.after_request(response, debug_header))
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.extensions['mygo_metrics'] = metrics
+    return metrics
@@ -0,0 +1,705 @@
+"""
+数据库结构迁移
+
+每个迁移是 (版本号, 说明, 步骤列表), 步骤可以是 SQL 字符串或接收连接的函数
+当前版本记录在 PRAGMA user_version 中, 启动时只执行尚未执行过的迁移, 不会删除已有数据
+
+    python migrations.py status  [database.db]
+    python migrations.py migrate [database.db]
+    python migrations.py explain [database.db]
+"""
+import re
+import sys
+
+import feed
+
+# 由 table_versions 记录变更次数的表
+TRACKED_TABLES = [
+    'users', 'locations', 'trips', 'trip_participants', 'trip_locations',
+    'footprints', 'comments', 'collections',
+]
+
+# 由触发器维护的计数列: (表, 主键, 计数列, 被计数的表, 外键); 按引入的迁移分组
+FOOTPRINT_COUNTERS = [
+    ('footprints', 'footprint_id', 'comment_count', 'comments', 'footprint_id'),
+    ('footprints', 'footprint_id', 'collection_count', 'collections', 'footprint_id'),
+    ('users', 'user_id', 'footprint_count', 'footprints', 'user_id'),
+    ('locations', 'location_id', 'footprint_count', 'footprints', 'location_id'),
+]
+REPLY_COUNTERS = [
+    ('comments', 'comment_id', 'reply_count', 'comments', 'parent_comment_id'),
+]
+COUNTERS = FOOTPRINT_COUNTERS + REPLY_COUNTERS
+
+# 热度: 互动数取对数再加上发布时间, 新足迹只需更少的互动就能排在前面;
+# 分数只依赖行内的列, 不随当前时间变化, 因此可以建索引
+HOT_SCORE = 'log10(1 + comment_count + 2 * collection_count) + created_at / 45000.0'
+
+
+def counter_backfill_sql(table, pk, column, source, fk):
+    return f'''
+        UPDATE {table} SET {column} = (
+            SELECT COUNT(*) FROM {source} s WHERE s.{fk} = {table}.{pk}
+        )'''
+
+
+def _counter_triggers(table, pk, column, source, fk):
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_insert
+        AFTER INSERT ON {source}
+        FOR EACH ROW
+        BEGIN
+            UPDATE {table} SET {column} = {column} + 1 WHERE {pk} = NEW.{fk};
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_delete
+        AFTER DELETE ON {source}
+        FOR EACH ROW
+        BEGIN
+            UPDATE {table} SET {column} = {column} - 1 WHERE {pk} = OLD.{fk};
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_{column}_update
+        AFTER UPDATE OF {fk} ON {source}
+        FOR EACH ROW WHEN OLD.{fk} IS NOT NEW.{fk}
+        BEGIN
+            UPDATE {table} SET {column} = {column} - 1 WHERE {pk} = OLD.{fk};
+            UPDATE {table} SET {column} = {column} + 1 WHERE {pk} = NEW.{fk};
+        END''',
+    ]
+
+
+def trip_summary_refresh_sql(where):
+    """重新计算满足 where (以 t 表示 trips) 的行程的 trip_summaries 行"""
+    return f'''
+        INSERT OR REPLACE INTO trip_summaries
+            (trip_id, participant_names, participants, location_names, locations)
+        SELECT
+            t.trip_id,
+            (SELECT GROUP_CONCAT(username, ', ') FROM (
+                SELECT u.username FROM trip_participants tp JOIN users u ON tp.user_id = u.user_id
+                WHERE tp.trip_id = t.trip_id ORDER BY u.user_id)),
+            (SELECT json_group_array(json_object('user_id', user_id, 'username', username)) FROM (
+                SELECT u.user_id, u.username FROM trip_participants tp JOIN users u ON tp.user_id = u.user_id
+                WHERE tp.trip_id = t.trip_id ORDER BY u.user_id)),
+            (SELECT GROUP_CONCAT(name, ', ') FROM (
+                SELECT l.name FROM trip_locations tl JOIN locations l ON tl.location_id = l.location_id
+                WHERE tl.trip_id = t.trip_id ORDER BY l.location_id)),
+            (SELECT json_group_array(json_object('location_id', location_id, 'locationname', name)) FROM (
+                SELECT l.location_id, l.name FROM trip_locations tl JOIN locations l ON tl.location_id = l.location_id
+                WHERE tl.trip_id = t.trip_id ORDER BY l.location_id))
+        FROM trips t
+        WHERE {where}'''
+
+
+# 触发器: (名称, 事件, 需要刷新的行程)
+TRIP_SUMMARY_TRIGGERS = [
+    ('trips_summary_insert', 'AFTER INSERT ON trips', 't.trip_id = NEW.trip_id'),
+    ('trip_participants_summary_insert', 'AFTER INSERT ON trip_participants', 't.trip_id = NEW.trip_id'),
+    ('trip_participants_summary_delete', 'AFTER DELETE ON trip_participants', 't.trip_id = OLD.trip_id'),
+    ('trip_locations_summary_insert', 'AFTER INSERT ON trip_locations', 't.trip_id = NEW.trip_id'),
+    ('trip_locations_summary_delete', 'AFTER DELETE ON trip_locations', 't.trip_id = OLD.trip_id'),
+    ('users_summary_update', 'AFTER UPDATE OF username ON users',
+     't.trip_id IN (SELECT trip_id FROM trip_participants WHERE user_id = NEW.user_id)'),
+    ('users_summary_delete', 'AFTER DELETE ON users',
+     't.trip_id IN (SELECT trip_id FROM trip_participants WHERE user_id = OLD.user_id)'),
+    ('locations_summary_update', 'AFTER UPDATE OF name ON locations',
+     't.trip_id IN (SELECT trip_id FROM trip_locations WHERE location_id = NEW.location_id)'),
+    ('locations_summary_delete', 'AFTER DELETE ON locations',
+     't.trip_id IN (SELECT trip_id FROM trip_locations WHERE location_id = OLD.location_id)'),
+]
+
+
+def rebuild_trip_summaries(conn):
+    conn.execute('DELETE FROM trip_summaries')
+    conn.execute(trip_summary_refresh_sql('1=1'))
+
+
+# 地点坐标的 R*Tree: 每个地点是一个退化的矩形 (min = max)
+# R*Tree 以 32 位浮点保存坐标 (下界向下、上界向上取整), 查询得到的是精确结果的超集, 需要再用 locations 中的坐标过滤
+LOCATION_RTREE_ROW = 'location_id, latitude, latitude, longitude, longitude'
+
+
+def rebuild_location_index(conn):
+    conn.execute('DELETE FROM location_rtree')
+    conn.execute(f'''
+        INSERT INTO location_rtree (location_id, min_lat, max_lat, min_lon, max_lon)
+        SELECT {LOCATION_RTREE_ROW} FROM locations
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL''')
+
+
+# 行程日期区间的索引: 日期换算成 1970-01-01 起的天数, 存进整数 R*Tree (rtree_i32), 区间重叠查询只读相交的节点
+#   trip_rtree:        (trip_id, start_day, end_day)
+#   participant_rtree: (user_id << 32 | trip_id, user_id, user_id, start_day, end_day), 用户维度是退化的区间,
+#                      查某人某段时间的行程只读这个人附近的节点; trip_id 必须小于 2^32
+def day_number_sql(column):
+    return f"CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+
+def participant_key_sql(user_id, trip_id):
+    return f'(({user_id}) << 32) + ({trip_id})'
+
+
+def rebuild_trip_intervals(conn):
+    conn.execute('DELETE FROM trip_rtree')
+    conn.execute('DELETE FROM participant_rtree')
+    conn.execute(f'''
+        INSERT INTO trip_rtree (trip_id, start_day, end_day)
+        SELECT trip_id, {day_number_sql('start_day')}, {day_number_sql('end_day')} FROM trips''')
+    conn.execute(f'''
+        INSERT INTO participant_rtree (id, min_user, max_user, start_day, end_day)
+        SELECT {participant_key_sql('tp.user_id', 'tp.trip_id')}, tp.user_id, tp.user_id,
+               {day_number_sql('t.start_day')}, {day_number_sql('t.end_day')}
+        FROM trip_participants tp JOIN trips t ON t.trip_id = tp.trip_id''')
+
+
+def _check_math_functions(conn):
+    try:
+        conn.execute('SELECT log10(10)').fetchone()
+    except Exception:
+        raise Exception("SQLite was built without math functions (log10), required by footprints.hot_score")
+
+
+MIGRATIONS = [
+    (1, 'base schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS trips (
+            trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_day DATE NOT NULL,
+            end_day DATE NOT NULL CHECK(end_day > start_day)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS trip_participants (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            trip_id INTEGER NOT NULL REFERENCES trips(trip_id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id, trip_id)
+        )''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS clean_empty_trips
+        AFTER DELETE ON trip_participants
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM trips
+            WHERE trip_id = OLD.trip_id
+            AND (SELECT COUNT(*) FROM trip_participants WHERE trip_id = OLD.trip_id) = 0;
+        END''',
+        '''
+        CREATE TABLE IF NOT EXISTS locations (
+            location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            address TEXT,
+            type TEXT CHECK(type IN ('attraction','restaurant','transport'))
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS trip_locations (
+            location_id INTEGER NOT NULL REFERENCES locations(location_id) ON DELETE CASCADE,
+            trip_id INTEGER NOT NULL REFERENCES trips(trip_id) ON DELETE CASCADE,
+            PRIMARY KEY (location_id, trip_id)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS footprints (
+            footprint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT,
+            image_url TEXT,
+            created_at DATETIME NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(user_id),
+            location_id INTEGER NOT NULL REFERENCES locations(location_id)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS comments (
+            comment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content TEXT NOT NULL,
+            created_at DATETIME NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            footprint_id INTEGER NOT NULL REFERENCES footprints(footprint_id) ON DELETE CASCADE,
+            parent_comment_id INTEGER REFERENCES comments(comment_id) ON DELETE CASCADE
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS collections (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            footprint_id INTEGER NOT NULL REFERENCES footprints(footprint_id) ON DELETE CASCADE,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (user_id, footprint_id)
+        )''',
+    ]),
+    (2, 'secondary indexes', [
+        # 列表页按时间倒序; footprint_id 是 rowid, 自动附在索引末尾, 可直接做 (created_at, id) 排序
+        'CREATE INDEX IF NOT EXISTS idx_footprints_created_at ON footprints(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_footprints_user ON footprints(user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_footprints_location ON footprints(location_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_comments_footprint ON comments(footprint_id, created_at)',
+        # 外键级联删除用户/父评论时避免全表扫描
+        'CREATE INDEX IF NOT EXISTS idx_comments_user ON comments(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_comments_parent ON comments(parent_comment_id)',
+        'CREATE INDEX IF NOT EXISTS idx_collections_user ON collections(user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_collections_footprint ON collections(footprint_id)',
+        # 主键是 (user_id, trip_id) / (location_id, trip_id), 按 trip 反查需要覆盖索引
+        'CREATE INDEX IF NOT EXISTS idx_trip_participants_trip ON trip_participants(trip_id, user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_trip_locations_trip ON trip_locations(trip_id, location_id)',
+        'CREATE INDEX IF NOT EXISTS idx_trips_start_day ON trips(start_day)',
+    ]),
+    (3, 'footprint full-text index', [
+        # 自带内容的 FTS5 表 (rowid = footprint_id): 地点名称/地址来自另一张表,
+        # 无法直接用 external content, 而 snippet() 需要能读到原文
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS footprint_fts USING fts5(
+            title, content, location_name, location_address,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )''',
+        # 标题权重最高, 其次是地点名称
+        "INSERT INTO footprint_fts(footprint_fts, rank) VALUES ('rank', 'bm25(10.0, 3.0, 5.0, 1.0)')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS footprint_fts_insert
+        AFTER INSERT ON footprints
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO footprint_fts(rowid, title, content, location_name, location_address)
+            SELECT NEW.footprint_id, NEW.title, NEW.content, l.name, l.address
+            FROM locations l WHERE l.location_id = NEW.location_id;
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS footprint_fts_update
+        AFTER UPDATE OF title, content, location_id ON footprints
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM footprint_fts WHERE rowid = OLD.footprint_id;
+            INSERT INTO footprint_fts(rowid, title, content, location_name, location_address)
+            SELECT NEW.footprint_id, NEW.title, NEW.content, l.name, l.address
+            FROM locations l WHERE l.location_id = NEW.location_id;
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS footprint_fts_delete
+        AFTER DELETE ON footprints
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM footprint_fts WHERE rowid = OLD.footprint_id;
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS footprint_fts_location_update
+        AFTER UPDATE OF name, address ON locations
+        FOR EACH ROW
+        BEGIN
+            UPDATE footprint_fts SET location_name = NEW.name, location_address = NEW.address
+            WHERE rowid IN (SELECT footprint_id FROM footprints WHERE location_id = NEW.location_id);
+        END''',
+        # 已有数据回填
+        '''
+        INSERT INTO footprint_fts(rowid, title, content, location_name, location_address)
+        SELECT f.footprint_id, f.title, f.content, l.name, l.address
+        FROM footprints f JOIN locations l ON f.location_id = l.location_id
+        ''',
+    ]),
+    (4, 'table change counters', [
+        # 每张表一个版本号, 由触发器在每次写入时加一; 其他进程通过它判断缓存是否过期
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID''',
+    ] + [
+        f"INSERT OR IGNORE INTO table_versions (name, version) VALUES ('{table}', 0)"
+        for table in TRACKED_TABLES
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+        AFTER {event} ON {table}
+        FOR EACH ROW
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END'''
+        for table in TRACKED_TABLES
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (5, 'integer epoch timestamps', [
+        # created_at 由 'YYYY-MM-DD HH:MM:SS' (UTC) 改为 UTC 秒数, 范围查询可以直接走索引;
+        # 列声明为 DATETIME (NUMERIC 亲和), 整数原样保存, 无需重建表
+        f'''
+        UPDATE {table} SET created_at = CAST(strftime('%s', created_at) AS INTEGER)
+        WHERE typeof(created_at) = 'text'
+        '''
+        for table in ('footprints', 'comments', 'collections')
+    ]),
+    (6, 'denormalized counters and hot score', [
+        _check_math_functions,
+    ] + [
+        f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'
+        for table, _, column, _, _ in FOOTPRINT_COUNTERS
+    ] + [
+        counter_backfill_sql(*counter) for counter in FOOTPRINT_COUNTERS
+    ] + [
+        trigger for counter in FOOTPRINT_COUNTERS for trigger in _counter_triggers(*counter)
+    ] + [
+        # 虚拟生成列: 计数变化时索引随之更新, 热门列表只需按索引取前 N 条
+        f'ALTER TABLE footprints ADD COLUMN hot_score REAL GENERATED ALWAYS AS ({HOT_SCORE}) VIRTUAL',
+        'CREATE INDEX IF NOT EXISTS idx_footprints_hot ON footprints(hot_score)',
+    ]),
+    (7, 'materialized trip summaries', [
+        # 每个行程一行: 参与者/地点的名称 (列表页) 和 JSON (搜索页), 由触发器增量维护
+        '''
+        CREATE TABLE IF NOT EXISTS trip_summaries (
+            trip_id INTEGER PRIMARY KEY,
+            participant_names TEXT,
+            participants TEXT NOT NULL DEFAULT '[]',
+            location_names TEXT,
+            locations TEXT NOT NULL DEFAULT '[]'
+        )''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trips_summary_delete
+        AFTER DELETE ON trips
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM trip_summaries WHERE trip_id = OLD.trip_id;
+        END''',
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {name}
+        {event}
+        FOR EACH ROW
+        BEGIN
+            {trip_summary_refresh_sql(where)};
+        END'''
+        for name, event, where in TRIP_SUMMARY_TRIGGERS
+    ] + [
+        rebuild_trip_summaries,
+    ]),
+    (8, 'co-traveler feed', [
+        # 一起参加过至少一个行程的两人 (双向)
+        '''
+        CREATE VIEW IF NOT EXISTS co_travelers AS
+        SELECT DISTINCT a.user_id, b.user_id AS other_id
+        FROM trip_participants a
+        JOIN trip_participants b ON a.trip_id = b.trip_id AND a.user_id != b.user_id
+        ''',
+        # 主键即时间线的排序, 按 (created_at, footprint_id) 游标分页只读一段连续的 B 树
+        '''
+        CREATE TABLE IF NOT EXISTS feed_items (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            created_at INTEGER NOT NULL,
+            footprint_id INTEGER NOT NULL REFERENCES footprints(footprint_id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id, created_at, footprint_id)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_feed_items_footprint ON feed_items(footprint_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS feed_outbox (
+            footprint_id INTEGER PRIMARY KEY
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS feed_pull_authors (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE
+        )''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS footprints_feed_outbox
+        AFTER INSERT ON footprints
+        FOR EACH ROW
+        BEGIN
+            INSERT OR IGNORE INTO feed_outbox (footprint_id) VALUES (NEW.footprint_id);
+        END''',
+        feed.rebuild,
+    ]),
+    (9, 'comment threads', [
+        # 按 (footprint_id, parent_comment_id) 取某一层的回复, 顶层评论 parent_comment_id IS NULL
+        'CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments(footprint_id, parent_comment_id, created_at)',
+    ] + [
+        f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'
+        for table, _, column, _, _ in REPLY_COUNTERS
+    ] + [
+        counter_backfill_sql(*counter) for counter in REPLY_COUNTERS
+    ] + [
+        trigger for counter in REPLY_COUNTERS for trigger in _counter_triggers(*counter)
+    ]),
+    (10, 'table modification times', [
+        # 每张表最近一次写入的时间 (UTC 秒数), 用作 HTTP Last-Modified
+        'ALTER TABLE table_versions ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0',
+        "UPDATE table_versions SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)",
+    ] + [
+        f'DROP TRIGGER IF EXISTS {table}_version_{event.lower()}'
+        for table in TRACKED_TABLES
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+        AFTER {event} ON {table}
+        FOR EACH ROW
+        BEGIN
+            UPDATE table_versions
+            SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE name = '{table}';
+        END'''
+        for table in TRACKED_TABLES
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (11, 'location coordinates', [
+        # WGS84 经纬度 (度), 可以为空: 旧数据没有坐标, 不参与地理查询
+        'ALTER TABLE locations ADD COLUMN latitude REAL CHECK (latitude BETWEEN -90 AND 90)',
+        'ALTER TABLE locations ADD COLUMN longitude REAL CHECK (longitude BETWEEN -180 AND 180)',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree
+        USING rtree(location_id, min_lat, max_lat, min_lon, max_lon)''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS locations_rtree_insert
+        AFTER INSERT ON locations
+        FOR EACH ROW WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+        BEGIN
+            INSERT INTO location_rtree (location_id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (NEW.location_id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS locations_rtree_update
+        AFTER UPDATE OF latitude, longitude ON locations
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM location_rtree WHERE location_id = OLD.location_id;
+            INSERT INTO location_rtree (location_id, min_lat, max_lat, min_lon, max_lon)
+            SELECT NEW.location_id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS locations_rtree_delete
+        AFTER DELETE ON locations
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM location_rtree WHERE location_id = OLD.location_id;
+        END''',
+        rebuild_location_index,
+    ]),
+    (12, 'trip date intervals', [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS trip_rtree USING rtree_i32(trip_id, start_day, end_day)',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS participant_rtree
+        USING rtree_i32(id, min_user, max_user, start_day, end_day)''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trips_rtree_insert
+        AFTER INSERT ON trips
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO trip_rtree (trip_id, start_day, end_day)
+            VALUES (NEW.trip_id, {day_number_sql('NEW.start_day')}, {day_number_sql('NEW.end_day')});
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trips_rtree_update
+        AFTER UPDATE OF start_day, end_day ON trips
+        FOR EACH ROW
+        BEGIN
+            UPDATE trip_rtree
+            SET start_day = {day_number_sql('NEW.start_day')}, end_day = {day_number_sql('NEW.end_day')}
+            WHERE trip_id = NEW.trip_id;
+            UPDATE participant_rtree
+            SET start_day = {day_number_sql('NEW.start_day')}, end_day = {day_number_sql('NEW.end_day')}
+            WHERE id IN (
+                SELECT {participant_key_sql('user_id', 'trip_id')} FROM trip_participants
+                WHERE trip_id = NEW.trip_id);
+        END''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trips_rtree_delete
+        AFTER DELETE ON trips
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM trip_rtree WHERE trip_id = OLD.trip_id;
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trip_participants_rtree_insert
+        AFTER INSERT ON trip_participants
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO participant_rtree (id, min_user, max_user, start_day, end_day)
+            SELECT {participant_key_sql('NEW.user_id', 'NEW.trip_id')}, NEW.user_id, NEW.user_id,
+                   {day_number_sql('start_day')}, {day_number_sql('end_day')}
+            FROM trips WHERE trip_id = NEW.trip_id;
+        END''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trip_participants_rtree_delete
+        AFTER DELETE ON trip_participants
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM participant_rtree WHERE id = {participant_key_sql('OLD.user_id', 'OLD.trip_id')};
+        END''',
+        rebuild_trip_intervals,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    把数据库升级到 target (默认最新) 版本, 返回本次执行的迁移版本号列表
+    每个迁移单独一个事务, 与 user_version 的更新一起提交
+    """
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    if current_version(conn) >= target:
+        return applied
+
+    for version, description, steps in MIGRATIONS:
+        if version > target:
+            break
+        # 多个进程同时启动时, 以写锁下读到的版本为准
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"migrated to version {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+###########################
+##    index report       ##
+###########################
+
+def _sample_calls(conn):
+    def first(sql):
+        row = conn.execute(sql).fetchone()
+        return row[0] if row else 1
+
+    user_id = first('SELECT user_id FROM users ORDER BY user_id LIMIT 1')
+    footprint_id = first('SELECT footprint_id FROM footprints ORDER BY footprint_id LIMIT 1')
+    participants = [first('SELECT user_id FROM trip_participants LIMIT 1')]
+    point = conn.execute('''
+        SELECT latitude, longitude FROM locations WHERE latitude IS NOT NULL LIMIT 1
+    ''').fetchone() or (0.0, 0.0)
+    bbox = (point[0] - 0.1, point[1] - 0.1, point[0] + 0.1, point[1] + 0.1)
+    return [
+        ('get_all_users', (), {}),
+        ('get_all_trips', (), {}),
+        ('get_trips_by_filters', (participants,), {'start_after': '2000-01-01'}),
+        ('get_trips_overlapping', ('2023-06-01', '2023-06-07'), {'limit': 20}),
+        ('find_trip_conflicts', (participants, '2023-06-01', '2023-06-07'), {}),
+        ('get_user_availability', (participants[0], '2023-01-01', '2023-12-31'), {}),
+        ('get_all_footprints', (), {}),
+        ('get_footprints_by_filters', (), {'username': 'User', 'created_after': '2000-01-01'}),
+        ('get_footprint_detail', (footprint_id,), {}),
+        ('get_all_locations', (), {}),
+        ('get_locations_in_bbox', bbox, {}),
+        ('get_nearest_locations', tuple(point), {'k': 5}),
+        ('get_footprints_within', tuple(point) + (5.0,), {}),
+        ('get_footprints_by_filters', (), {'bbox': bbox}),
+        ('get_comments_by_footprint', (footprint_id,), {}),
+        ('get_comment_threads', (footprint_id,), {}),
+        ('get_collections_by_user', (user_id,), {}),
+        ('is_collected', (user_id, footprint_id), {}),
+    ]
+
+
+# 扩展模块 (rtree / fts5) 内部执行的语句: 表名带引号的 schema 前缀, 或读取 sqlite_stat1 等系统表
+_INTERNAL_STATEMENT = re.compile(r"\bFROM\s+'\w+'\.|\bsqlite_(?:stat\d|master|schema)\b", re.IGNORECASE)
+
+
+def internal_statement(sql):
+    return _INTERNAL_STATEMENT.search(sql) is not None
+
+
+def _derived_names(plan, sql):
+    """计划中的 CTE / 子查询名称 (MATERIALIZE / CO-ROUTINE), 以及 SQL 中它们的别名"""
+    names = {detail.split(' ', 1)[1] for detail in plan if detail.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+    for name in list(names):
+        for alias in re.findall(rf'\b(?:FROM|JOIN)\s+{re.escape(name)}\s+(?:AS\s+)?(\w+)', sql, re.IGNORECASE):
+            names.add(alias)
+    return names
+
+
+def full_scans(plan, sql=''):
+    """
+    EXPLAIN QUERY PLAN 中不使用索引的全表扫描
+    不包括: 子查询 / CTE 的结果 (SCAN (subquery-N)、SCAN roots 等), 有索引约束的虚拟表, 常量行
+    """
+    derived = _derived_names(plan, sql)
+    scans = []
+    for detail in plan:
+        if not detail.startswith('SCAN ') or ' INDEX ' in detail or 'CONSTANT ROW' in detail:
+            continue
+        target = detail[len('SCAN '):]
+        if target.startswith('(subquery-') or target.split(' ')[0] in derived:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def explain_queries(db):
+    """
+    调用 DatabaseManager 的读方法, 记录其执行的 SQL, 并给出每条 SQL 的 EXPLAIN QUERY PLAN
+    返回 [{'method', 'sql', 'plan': [detail, ...], 'indexes': [...], 'full_scans': [...]}]
+    """
+    report = []
+    with db.pool.connection() as conn:
+        for method, args, kwargs in _sample_calls(conn):
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                getattr(db, method)(*args, **kwargs)
+            finally:
+                conn.set_trace_callback(None)
+
+            for sql in statements:
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')) or internal_statement(sql):
+                    continue
+                plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+                report.append({
+                    'method': method,
+                    'sql': ' '.join(sql.split()),
+                    'plan': plan,
+                    'indexes': sorted({
+                        detail.split(' INDEX ')[1].split(' ')[0]
+                        for detail in plan if ' INDEX ' in detail
+                    }),
+                    'full_scans': full_scans(plan, sql),
+                })
+    return report
+
+
+def print_explain_report(report):
+    for entry in report:
+        print(f"== {entry['method']}")
+        print(f"   {entry['sql'][:160]}")
+        for detail in entry['plan']:
+            flag = '  <-- full scan' if detail in entry['full_scans'] else ''
+            print(f"     {detail}{flag}")
+        print(f"   indexes: {', '.join(entry['indexes']) or '-'}")
+
+
+if __name__ == '__main__':
+    from models import DatabaseManager, DB_NAME
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('status', 'migrate', 'explain'):
+        print(__doc__)
+        sys.exit(1)
+    command = sys.argv[1]
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_NAME
+
+    db = DatabaseManager(db_path, auto_migrate=False)
+    if command == 'status':
+        with db.pool.connection() as conn:
+            version = current_version(conn)
+        print(f"{db_path}: version {version}, latest {LATEST_VERSION}")
+        for v, description, _ in MIGRATIONS:
+            print(f"  [{'x' if v <= version else ' '}] {v} {description}")
+    elif command == 'migrate':
+        db.migrate()
+    else:
+        db.migrate()
+        print_explain_report(explain_queries(db))
+    db.close()
@@ -1,117 +1,530 @@
+import base64
+import calendar
+import functools
+import html
+import inspect
+import json
+import math
 import os
 import random
 import sqlite3
+import threading
 
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, timezone, date
 import time
 
+from contextlib import nullcontext
+
+import feed
+import maintenance
+import migrations
+import replica
+from cache import ReadCache
+from pool import ConnectionPool, WriteLane
+
 DB_NAME = 'database.db'
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(keys, direction='next'):
+    """把排序键编码成 URL 中使用的不透明游标"""
+    payload = json.dumps({'d': direction, 'k': list(keys)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['d'] not in ('next', 'prev') or not isinstance(payload['k'], list):
+            raise ValueError
+        return payload['k'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {token}")
+
+
+def clamp_page_size(page_size):
+    return max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+# created_at 以 UTC 秒数存储, 显示格式在 SQL 中生成
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def display_time(column):
+    return f"strftime('{TIME_FORMAT}', {column}, 'unixepoch')"
+
+
+def to_epoch(value):
+    """日期/时间 (datetime, date, ISO 字符串或秒数) 转成 UTC 秒数; 空值返回 None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid datetime: {value}")
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return calendar.timegm(value.timetuple())
+
+
+# 行程日期在区间索引 (migrations.py 中的版本 12) 中以 1970-01-01 起的天数表示
+EPOCH_DAY = date(1970, 1, 1).toordinal()
+
+
+def to_day(value):
+    """日期 (date, datetime 或 'YYYY-MM-DD' 字符串) 转成 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+
+
+def day_number(value):
+    return to_day(value).toordinal() - EPOCH_DAY
+
+
+def from_day_number(number):
+    return date.fromordinal(number + EPOCH_DAY)
+
+
+def day_range(start_day, end_day):
+    """闭区间 [start_day, end_day] 转成 (起始天数, 结束天数)"""
+    first, last = day_number(start_day), day_number(end_day)
+    if first > last:
+        raise ValueError(f"Invalid date range: {start_day} > {end_day}")
+    return first, last
+
+
+class TripConflict(ValueError):
+    """create_trip(check_conflicts=True) 时有参与者在这段时间已有行程; conflicts 同 find_trip_conflicts"""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"Scheduling conflict for participants: {', '.join(map(str, sorted(conflicts)))}")
+
+
+def fts_query(keyword):
+    """把用户输入转成 FTS5 查询: 每个词加引号做前缀匹配, 词之间为 AND"""
+    terms = [term.replace('"', '') for term in (keyword or '').split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+# snippet() 用控制字符标记命中位置, 转义之后再换成 <mark>, 避免用户内容里的 HTML 生效
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+
+def render_snippet(text):
+    if text is None:
+        return ''
+    return html.escape(text).replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+
+# 地理查询: 坐标为 WGS84 经纬度 (度), 距离按球面大圆距离 (haversine) 计算
+EARTH_RADIUS_KM = 6371.0088
+# 地球上两点之间的最大距离 (半个大圆)
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def check_point(latitude, longitude):
+    """把坐标转成 float 并检查范围, 返回 (latitude, longitude)"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+    return latitude, longitude
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _split_longitudes(min_lat, max_lat, min_lon, max_lon):
+    """经度范围超出 [-180, 180] (跨越 180° 经线) 时拆成两个矩形"""
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+def radius_boxes(latitude, longitude, radius_km):
+    """
+    圆心 (latitude, longitude)、半径 radius_km 的球面圆的外接经纬度矩形
+    返回 [(min_lat, max_lat, min_lon, max_lon), ...]; 圆包含极点时经度取全部范围
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    # 圆上经度差最大的点不在圆心所在的纬线上: Δλ = asin(sin(r/R) / cos φ)
+    delta = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+    return _split_longitudes(min_lat, max_lat, longitude - delta, longitude + delta)
+
+
+def bbox_boxes(min_lat, min_lon, max_lat, max_lon):
+    """视口 (西南角, 东北角) 转成矩形列表; min_lon > max_lon 表示视口跨越 180° 经线"""
+    min_lat, min_lon = check_point(min_lat, min_lon)
+    max_lat, max_lon = check_point(max_lat, max_lon)
+    if min_lat > max_lat:
+        raise ValueError(f"Invalid bounding box: latitude {min_lat} > {max_lat}")
+    if min_lon <= max_lon:
+        return [(min_lat, max_lat, min_lon, max_lon)]
+    return _split_longitudes(min_lat, max_lat, min_lon, max_lon + 360)
+
+
+def rtree_filter(boxes, column='l.location_id'):
+    """
+    地点在 boxes 内的 SQL 条件 (地点表的别名为 l): 每个矩形一个 location_rtree 范围查询,
+    R*Tree 的坐标有 32 位浮点误差, 再用 locations 中的坐标精确比较; 返回 (条件, 参数)
+    """
+    candidates = ' UNION ALL '.join(
+        'SELECT location_id FROM location_rtree'
+        ' WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?'
+        for _ in boxes)
+    exact = ' OR '.join('(l.latitude BETWEEN ? AND ? AND l.longitude BETWEEN ? AND ?)' for _ in boxes)
+    params = [value for box in boxes for value in box] * 2
+    return f'{column} IN ({candidates}) AND ({exact})', params
+
+
+def write_method(*tables, changes=None):
+    """
+    标记写操作, tables 为该操作可能修改的表 (包括级联)
+    concurrent 模式下写操作统一交给写线程串行执行; 完成后使这些表的读缓存失效
+    changes: (实体类型, 参数名), 完成后把该参数 (id 或 id 列表) 通知给 change listeners;
+             实体类型为 None 表示可能影响任意实体
+    """
+    def decorator(func):
+        signature = inspect.signature(func) if changes else None
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            self._ensure_schema()
+            try:
+                if self.writer is None:
+                    return func(self, *args, **kwargs)
+                return self.writer.submit(func, self, *args, **kwargs)
+            finally:
+                if self.cache is not None:
+                    self.cache.bump(*tables)
+                if self.replica is not None:
+                    self.replica.notify_write()
+                    # 读自己的写: 之后的读取要求副本在这次写入之后复制
+                    replica.read_after.set(time.time())
+                if changes and self.change_listeners:
+                    kind, param = changes
+                    ids = ()
+                    if param is not None:
+                        ids = signature.bind(self, *args, **kwargs).arguments.get(param)
+                        ids = list(ids) if isinstance(ids, (list, tuple, set)) else [ids]
+                    self._entities_changed(kind, ids)
+        return wrapper
+    return decorator
+
+
+def replica_read(exact=False):
+    """
+    启用只读副本时在副本上执行读操作 (见 replica.py), 副本不满足要求时读主库
+    exact: 结果会进入读缓存, 只在副本没有任何未同步修改时使用, 避免把旧数据缓存到新的代数下
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.replica is None or replica.replica_connection.get() is not None:
+                return func(self, *args, **kwargs)
+            self._ensure_schema()
+            with self.replica.connection(replica.read_after.get(), exact) as conn:
+                if conn is None:
+                    return func(self, *args, **kwargs)
+                token = replica.replica_connection.set(conn)
+                try:
+                    return func(self, *args, **kwargs)
+                finally:
+                    replica.replica_connection.reset(token)
+        return wrapper
+    return decorator
+
+
+def cached_read(*tables):
+    """缓存读操作的结果, tables 为结果所依赖的表"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.cache is None:
+                return func(self, *args, **kwargs)
+            self._ensure_schema()
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            return self.cache.get_or_load(key, tables, lambda: func(self, *args, **kwargs))
+        return wrapper
+    return decorator
+
 
 class DatabaseManager:
-    def __init__(self, db_path='database.db', initial=False):
+    def __init__(self, db_path='database.db', initial=False, pool_size=5, pragmas=None,
+                 concurrent=False, busy_timeout=5.0, auto_migrate=True, cache_size=1024,
+                 feed_mode='sync', feed_fanout_limit=feed.FANOUT_LIMIT,
+                 replica=False, replica_staleness=1.0):
         self.db_path = db_path
+        # 首次访问数据库时自动迁移, 已有数据库升级到最新结构
+        self.auto_migrate = auto_migrate
+        self._migrated = False
+        self._migrate_lock = threading.Lock()
+        pragmas = dict(pragmas or {})
+        if concurrent:
+            # WAL: 读写互不阻塞; synchronous=NORMAL 在 WAL 下仍然安全
+            pragmas.setdefault('journal_mode', 'WAL')
+            pragmas.setdefault('synchronous', 'NORMAL')
+        self.pool = ConnectionPool(db_path, size=pool_size, pragmas=pragmas,
+                                   busy_timeout=busy_timeout)
+        self.writer = WriteLane(self.pool, busy_timeout=busy_timeout) if concurrent else None
+        # 用户/地点等很少变化的数据的读缓存, cache_size=0 时关闭
+        self.cache = ReadCache(self.pool, maxsize=cache_size) if cache_size else None
+        # 新足迹展开到同行者时间线的方式: 'sync' / 'background' / None (见 feed.py)
+        if feed_mode not in ('sync', 'background', None):
+            raise ValueError(f"Invalid feed_mode: {feed_mode}")
+        self.feed_mode = feed_mode
+        self.feed_fanout_limit = feed_fanout_limit
+        self.feed_worker = feed.FeedWorker(self) if feed_mode == 'background' else None
+        # 写方法修改实体后的回调 listener(kind, ids), 如模板片段缓存 (fragcache.py)
+        self.change_listeners = []
+        # 内存只读副本, 读多写少时分担读请求 (见 replica.py)
+        self.replica = None
+        if replica:
+            self.enable_replica(replica_staleness)
         if initial:
             self._reset_database()
             self._init_db()
 
     def _get_connection(self):
-        return sqlite3.connect(self.db_path)       
+        self._ensure_schema()
+        conn = replica.replica_connection.get()
+        if conn is not None:
+            return nullcontext(conn)
+        return self.pool.connection()
+
+    def enable_replica(self, max_staleness=1.0, refresh_interval=None):
+        """开启内存只读副本, 副本最多落后 max_staleness 秒"""
+        if self.replica is None:
+            self.replica = replica.Replica(self.pool, max_staleness, refresh_interval)
+        return self.replica
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def write_stats(self):
+        return self.writer.stats() if self.writer else None
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
+
+    def replica_stats(self):
+        return self.replica.stats() if self.replica else None
+
+    def add_change_listener(self, listener):
+        if listener not in self.change_listeners:
+            self.change_listeners.append(listener)
+
+    def _entities_changed(self, kind, ids):
+        for listener in self.change_listeners:
+            listener(kind, ids)
+
+    def table_state(self, tables):
+        """
+        tables 的 ({表: 版本号}, 最近修改时间 (UTC 秒数)), 版本号由 table_versions 的触发器维护
+        有读缓存时复用其同步结果, 数据库没有新提交时不查询
+        """
+        self._ensure_schema()
+        if self.cache is not None:
+            versions, updated = self.cache.table_state(tables)
+        else:
+            with self._get_connection() as conn:
+                rows = conn.execute('''
+                    SELECT name, version, updated_at FROM table_versions
+                    WHERE name IN (SELECT value FROM json_each(?))
+                ''', (json.dumps(list(tables)),)).fetchall()
+            versions = {name: 0 for name in tables}
+            versions.update({name: version for name, version, _ in rows})
+            updated = max((updated_at for _, _, updated_at in rows), default=0)
+        if self.replica is not None:
+            # 页面可能来自较旧的副本, 副本替换后 ETag 随之改变
+            versions['(replica)'] = self.replica.snapshot_id()
+        return versions, updated
+
+    def after_fork(self):
+        """
+        在 fork 出的子进程 (如 gunicorn worker) 中、第一次访问数据库之前调用
+        父进程的连接不能在子进程中使用, 后台线程也不会随 fork 复制: 丢弃继承的连接 (不关闭),
+        重新启动写线程 / 副本复制 / 动态展开, 之后的连接都在子进程中打开
+        """
+        self._migrate_lock = threading.Lock()
+        self.pool.after_fork()
+        for part in (self.writer, self.cache, self.replica, self.feed_worker):
+            if part is not None:
+                part.after_fork()
+
+    def close(self):
+        if self.feed_worker:
+            self.feed_worker.stop()
+        if self.replica:
+            self.replica.stop()
+        if self.writer:
+            self.writer.stop()
+        if self.cache:
+            self.cache.close()
+        self.pool.close()
 
     def _init_db(self):
         print("initializing...")
-        with self._get_connection() as conn:
-            conn.execute("PRAGMA foreign_keys = 1")
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE users (
-                    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    email TEXT NOT NULL UNIQUE
-                )''')
-            
-            cursor.execute('''
-                CREATE TABLE trips (
-                    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    start_day DATE NOT NULL,
-                    end_day DATE NOT NULL CHECK(end_day > start_day)
-                )''')
-            
-            cursor.execute('''
-                CREATE TABLE trip_participants (
-                    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                    trip_id INTEGER NOT NULL REFERENCES trips(trip_id) ON DELETE CASCADE, 
-                    PRIMARY KEY (user_id, trip_id)
-                )''')
-            
-            cursor.execute('''
-                CREATE TRIGGER clean_empty_trips
-                AFTER DELETE ON trip_participants
-                FOR EACH ROW
-                BEGIN
-                    DELETE FROM trips
-                    WHERE trip_id = OLD.trip_id
-                    AND (SELECT COUNT(*) FROM trip_participants WHERE trip_id = OLD.trip_id) = 0;
-                END
-            ''')
+        self.migrate()
 
-            # 地点表
-            cursor.execute('''
-                CREATE TABLE locations (
-                    location_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    address TEXT,
-                    type TEXT CHECK(type IN ('attraction','restaurant','transport'))
-                )''')
-            
-            cursor.execute('''
-                CREATE TABLE trip_locations (
-                    location_id INTEGER NOT NULL REFERENCES locations(location_id) ON DELETE CASCADE,
-                    trip_id INTEGER NOT NULL REFERENCES trips(trip_id) ON DELETE CASCADE, 
-                    PRIMARY KEY (location_id, trip_id)
-                )''')
+    def migrate(self):
+        """执行尚未执行的结构迁移 (见 migrations.py), 不会清空已有数据"""
+        with self._migrate_lock:
+            with self.pool.connection() as conn:
+                applied = migrations.migrate(conn)
+            self._migrated = True
+            return applied
 
-            # 足迹表
-            cursor.execute('''
-                CREATE TABLE footprints (
-                    footprint_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    content TEXT,
-                    image_url TEXT,
-                    created_at DATETIME NOT NULL,
-                    user_id INTEGER NOT NULL REFERENCES users(user_id),
-                    location_id INTEGER NOT NULL REFERENCES locations(location_id)
-                )''')
+    @write_method('footprints', 'users', 'locations', 'comments', changes=(None, None))
+    def reconcile_counters(self, fix=True):
+        """检查 (fix=True 时修正) 触发器维护的计数列, 返回 {'表.列': 不一致的行数}"""
+        with self._get_connection() as conn:
+            return maintenance.reconcile_counters(conn, fix)
 
-            cursor.execute('''
-                CREATE TABLE comments (
-                    comment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    content TEXT NOT NULL,
-                    created_at DATETIME NOT NULL,
-                    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                    footprint_id INTEGER NOT NULL REFERENCES footprints(footprint_id) ON DELETE CASCADE,
-                    parent_comment_id INTEGER REFERENCES comments(comment_id) ON DELETE CASCADE
-                )''')
+    @write_method('trip_summaries', changes=(None, None))
+    def rebuild_trip_summaries(self):
+        """全量重建 trip_summaries, 返回行数"""
+        with self._get_connection() as conn:
+            migrations.rebuild_trip_summaries(conn)
+            return conn.execute('SELECT COUNT(*) FROM trip_summaries').fetchone()[0]
 
-            cursor.execute('''
-                CREATE TABLE collections (
-                    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-                    footprint_id INTEGER NOT NULL REFERENCES footprints(footprint_id) ON DELETE CASCADE,
-                    created_at DATETIME NOT NULL,
-                    PRIMARY KEY (user_id, footprint_id)
-                )''')
-            
-            conn.commit()
+    @write_method('users', 'locations')
+    def sync_rows(self, table, columns, rows, prune=False):
+        """
+        按主键 (columns[0]) 写入从其他数据库复制来的 users / locations 行 (分片模式, 见 sharding.py)
+        prune: 同时删除 rows 中没有的行; 返回写入的行数
+        """
+        if table not in ('users', 'locations'):
+            raise ValueError(f"Invalid table: {table}")
+        key = columns[0]
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if prune:
+                    cursor.execute(f'''
+                        DELETE FROM {table}
+                        WHERE {key} NOT IN (SELECT value FROM json_each(?))
+                    ''', (json.dumps([row[0] for row in rows]),))
+                cursor.executemany(f'''
+                    INSERT INTO {table} ({', '.join(columns)})
+                    VALUES ({', '.join(['?'] * len(columns))})
+                    ON CONFLICT({key}) DO UPDATE SET {updates}
+                ''', rows)
+                conn.commit()
+                return len(rows)
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+    def _ensure_schema(self):
+        if self.auto_migrate and not self._migrated:
+            self.migrate()
     
     def _reset_database(self):
         print("deleting...")
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        self.pool.close()
+        self._migrated = False
+        if self.cache:
+            self.cache.clear()
+        if self.replica:
+            self.replica.reset()
+        for path in (self.db_path, self.db_path + '-wal', self.db_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
     
+    def _keyset_page(self, select_sql, params, keys, descending, cursor, page_size, row_mapper):
+        """
+        游标(keyset)分页: 用 (k1, k2) < (?, ?) 在索引上定位, 与表的大小无关
+        参数:
+            select_sql: 不含 ORDER BY / LIMIT 的查询, 必须已有 WHERE 子句
+            keys: [(排序列表达式, row_mapper 结果中对应的字段名), ...]
+            descending: 默认方向是否为倒序
+            cursor: 上一页返回的 next_cursor / prev_cursor
+        返回: {'items': [...], 'next_cursor': ..., 'prev_cursor': ...}
+        """
+        page_size = clamp_page_size(page_size)
+        direction = 'next'
+        key_values = None
+        if cursor:
+            key_values, direction = decode_cursor(cursor)
+            if len(key_values) != len(keys):
+                raise ValueError(f"Invalid cursor: {cursor}")
+
+        # 向前翻页时把排序方向反过来取, 再倒回正常顺序
+        forward = direction == 'next'
+        desc = descending if forward else not descending
+        key_list = ', '.join(expr for expr, _ in keys)
+        query = select_sql
+        params = list(params)
+        if key_values is not None:
+            placeholders = ', '.join(['?'] * len(keys))
+            query += f" AND ({key_list}) {'<' if desc else '>'} ({placeholders})"
+            params.extend(key_values)
+        order = ' DESC' if desc else ''
+        query += ' ORDER BY ' + ', '.join(expr + order for expr, _ in keys)
+        query += ' LIMIT ?'
+        params.append(page_size + 1)
+
+        with self._get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return self._page_result(rows, [field for _, field in keys], key_values, forward,
+                                 page_size, row_mapper)
+
+    @staticmethod
+    def _page_result(rows, fields, key_values, forward, page_size, row_mapper):
+        """把多取一行的查询结果整理成 {'items', 'next_cursor', 'prev_cursor'}"""
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not forward:
+            rows.reverse()
+        items = [row_mapper(row) for row in rows]
+
+        def key_of(item):
+            return [item[field] for field in fields]
+
+        has_next = has_more if forward else key_values is not None
+        has_prev = key_values is not None if forward else has_more
+        return {
+            'items': items,
+            'next_cursor': encode_cursor(key_of(items[-1]), 'next') if items and has_next else None,
+            'prev_cursor': encode_cursor(key_of(items[0]), 'prev') if items and has_prev else None,
+        }
+
     ###########################
     ##         user          ##
     ###########################
 
+    @write_method('users')
     def create_user(self, username, email):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -125,14 +538,24 @@ class DatabaseManager:
             except sqlite3.IntegrityError:
                 return False
     
+    @write_method('users', 'trips', 'trip_participants', 'trip_locations', 'trip_summaries', 'footprints', 'locations',
+                  'comments', 'collections', changes=(None, None))
     def delete_user(self, user_id):
+        """
+        删除用户及其足迹; 足迹上的评论/收藏/时间线条目级联删除, 全文索引和计数由触发器维护
+        footprints.user_id 没有 ON DELETE 动作, 必须先删足迹, 否则外键检查失败
+        """
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            feed.remove_user(conn, user_id)
+            cursor.execute('DELETE FROM footprints WHERE user_id = ?', (user_id,))
             cursor.execute('DELETE FROM trip_participants WHERE user_id = ?', (user_id,))
             cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
             conn.commit()
             return cursor.rowcount > 0
     
+    @cached_read('users')
+    @replica_read(exact=True)
     def get_all_users(self):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -144,15 +567,34 @@ class DatabaseManager:
                 'username': row[1], 
                 'email': row[2], 
             } for row in cursor.fetchall()]
+
+    @replica_read()
+    def get_users_page(self, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        return self._keyset_page(
+            'SELECT user_id, username, email FROM users WHERE 1=1', [],
+            keys=[('user_id', 'user_id')], descending=False,
+            cursor=cursor, page_size=page_size,
+            row_mapper=lambda row: {'user_id': row[0], 'username': row[1], 'email': row[2]},
+        )
     
     ###########################
     ##         trip          ##
     ###########################
 
-    def create_trip(self, participants, start_day, end_day, location_ids):
+    @write_method('trips', 'trip_participants', 'trip_locations', 'trip_summaries')
+    def create_trip(self, participants, start_day, end_day, location_ids, check_conflicts=False):
+        """
+        check_conflicts: 为 True 时若有参与者在 [start_day, end_day] 内已有行程, 不创建行程并抛出 TripConflict
+        检查与插入在同一个写事务中, 不会有并发创建的行程漏检
+        """
         with self._get_connection() as conn:
             cursor = conn.cursor()
             try:
+                if check_conflicts:
+                    first, last = day_range(start_day, end_day)
+                    conflicts = self._trip_conflicts(conn, set(participants), first, last)
+                    if conflicts:
+                        raise TripConflict(conflicts)
                 cursor.execute(
                     '''INSERT INTO trips (start_day, end_day) VALUES (?, ?)''', 
                     (start_day, end_day)
@@ -188,162 +630,246 @@ class DatabaseManager:
                             INSERT INTO trip_locations VALUES (?, ?)
                         ''', [(lid, trip_id) for lid in valid_locations])
 
+                # 新的同行关系: 互相补入最近的足迹
+                feed.connect_users(conn, valid_users)
                 conn.commit()
                 return trip_id
             except sqlite3.Error as e:
                 conn.rollback()
                 raise Exception(f"Unable to create trip: {str(e)}")
     
+    @write_method('trips', 'trip_participants', 'trip_locations', 'trip_summaries', changes=('trip', 'trip_id'))
     def delete_trip(self, trip_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
+            participants = [row[0] for row in cursor.execute(
+                'SELECT user_id FROM trip_participants WHERE trip_id = ?', (trip_id,)
+            )]
             cursor.execute('DELETE FROM trips WHERE trip_id = ?', (trip_id,))
+            deleted = cursor.rowcount > 0
+            # 不再一起参加任何行程的人从彼此的时间线中移除
+            feed.disconnect_users(conn, participants)
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
     
+    # 参与者/地点名称来自触发器维护的 trip_summaries (migrations.py 中的版本 7), 每行一次主键查找
+    TRIP_SELECT = '''
+        SELECT 
+            t.trip_id, 
+            t.start_day, 
+            t.end_day,
+            s.participant_names,
+            s.location_names
+        FROM trips t
+        LEFT JOIN trip_summaries s ON s.trip_id = t.trip_id
+    '''
+
+    @staticmethod
+    def _trip_from_row(row):
+        return {
+            'trip_id': row[0],
+            'start_day': row[1],
+            'end_day': row[2],
+            'participants': row[3], 
+            'locations': row[4] if row[4] is not None else '', 
+        }
+
+    @replica_read()
     def get_all_trips(self):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 
-                    t.trip_id, 
-                    t.start_day, 
-                    t.end_day,
-                    (
-                        SELECT GROUP_CONCAT(u.username, ', ') 
-                        FROM trip_participants tp
-                        INNER JOIN users u ON tp.user_id = u.user_id
-                        WHERE tp.trip_id = t.trip_id
-                    ),
-                    (
-                        SELECT GROUP_CONCAT(l.name, ', ') 
-                        FROM trip_locations tl
-                        INNER JOIN locations l ON tl.location_id = l.location_id
-                        WHERE tl.trip_id = t.trip_id
-                    )
-                FROM trips t
-                ORDER BY t.start_day DESC
-            ''')
-            return [{
-                'trip_id': row[0],
-                'start_day': row[1],
-                'end_day': row[2],
-                'participants': row[3], 
-                'locations': row[4] if row[4] is not None else '', 
-            } for row in cursor.fetchall()]
+            cursor.execute(self.TRIP_SELECT + ' ORDER BY t.start_day DESC')
+            return [self._trip_from_row(row) for row in cursor.fetchall()]
+
+    @replica_read()
+    def get_trips_page(self, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        return self._keyset_page(
+            self.TRIP_SELECT + ' WHERE 1=1', [],
+            keys=[('t.start_day', 'start_day'), ('t.trip_id', 'trip_id')], descending=True,
+            cursor=cursor, page_size=page_size, row_mapper=self._trip_from_row,
+        )
     
-    def get_trips_by_filters(self, participants, 
+    TRIP_ORDERINGS = {'trip_id': 't.trip_id', 'start_day': 't.start_day', 'end_day': 't.end_day'}
+
+    @replica_read()
+    def get_trips_by_filters(self, participants=None, 
                              start_after=None, start_before=None, 
-                             end_after=None, end_before=None, arrived_locations=None):
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-        
-            participant_query = '''
-                SELECT t.trip_id
-                FROM trips t
-                JOIN trip_participants tp ON t.trip_id = tp.trip_id
-                WHERE tp.user_id IN ({})
-                GROUP BY t.trip_id
-                HAVING COUNT(DISTINCT tp.user_id) = ?
-            '''.format(','.join(['?']*len(participants)))
-        
-            cursor.execute(participant_query, participants + [len(participants)])
-            candidate_ids = [str(row[0]) for row in cursor.fetchall()]
-
-            if arrived_locations:
-                location_query = '''
-                    SELECT t.trip_id
-                    FROM trips t
-                    JOIN trip_locations tl ON t.trip_id = tl.trip_id
-                    WHERE tl.location_id IN ({})
-                    GROUP BY t.trip_id
+                             end_after=None, end_before=None, arrived_locations=None,
+                             order_by='trip_id', descending=False, limit=None, offset=0,
+                             overlapping=None):
+        """
+        按参与者 (必须全部参加)、到访地点 (必须全部到访) 和日期范围筛选行程, 一条 SQL 完成
+        参与者/地点列表以 JSON 数组传入, 通过 json_each 展开, 不受 SQL 变量个数限制
+        参数:
+            participants: user_id 列表, None 表示不按参与者筛选
+            arrived_locations: location_id 列表, 为空时不按地点筛选
+            overlapping: (start_day, end_day), 只返回与这段日期 (闭区间) 有交集的行程, 经 trip_rtree 查找
+            order_by: trip_id / start_day / end_day, 相同时按 trip_id
+            limit, offset: 分页, limit 为 None 时返回全部
+        """
+        if order_by not in self.TRIP_ORDERINGS:
+            raise ValueError(f"Invalid order_by: {order_by}")
+
+        conditions = []
+        params = []
+        # 关系除法: 候选行程中与所选参与者匹配的人数必须等于所选人数
+        if participants is not None:
+            conditions.append('''
+                t.trip_id IN (
+                    SELECT tp.trip_id
+                    FROM trip_participants tp
+                    WHERE tp.user_id IN (SELECT value FROM json_each(?))
+                    GROUP BY tp.trip_id
+                    HAVING COUNT(DISTINCT tp.user_id) = ?
+                )''')
+            params.extend([json.dumps(list(participants)), len(participants)])
+        if arrived_locations:
+            conditions.append('''
+                t.trip_id IN (
+                    SELECT tl.trip_id
+                    FROM trip_locations tl
+                    WHERE tl.location_id IN (SELECT value FROM json_each(?))
+                    GROUP BY tl.trip_id
                     HAVING COUNT(DISTINCT tl.location_id) = ?
-                '''.format(','.join(['?']*len(arrived_locations)))
-                cursor.execute(location_query, arrived_locations + [len(arrived_locations)])
-                candidate_ids_2 = [str(row[0]) for row in cursor.fetchall()]
-                candidate_ids = list(set(candidate_ids) & set(candidate_ids_2))
-
-            if not candidate_ids:
-                return []
-
-            time_query = '''
-                SELECT t.trip_id, t.start_day, t.end_day
-                FROM trips t
-                WHERE t.trip_id IN ({})
-            '''.format(','.join(['?']*len(candidate_ids)))
-        
-            time_conditions = []
-            time_params = []
-            if start_after:
-                time_conditions.append("t.start_day >= ?")
-                time_params.append(start_after)
-            if start_before:
-                time_conditions.append("t.start_day <= ?")
-                time_params.append(start_before)
-            if end_after:
-                time_conditions.append("t.end_day >= ?")
-                time_params.append(end_after)
-            if end_before:
-                time_conditions.append("t.end_day <= ?")
-                time_params.append(end_before)
-        
-            if time_conditions:
-                time_query += " AND " + " AND ".join(time_conditions)
-        
-            cursor.execute(time_query, candidate_ids + time_params)
-            trip_data = cursor.fetchall()
-
-            if not trip_data:
-                return []
-
-            trip_ids = [str(t[0]) for t in trip_data]
-            participant_query = f'''
-                SELECT tp.trip_id, u.user_id, u.username
-                FROM trip_participants tp
-                JOIN users u ON tp.user_id = u.user_id
-                WHERE tp.trip_id IN ({','.join(trip_ids)})
-            '''
-            cursor.execute(participant_query)
-            participant_map = {}
-            for row in cursor.fetchall():
-                trip_id = row[0]
-                if trip_id not in participant_map:
-                    participant_map[trip_id] = []
-                participant_map[trip_id].append({
-                    'user_id': row[1],
-                    'username': row[2]
-                })
-            
-            location_query = f'''
-                SELECT tl.trip_id, l.location_id, l.name
-                FROM trip_locations tl
-                JOIN locations l ON tl.location_id = l.location_id
-                WHERE tl.trip_id IN ({','.join(trip_ids)})
-            '''
-            cursor.execute(location_query)
-            location_map = {}
-            for row in cursor.fetchall():
-                trip_id = row[0]
-                if trip_id not in location_map:
-                    location_map[trip_id] = []
-                location_map[trip_id].append({
-                    'location_id': row[1],
-                    'locationname': row[2]
-                })
-            
-            return [{
-                'trip_id': t[0],
-                'start_day': datetime.strptime(t[1], "%Y-%m-%d").date(),
-                'end_day': datetime.strptime(t[2], "%Y-%m-%d").date(),
-                'participants': participant_map.get(t[0], []), 
-                'locations': location_map.get(t[0], []), 
-            } for t in trip_data]
-        
+                )''')
+            params.extend([json.dumps(list(arrived_locations)), len(arrived_locations)])
+        if start_after:
+            conditions.append("t.start_day >= ?")
+            params.append(start_after)
+        if start_before:
+            conditions.append("t.start_day <= ?")
+            params.append(start_before)
+        if end_after:
+            conditions.append("t.end_day >= ?")
+            params.append(end_after)
+        if end_before:
+            conditions.append("t.end_day <= ?")
+            params.append(end_before)
+        if overlapping:
+            first, last = day_range(*overlapping)
+            conditions.append('t.trip_id IN (SELECT trip_id FROM trip_rtree WHERE start_day <= ? AND end_day >= ?)')
+            params.extend([last, first])
+
+        direction = ' DESC' if descending else ''
+        order = self.TRIP_ORDERINGS[order_by] + direction
+        if order_by != 'trip_id':
+            order += ', t.trip_id' + direction
+        query = f'''
+            SELECT 
+                t.trip_id,
+                t.start_day,
+                t.end_day,
+                IFNULL(s.participants, '[]'),
+                IFNULL(s.locations, '[]')
+            FROM trips t
+            LEFT JOIN trip_summaries s ON s.trip_id = t.trip_id
+            WHERE {' AND '.join(conditions) if conditions else '1=1'}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        '''
+        params.extend([-1 if limit is None else limit, offset or 0])
+
+        with self._get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [{
+            'trip_id': row[0],
+            'start_day': datetime.strptime(row[1], "%Y-%m-%d").date(),
+            'end_day': datetime.strptime(row[2], "%Y-%m-%d").date(),
+            'participants': json.loads(row[3]), 
+            'locations': json.loads(row[4]), 
+        } for row in rows]
+
+    @replica_read()
+    def get_trips_overlapping(self, start_day, end_day, limit=None, offset=0):
+        """与 [start_day, end_day] 有交集的行程, 按开始日期排序; 格式同 get_trips_by_filters"""
+        return self.get_trips_by_filters(overlapping=(start_day, end_day), order_by='start_day',
+                                         limit=limit, offset=offset)
+
+    @staticmethod
+    def _participant_trips(conn, user_ids, first, last, exclude_trip_id=None):
+        """
+        user_ids 中每个人在天数 [first, last] 内的行程, 经 participant_rtree 查找
+        CROSS JOIN 固定 json_each 为外层循环, R*Tree 才能同时按用户和日期两个维度定位
+        返回 [(user_id, trip_id, start_day, end_day), ...], 按用户和开始日期排序
+        """
+        return conn.execute('''
+            SELECT u.value, t.trip_id, t.start_day, t.end_day
+            FROM json_each(?) u
+            CROSS JOIN participant_rtree p
+                ON p.min_user <= u.value AND p.max_user >= u.value
+                AND p.start_day <= ? AND p.end_day >= ?
+            JOIN trips t ON t.trip_id = p.id & 4294967295
+            WHERE t.trip_id IS NOT ?
+            ORDER BY u.value, t.start_day, t.trip_id
+        ''', (json.dumps(sorted(user_ids)), last, first, exclude_trip_id)).fetchall()
+
+    @classmethod
+    def _trip_conflicts(cls, conn, user_ids, first, last, exclude_trip_id=None):
+        conflicts = {}
+        for user_id, trip_id, start_day, end_day in cls._participant_trips(
+                conn, user_ids, first, last, exclude_trip_id):
+            conflicts.setdefault(user_id, []).append({
+                'trip_id': trip_id,
+                'start_day': to_day(start_day),
+                'end_day': to_day(end_day),
+            })
+        return conflicts
+
+    @replica_read()
+    def find_trip_conflicts(self, participants, start_day, end_day, exclude_trip_id=None):
+        """
+        参与者中在 [start_day, end_day] (闭区间, 首尾同一天也算冲突) 内已有行程的人
+        exclude_trip_id: 修改已有行程时排除它自己
+        返回: {user_id: [{'trip_id', 'start_day', 'end_day'}, ...]}, 没有冲突的人不在其中
+        """
+        first, last = day_range(start_day, end_day)
+        with self._get_connection() as conn:
+            return self._trip_conflicts(conn, set(participants), first, last, exclude_trip_id)
+
+    @replica_read()
+    def get_user_availability(self, user_id, start_day, end_day):
+        """
+        user_id 在 [start_day, end_day] 内的日程
+        返回: {'user_id', 'start_day', 'end_day',
+               'busy': [{'start_day', 'end_day', 'trip_ids'}, ...],   重叠或相连的行程合并, 截到查询范围内
+               'free': [{'start_day', 'end_day'}, ...]}               busy 之间的空闲日期
+        """
+        first, last = day_range(start_day, end_day)
+        with self._get_connection() as conn:
+            rows = self._participant_trips(conn, [user_id], first, last)
+        busy = []
+        for _, trip_id, trip_start, trip_end in rows:
+            start = max(day_number(trip_start), first)
+            end = min(day_number(trip_end), last)
+            if busy and start <= busy[-1]['end_day'] + 1:
+                busy[-1]['end_day'] = max(busy[-1]['end_day'], end)
+                busy[-1]['trip_ids'].append(trip_id)
+            else:
+                busy.append({'start_day': start, 'end_day': end, 'trip_ids': [trip_id]})
+        free = []
+        cursor = first
+        for interval in busy:
+            if interval['start_day'] > cursor:
+                free.append({'start_day': cursor, 'end_day': interval['start_day'] - 1})
+            cursor = interval['end_day'] + 1
+        if cursor <= last:
+            free.append({'start_day': cursor, 'end_day': last})
+        for interval in busy + free:
+            interval['start_day'] = from_day_number(interval['start_day'])
+            interval['end_day'] = from_day_number(interval['end_day'])
+        return {
+            'user_id': user_id,
+            'start_day': from_day_number(first),
+            'end_day': from_day_number(last),
+            'busy': busy,
+            'free': free,
+        }
 
     ###########################
     ##       footprint       ##
     ###########################
 
+    @write_method('footprints', 'users', 'locations')
     def create_footprint(self, user_id, title, content, location_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -351,135 +877,292 @@ class DatabaseManager:
                 cursor.execute('''
                     INSERT INTO footprints 
                     (title, content, image_url, created_at, user_id, location_id)
-                    VALUES (?, ?, ?, datetime('now'), ?, ?)
-                ''', (title, content, f'img_{int(time.time())}.jpg', user_id, location_id))
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (title, content, f'img_{int(time.time())}.jpg', int(time.time()), user_id, location_id))
+                footprint_id = cursor.lastrowid
+                # 触发器已把新足迹写入 feed_outbox
+                if self.feed_mode == 'sync':
+                    feed.drain(conn, self.feed_fanout_limit)
                 conn.commit()
-                return cursor.lastrowid
+                if self.feed_worker:
+                    self.feed_worker.notify()
+                return footprint_id
             except sqlite3.Error as e:
                 print(f"创建足迹失败: {str(e)}")
                 return None
 
-    def get_all_footprints(self):
+    FOOTPRINT_COLUMNS = '''
+            f.footprint_id, 
+            f.title, 
+            f.content, 
+            f.image_url, 
+            f.created_at,
+            f.user_id,
+            l.location_id,
+            l.name as location_name,
+            l.type as location_type,
+            u.username,
+            {display},
+            f.comment_count,
+            f.collection_count,
+            f.hot_score
+    '''.format(display=display_time('f.created_at'))
+
+    FOOTPRINT_SELECT = '''
+        SELECT {columns}
+        FROM footprints f
+        JOIN users u ON f.user_id = u.user_id
+        JOIN locations l ON f.location_id = l.location_id
+    '''.format(columns=FOOTPRINT_COLUMNS)
+
+    @staticmethod
+    def _footprint_from_row(row):
+        return {
+            'footprint_id': row[0],
+            'title': row[1],
+            'content': row[2],
+            'image_url': row[3],
+            'created_at': row[10],
+            'created_at_raw': row[4],
+            'user_id': row[5],
+            'location_id': row[6],
+            'location_name': row[7],
+            'location_type': row[8],
+            'username': row[9],
+            'comment_count': row[11],
+            'collection_count': row[12],
+            'hot_score': row[13],
+        }
+
+    @replica_read()
+    def get_all_footprints(self, viewer_id=None):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 
-                    f.footprint_id, 
-                    f.title, 
-                    f.content, 
-                    f.image_url, 
-                    f.created_at,
-                    f.user_id,
-                    l.location_id,
-                    l.name as location_name,
-                    l.type as location_type,
-                    u.username
+            cursor.execute(self.FOOTPRINT_SELECT + ' ORDER BY f.created_at DESC')
+            footprints = [self._footprint_from_row(row) for row in cursor.fetchall()]
+        return self._annotate_collected(footprints, viewer_id)
+
+    @replica_read()
+    def get_popular_footprints(self, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """按热度 (migrations.HOT_SCORE) 倒序的游标分页, 直接沿 idx_footprints_hot 读取"""
+        return self._keyset_page(
+            self.FOOTPRINT_SELECT + ' WHERE 1=1', [],
+            keys=[('f.hot_score', 'hot_score'), ('f.footprint_id', 'footprint_id')],
+            descending=True, cursor=cursor, page_size=page_size,
+            row_mapper=self._footprint_from_row,
+        )
+
+    @replica_read()
+    def get_feed_page(self, user_id, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        """
+        user_id 的同行者发布的足迹, 按时间倒序的游标分页
+        feed_items 中预先展开的条目与 feed_pull_authors 中同行者的足迹合并 (UNION 去重)
+        """
+        page_size = clamp_page_size(page_size)
+        direction = 'next'
+        key_values = None
+        if cursor:
+            key_values, direction = decode_cursor(cursor)
+            if len(key_values) != 2:
+                raise ValueError(f"Invalid cursor: {cursor}")
+        forward = direction == 'next'
+        op, order = ('<', 'DESC') if forward else ('>', 'ASC')
+        after_fi = after_f = ''
+        params = [user_id]
+        if key_values is not None:
+            after_fi = f' AND (fi.created_at, fi.footprint_id) {op} (?, ?)'
+            after_f = f' AND (f.created_at, f.footprint_id) {op} (?, ?)'
+            params += key_values
+        params.append(user_id)
+        if key_values is not None:
+            params += key_values
+        params.append(page_size + 1)
+
+        query = f'''
+            WITH page AS (
+                SELECT fi.created_at, fi.footprint_id
+                FROM feed_items fi
+                WHERE fi.user_id = ?{after_fi}
+                UNION
+                SELECT f.created_at, f.footprint_id
                 FROM footprints f
-                JOIN users u ON f.user_id = u.user_id
-                JOIN locations l ON f.location_id = l.location_id
-                ORDER BY f.created_at DESC
-            ''')
-            footprints = []
-            for row in cursor.fetchall():
-                # 格式化时间
-                created_at = datetime.strptime(row[4], '%Y-%m-%d %H:%M:%S') if isinstance(row[4], str) else row[4]
-                formatted_time = created_at.strftime('%Y-%m-%d %H:%M')
-                
-                footprints.append({
-                    'footprint_id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'image_url': row[3],
-                    'created_at': formatted_time,
-                    'user_id': row[5],
-                    'location_id': row[6],
-                    'location_name': row[7],
-                    'location_type': row[8],
-                    'username': row[9]
-                })
-            return footprints
+                WHERE f.user_id IN (
+                    SELECT p.user_id FROM feed_pull_authors p
+                    JOIN co_travelers c ON c.other_id = p.user_id
+                    WHERE c.user_id = ?
+                ){after_f}
+                ORDER BY 1 {order}, 2 {order}
+                LIMIT ?
+            )
+            SELECT {self.FOOTPRINT_COLUMNS}
+            FROM page
+            JOIN footprints f ON f.footprint_id = page.footprint_id
+            JOIN users u ON f.user_id = u.user_id
+            JOIN locations l ON f.location_id = l.location_id
+            ORDER BY page.created_at {order}, page.footprint_id {order}
+        '''
+        with self._get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return self._page_result(rows, ['created_at_raw', 'footprint_id'], key_values, forward,
+                                 page_size, self._footprint_from_row)
+
+    def feed_outbox_pending(self):
+        """是否有待展开的新足迹; 读主库, 不经过写方法"""
+        with self._get_connection() as conn:
+            return feed.pending(conn)
+
+    @write_method()
+    def process_feed_outbox(self, batch_size=feed.BATCH_SIZE):
+        """展开一批待处理的新足迹, 返回处理的条数"""
+        with self._get_connection() as conn:
+            return feed.drain(conn, self.feed_fanout_limit, batch_size)
+
+    @write_method()
+    def rebuild_feed(self):
+        """全量重建所有时间线, 返回条目数"""
+        with self._get_connection() as conn:
+            feed.rebuild(conn, self.feed_fanout_limit)
+            return conn.execute('SELECT COUNT(*) FROM feed_items').fetchone()[0]
+
+    @replica_read()
+    def get_footprints_page(self, cursor=None, page_size=DEFAULT_PAGE_SIZE, viewer_id=None):
+        page = self._keyset_page(
+            self.FOOTPRINT_SELECT + ' WHERE 1=1', [],
+            keys=[('f.created_at', 'created_at_raw'), ('f.footprint_id', 'footprint_id')],
+            descending=True, cursor=cursor, page_size=page_size,
+            row_mapper=self._footprint_from_row,
+        )
+        self._annotate_collected(page['items'], viewer_id)
+        return page
+
+    def _annotate_collected(self, footprints, viewer_id):
+        """viewer_id 不为空时, 用一次查询给每条足迹加上 'collected'"""
+        if viewer_id is not None:
+            collected = self.is_collected_many(viewer_id, [fp['footprint_id'] for fp in footprints])
+            for fp in footprints:
+                fp['collected'] = fp['footprint_id'] in collected
+        return footprints
+        
+    @staticmethod
+    def _footprint_filters(username=None, location_name=None, location_types=None,
+                           created_after=None, created_before=None, bbox=None):
+        query = ''
+        params = []
         
+        # 用户名筛选
+        if username:
+            query += " AND u.username LIKE ?"
+            params.append(f"%{username}%")
+        
+        # 地点名称筛选
+        if location_name:
+            query += " AND l.name LIKE ?"
+            params.append(f"%{location_name}%")
+        
+        # 地点类型筛选
+        if location_types:
+            placeholders = ','.join(['?']*len(location_types))
+            query += f" AND l.type IN ({placeholders})"
+            params.extend(location_types)
+        
+        # 时间范围筛选: 参数先转成秒数, 直接对 created_at 做索引范围查询
+        created_after = to_epoch(created_after)
+        created_before = to_epoch(created_before)
+        if created_after is not None:
+            query += " AND f.created_at >= ?"
+            params.append(created_after)
+        if created_before is not None:
+            query += " AND f.created_at <= ?"
+            params.append(created_before)
+
+        # 视口筛选: bbox = (min_lat, min_lon, max_lat, max_lon), 经 location_rtree 找到视口内的地点
+        if bbox:
+            clause, bbox_params = rtree_filter(bbox_boxes(*bbox), column='f.location_id')
+            query += f" AND {clause}"
+            params.extend(bbox_params)
+        return query, params
+
+    @replica_read()
     def get_footprints_by_filters(self, username=None, location_name=None, 
                             location_types=None, created_after=None, 
-                            created_before=None):
+                            created_before=None, viewer_id=None, bbox=None):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            query = '''
-                SELECT 
-                    f.footprint_id, 
-                    f.title, 
-                    f.content, 
-                    f.image_url, 
-                    f.created_at,
-                    f.user_id,
-                    l.location_id,
-                    l.name as location_name,
-                    l.type as location_type,
-                    u.username
-                FROM footprints f
-                JOIN users u ON f.user_id = u.user_id
-                JOIN locations l ON f.location_id = l.location_id
-                WHERE 1=1
-            '''
-            params = []
-            
-            # 用户名筛选
-            if username:
-                query += " AND u.username LIKE ?"
-                params.append(f"%{username}%")
-            
-            # 地点名称筛选
-            if location_name:
-                query += " AND l.name LIKE ?"
-                params.append(f"%{location_name}%")
-            
-            # 地点类型筛选
-            if location_types:
-                placeholders = ','.join(['?']*len(location_types))
-                query += f" AND l.type IN ({placeholders})"
-                params.extend(location_types)
-            
-            # 时间范围筛选
-            if created_after:
-                query += " AND datetime(f.created_at) >= datetime(?)"
-                params.append(created_after)
-            if created_before:
-                query += " AND datetime(f.created_at) <= datetime(?)"
-                params.append(created_before)
+            query = self.FOOTPRINT_SELECT + ' WHERE 1=1'
+            clause, params = self._footprint_filters(
+                username, location_name, location_types, created_after, created_before, bbox
+            )
+            query += clause
             
             query += " ORDER BY f.created_at DESC"
             
             cursor.execute(query, params)
             
-            footprints = []
-            for row in cursor.fetchall():
-                created_at = datetime.strptime(row[4], '%Y-%m-%d %H:%M:%S') if isinstance(row[4], str) else row[4]
-                footprints.append({
-                    'footprint_id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'image_url': row[3],
-                    'created_at': created_at.strftime('%Y-%m-%d %H:%M'),
-                    'user_id': row[5],
-                    'location_id': row[6],
-                    'location_name': row[7],
-                    'location_type': row[8],
-                    'username': row[9]
-                })
-            return footprints
+            footprints = [self._footprint_from_row(row) for row in cursor.fetchall()]
+        return self._annotate_collected(footprints, viewer_id)
         
     
+    @replica_read()
+    def search_footprints(self, keyword, page=1, page_size=DEFAULT_PAGE_SIZE, **filters):
+        """
+        全文检索足迹标题、内容、地点名称和地址, 按 bm25 排序
+        参数:
+            keyword: 用户输入的关键词, 空格分隔, 每个词按前缀匹配
+            page: 从 1 开始的页码
+            filters: 与 get_footprints_by_filters 相同的附加筛选条件
+        返回: {'items': [...], 'page', 'next_page', 'prev_page'}, 每项带有高亮的 'snippet'
+        """
+        page = max(1, int(page or 1))
+        page_size = clamp_page_size(page_size)
+        match = fts_query(keyword)
+        if match is None:
+            return {'items': [], 'page': page, 'next_page': None, 'prev_page': None}
+
+        clause, params = self._footprint_filters(**filters)
+        query = f'''
+            SELECT {self.FOOTPRINT_COLUMNS},
+                snippet(footprint_fts, -1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 16),
+                footprint_fts.rank
+            FROM footprint_fts
+            JOIN footprints f ON f.footprint_id = footprint_fts.rowid
+            JOIN users u ON f.user_id = u.user_id
+            JOIN locations l ON f.location_id = l.location_id
+            WHERE footprint_fts MATCH ?{clause}
+            ORDER BY footprint_fts.rank
+            LIMIT ? OFFSET ?
+        '''
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                query, [match] + params + [page_size + 1, (page - 1) * page_size]
+            ).fetchall()
+
+        items = []
+        for row in rows[:page_size]:
+            footprint = self._footprint_from_row(row)
+            footprint['snippet'] = render_snippet(row[14])
+            footprint['rank'] = row[15]
+            items.append(footprint)
+        return {
+            'items': items,
+            'page': page,
+            'next_page': page + 1 if len(rows) > page_size else None,
+            'prev_page': page - 1 if page > 1 else None,
+        }
+
+    @cached_read('footprints', 'locations', 'users')
+    @replica_read(exact=True)
     def get_footprint_detail(self, footprint_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT f.*, l.name as location_name, u.username 
+                SELECT f.footprint_id, f.title, f.content, f.image_url, f.created_at, f.user_id, f.location_id,
+                       l.name as location_name, u.username, {display}, f.comment_count, f.collection_count
                 FROM footprints f
                 JOIN locations l ON f.location_id = l.location_id
                 JOIN users u ON f.user_id = u.user_id
                 WHERE f.footprint_id = ?
-            ''', (footprint_id,))
+            '''.format(display=display_time('f.created_at')), (footprint_id,))
             row = cursor.fetchone()
             if row:
                 return {
@@ -487,14 +1170,18 @@ class DatabaseManager:
                     'title': row[1],
                     'content': row[2],
                     'image_url': row[3],
-                    'created_at': row[4],
+                    'created_at': row[9],
+                    'created_at_raw': row[4],
                     'user_id': row[5],
                     'location_id': row[6],
                     'location_name': row[7],
-                    'username': row[8]
+                    'username': row[8],
+                    'comment_count': row[10],
+                    'collection_count': row[11],
                 }
             return None
 
+    @write_method('footprints', 'users', 'locations', changes=('footprint', 'footprint_id'))
     def update_footprint(self, footprint_id, title, content, location_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -516,13 +1203,15 @@ class DatabaseManager:
     ##       location        ##
     ###########################
     
-    def create_location(self, name, address, location_type):
+    @write_method('locations')
+    def create_location(self, name, address, location_type, latitude=None, longitude=None):
         """
         创建新地点并验证城市有效性
         参数:
             name: 地点名称 (必填)
             address: 地址信息
             location_type: 类型必须为 attraction/restaurant/transport
+            latitude, longitude: 坐标 (度), 同时提供或同时为空
         返回: 新创建地点的location_id
         """
         with self._get_connection() as conn:
@@ -532,13 +1221,17 @@ class DatabaseManager:
                 valid_types = {'attraction', 'restaurant', 'transport'}
                 if location_type not in valid_types:
                     raise ValueError(f"Invalid type: {location_type}. Must be one of {valid_types}")
+                if (latitude is None) != (longitude is None):
+                    raise ValueError("latitude and longitude must be given together")
+                if latitude is not None:
+                    latitude, longitude = check_point(latitude, longitude)
 
-                # 插入主记录
+                # 插入主记录, 触发器同时写入 location_rtree
                 cursor.execute('''
                     INSERT INTO locations 
-                    (name, address, type)
-                    VALUES (?, ?, ?)
-                ''', (name, address, location_type))
+                    (name, address, type, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (name, address, location_type, latitude, longitude))
                 
                 location_id = cursor.lastrowid
                 conn.commit()
@@ -559,6 +1252,8 @@ class DatabaseManager:
                 raise ve 
     
 
+    @cached_read('locations')
+    @replica_read(exact=True)
     def get_all_locations(self):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -571,48 +1266,323 @@ class DatabaseManager:
                 'name': row[1],
             } for row in cursor.fetchall()]
 
+    @write_method('locations')
+    def set_location_coordinates(self, location_id, latitude, longitude):
+        """设置 (都为空时清除) 地点坐标, 由触发器同步 location_rtree; 返回地点是否存在"""
+        if (latitude is None) != (longitude is None):
+            raise ValueError("latitude and longitude must be given together")
+        if latitude is not None:
+            latitude, longitude = check_point(latitude, longitude)
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                'UPDATE locations SET latitude = ?, longitude = ? WHERE location_id = ?',
+                (latitude, longitude, location_id))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    LOCATION_GEO_COLUMNS = 'l.location_id, l.name, l.address, l.type, l.latitude, l.longitude, l.footprint_count'
+    # k 近邻: 从 NEAREST_START_KM 的半径开始, 不足 k 个时半径扩大 NEAREST_GROWTH 倍
+    NEAREST_START_KM = 2.0
+    NEAREST_GROWTH = 4
+
+    @staticmethod
+    def _geo_location_from_row(row):
+        return {
+            'location_id': row[0],
+            'name': row[1],
+            'address': row[2],
+            'type': row[3],
+            'latitude': row[4],
+            'longitude': row[5],
+            'footprint_count': row[6],
+        }
+
+    @staticmethod
+    def _check_radius(radius_km):
+        try:
+            radius_km = float(radius_km)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid radius: {radius_km}")
+        if not radius_km > 0:
+            raise ValueError(f"Invalid radius: {radius_km}")
+        return min(radius_km, MAX_DISTANCE_KM)
+
+    @staticmethod
+    def _location_type_filter(location_types):
+        if not location_types:
+            return '', []
+        placeholders = ','.join(['?'] * len(location_types))
+        return f" AND l.type IN ({placeholders})", list(location_types)
+
+    @replica_read()
+    def get_locations_in_bbox(self, min_lat, min_lon, max_lat, max_lon, location_types=None, limit=None):
+        """
+        视口内有坐标的地点, 足迹多的在前
+        min_lon > max_lon 表示视口跨越 180° 经线; limit 为空时返回全部
+        """
+        clause, params = rtree_filter(bbox_boxes(min_lat, min_lon, max_lat, max_lon))
+        type_clause, type_params = self._location_type_filter(location_types)
+        query = (f'SELECT {self.LOCATION_GEO_COLUMNS} FROM locations l WHERE {clause}{type_clause}'
+                 ' ORDER BY l.footprint_count DESC, l.location_id')
+        params += type_params
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(int(limit))
+        with self._get_connection() as conn:
+            return [self._geo_location_from_row(row) for row in conn.execute(query, params)]
+
+    def _locations_within(self, latitude, longitude, radius_km, location_types=None):
+        """R*Tree 取外接矩形内的地点, 再按大圆距离精确过滤; 由近到远, 每项带有 'distance_km'"""
+        clause, params = rtree_filter(radius_boxes(latitude, longitude, radius_km))
+        type_clause, type_params = self._location_type_filter(location_types)
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                f'SELECT {self.LOCATION_GEO_COLUMNS} FROM locations l WHERE {clause}{type_clause}',
+                params + type_params).fetchall()
+        found = []
+        for row in rows:
+            distance = haversine_km(latitude, longitude, row[4], row[5])
+            if distance <= radius_km:
+                location = self._geo_location_from_row(row)
+                location['distance_km'] = distance
+                found.append(location)
+        found.sort(key=lambda location: (location['distance_km'], location['location_id']))
+        return found
+
+    @replica_read()
+    def get_locations_within(self, latitude, longitude, radius_km, location_types=None):
+        """距 (latitude, longitude) radius_km 公里以内的地点, 由近到远, 每项带有 'distance_km'"""
+        latitude, longitude = check_point(latitude, longitude)
+        return self._locations_within(latitude, longitude, self._check_radius(radius_km), location_types)
+
+    @replica_read()
+    def get_nearest_locations(self, latitude, longitude, k=10, max_distance_km=None, location_types=None):
+        """
+        最近的 k 个地点, 由近到远, 每项带有 'distance_km'
+        按半径查询, 不足 k 个时扩大半径再查; 半径内已有 k 个地点时, 更远的地点不会进入前 k 个
+        """
+        latitude, longitude = check_point(latitude, longitude)
+        k = max(1, int(k))
+        limit = MAX_DISTANCE_KM if max_distance_km is None else self._check_radius(max_distance_km)
+        radius = min(self.NEAREST_START_KM, limit)
+        while True:
+            found = self._locations_within(latitude, longitude, radius, location_types)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(radius * self.NEAREST_GROWTH, limit)
+
+    @replica_read()
+    def get_footprints_within(self, latitude, longitude, radius_km, cursor=None,
+                              page_size=DEFAULT_PAGE_SIZE, viewer_id=None):
+        """
+        地点在 radius_km 公里以内的足迹, 按时间倒序的游标分页, 每项带有地点的 'distance_km'
+        先经 R*Tree 找到半径内的地点, 再按 idx_footprints_location 取这些地点的足迹,
+        开销取决于半径内的地点和足迹数, 与足迹总数无关
+        """
+        latitude, longitude = check_point(latitude, longitude)
+        distances = {
+            location['location_id']: location['distance_km']
+            for location in self._locations_within(latitude, longitude, self._check_radius(radius_km))
+        }
+        page = self._keyset_page(
+            self.FOOTPRINT_SELECT + ' WHERE f.location_id IN (SELECT value FROM json_each(?))',
+            [json.dumps(list(distances))],
+            keys=[('f.created_at', 'created_at_raw'), ('f.footprint_id', 'footprint_id')],
+            descending=True, cursor=cursor, page_size=page_size,
+            row_mapper=self._footprint_from_row,
+        )
+        for footprint in page['items']:
+            footprint['distance_km'] = distances[footprint['location_id']]
+        self._annotate_collected(page['items'], viewer_id)
+        return page
+
     ###########################
     ##       comment        ##
     ###########################
 
+    @write_method('comments', 'footprints', changes=('footprint', 'footprint_id'))
     def create_comment(self, user_id, footprint_id, content, parent_id=None):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             try:
+                if parent_id is not None:
+                    # 只能回复同一足迹下的评论
+                    cursor.execute('SELECT footprint_id FROM comments WHERE comment_id = ?', (parent_id,))
+                    parent = cursor.fetchone()
+                    if parent is None or parent[0] != footprint_id:
+                        print(f"创建评论失败: 足迹 {footprint_id} 下没有评论 {parent_id}")
+                        return None
                 cursor.execute('''
                     INSERT INTO comments 
                     (content, created_at, user_id, footprint_id, parent_comment_id)
-                    VALUES (?, datetime('now'), ?, ?, ?)
-                ''', (content, user_id, footprint_id, parent_id))
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (content, int(time.time()), user_id, footprint_id, parent_id))
                 conn.commit()
                 return cursor.lastrowid
             except sqlite3.Error as e:
                 print(f"创建评论失败: {str(e)}")
                 return None
 
+    @replica_read()
     def get_comments_by_footprint(self, footprint_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT c.*, u.username 
-                FROM comments c
-                JOIN users u ON c.user_id = u.user_id
+            cursor.execute(self.COMMENT_SELECT + '''
                 WHERE c.footprint_id = ?
                 ORDER BY c.created_at DESC
             ''', (footprint_id,))
-            return [{
-                'comment_id': row[0],
-                'content': row[1],
-                'created_at': row[2],
-                'user_id': row[3],
-                'username': row[6],
-                'parent_comment_id': row[5]
-            } for row in cursor.fetchall()]
+            return [self._comment_from_row(row) for row in cursor.fetchall()]
+
+    COMMENT_COLUMNS = '''
+        c.comment_id, c.content, c.created_at, c.user_id, c.footprint_id, c.parent_comment_id,
+        u.username, {display}, c.reply_count
+    '''.format(display=display_time('c.created_at'))
+
+    COMMENT_SELECT = f'''
+        SELECT {COMMENT_COLUMNS}
+        FROM comments c
+        JOIN users u ON c.user_id = u.user_id
+    '''
+
+    @staticmethod
+    def _comment_from_row(row):
+        return {
+            'comment_id': row[0],
+            'content': row[1],
+            'created_at': row[7],
+            'created_at_raw': row[2],
+            'user_id': row[3],
+            'username': row[6],
+            'parent_comment_id': row[5],
+            'reply_count': row[8],
+        }
+
+    @replica_read()
+    def get_comments_page(self, footprint_id, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        return self._keyset_page(
+            self.COMMENT_SELECT + ' WHERE c.footprint_id = ?', [footprint_id],
+            keys=[('c.created_at', 'created_at_raw'), ('c.comment_id', 'comment_id')],
+            descending=True, cursor=cursor, page_size=page_size,
+            row_mapper=self._comment_from_row,
+        )
+
+    @replica_read()
+    def get_comment_threads(self, footprint_id, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                            replies=3, max_depth=3):
+        """
+        一页顶层评论 (新的在前) 及其回复树, 一条递归查询取出
+        每条评论最多带 replies 条最早的回复, 最多展开 max_depth 层
+        返回: {'items': [评论, 每条带 'replies' / 'depth' / 'more_replies'], 'next_cursor', 'prev_cursor'}
+        """
+        return self._comment_tree(footprint_id, None, cursor, page_size, replies, max_depth)
+
+    @replica_read()
+    def get_comment_replies(self, footprint_id, parent_id, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                            replies=3, max_depth=3):
+        """评论 parent_id 的一页直接回复 (早的在前) 及其回复树, 用于加载更多回复"""
+        return self._comment_tree(footprint_id, parent_id, cursor, page_size, replies, max_depth)
+
+    def _comment_tree(self, footprint_id, parent_id, cursor, page_size, replies, max_depth):
+        page_size = clamp_page_size(page_size)
+        replies = max(0, int(replies))
+        max_depth = max(0, int(max_depth))
+        direction = 'next'
+        key_values = None
+        if cursor:
+            key_values, direction = decode_cursor(cursor)
+            if len(key_values) != 2:
+                raise ValueError(f"Invalid cursor: {cursor}")
+
+        # 顶层评论新的在前, 回复早的在前; 向前翻页时反过来取
+        forward = direction == 'next'
+        descending = (parent_id is None) == forward
+        order = 'DESC' if descending else 'ASC'
+        after = ''
+        params = {'footprint': footprint_id, 'parent': parent_id, 'limit': page_size + 1,
+                  'replies': replies, 'max_depth': max_depth}
+        if key_values is not None:
+            after = f"AND (created_at, comment_id) {'<' if descending else '>'} (:key_time, :key_id)"
+            params.update(key_time=key_values[0], key_id=key_values[1])
+
+        # path: 根在本页中的序号 + 各层回复的 (created_at, comment_id), 按 path 排序即为先序遍历
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                WITH RECURSIVE
+                roots AS (
+                    SELECT comment_id,
+                           ROW_NUMBER() OVER (ORDER BY created_at {order}, comment_id {order}) AS rank
+                    FROM (
+                        SELECT comment_id, created_at FROM comments
+                        WHERE footprint_id = :footprint AND parent_comment_id IS :parent {after}
+                        ORDER BY created_at {order}, comment_id {order}
+                        LIMIT :limit
+                    )
+                ),
+                tree(comment_id, rank, depth, path) AS (
+                    SELECT comment_id, rank, 0, printf('%06d', rank) FROM roots
+                    UNION ALL
+                    SELECT c.comment_id, t.rank, t.depth + 1,
+                           t.path || printf('/%012d.%012d', c.created_at, c.comment_id)
+                    FROM tree t
+                    JOIN comments c ON c.comment_id IN (
+                        SELECT r.comment_id FROM comments r
+                        WHERE r.footprint_id = :footprint AND r.parent_comment_id = t.comment_id
+                        ORDER BY r.created_at, r.comment_id
+                        LIMIT :replies
+                    )
+                    WHERE t.depth < :max_depth
+                )
+                SELECT {self.COMMENT_COLUMNS}, t.rank, t.depth
+                FROM tree t
+                JOIN comments c ON c.comment_id = t.comment_id
+                JOIN users u ON c.user_id = u.user_id
+                ORDER BY t.path
+            ''', params).fetchall()
+
+        # 多取的一个根 (用来判断是否还有下一页) 连同它的回复一起丢掉
+        has_more = any(row[9] > page_size for row in rows)
+        rows = [row for row in rows if row[9] <= page_size]
+        roots = []
+        stack = []
+        for row in rows:
+            node = self._comment_from_row(row)
+            node['depth'] = row[10]
+            node['replies'] = []
+            del stack[node['depth']:]
+            (stack[-1]['replies'] if stack else roots).append(node)
+            stack.append(node)
+        if not forward:
+            roots.reverse()
+        self._mark_more_replies(roots)
+
+        def key_of(node):
+            return [node['created_at_raw'], node['comment_id']]
+
+        has_next = has_more if forward else key_values is not None
+        has_prev = key_values is not None if forward else has_more
+        return {
+            'items': roots,
+            'next_cursor': encode_cursor(key_of(roots[-1]), 'next') if roots and has_next else None,
+            'prev_cursor': encode_cursor(key_of(roots[0]), 'prev') if roots and has_prev else None,
+        }
+
+    @classmethod
+    def _mark_more_replies(cls, nodes):
+        """没有全部展开的评论: more_replies 为剩余条数, replies_cursor 用于继续加载"""
+        for node in nodes:
+            loaded = node['replies']
+            node['more_replies'] = node['reply_count'] - len(loaded)
+            node['replies_cursor'] = (
+                encode_cursor([loaded[-1]['created_at_raw'], loaded[-1]['comment_id']], 'next')
+                if loaded and node['more_replies'] > 0 else None
+            )
+            cls._mark_more_replies(loaded)
 
     ###########################
     ##      collection       ##
     ###########################
 
+    @write_method('collections', 'footprints', changes=('footprint', 'footprint_id'))
     def create_collection(self, user_id, footprint_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -620,8 +1590,8 @@ class DatabaseManager:
                 cursor.execute('''
                     INSERT INTO collections 
                     (user_id, footprint_id, created_at)
-                    VALUES (?, ?, datetime('now'))
-                ''', (user_id, footprint_id))
+                    VALUES (?, ?, ?)
+                ''', (user_id, footprint_id, int(time.time())))
                 conn.commit()
                 return True
             except sqlite3.IntegrityError:
@@ -630,6 +1600,7 @@ class DatabaseManager:
                 print(f"收藏失败: {str(e)}")
                 return False
 
+    @write_method('collections', 'footprints', changes=('footprint', 'footprint_id'))
     def delete_collection(self, user_id, footprint_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -640,27 +1611,89 @@ class DatabaseManager:
             conn.commit()
             return cursor.rowcount > 0
 
+    @write_method('collections', 'footprints', changes=('footprint', 'footprint_id'))
+    def toggle_collection(self, user_id, footprint_id):
+        """已收藏则取消, 否则收藏; 返回操作后的状态, 失败返回 None"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    DELETE FROM collections
+                    WHERE user_id = ? AND footprint_id = ?
+                ''', (user_id, footprint_id))
+                collected = cursor.rowcount == 0
+                if collected:
+                    cursor.execute('''
+                        INSERT INTO collections
+                        (user_id, footprint_id, created_at)
+                        VALUES (?, ?, ?)
+                    ''', (user_id, footprint_id, int(time.time())))
+                conn.commit()
+                return collected
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"收藏失败: {str(e)}")
+                return None
+
+    @write_method('collections', 'footprints', changes=('footprint', 'footprint_ids'))
+    def collect_many(self, user_id, footprint_ids):
+        """
+        在一个事务中收藏多条足迹, 已收藏的和不存在的足迹跳过
+        返回新增的收藏数, 失败返回 None
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO collections
+                    (user_id, footprint_id, created_at)
+                    SELECT ?, footprint_id, ? FROM footprints
+                    WHERE footprint_id IN (SELECT value FROM json_each(?))
+                ''', (user_id, int(time.time()), json.dumps([int(i) for i in footprint_ids])))
+                conn.commit()
+                return cursor.rowcount
+            except sqlite3.Error as e:
+                conn.rollback()
+                print(f"收藏失败: {str(e)}")
+                return None
+
+    @write_method('collections', 'footprints', changes=('footprint', 'footprint_ids'))
+    def uncollect_many(self, user_id, footprint_ids):
+        """在一个事务中取消多条收藏, 返回删除的收藏数"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM collections
+                WHERE user_id = ? AND footprint_id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps([int(i) for i in footprint_ids])))
+            conn.commit()
+            return cursor.rowcount
+
+    @replica_read()
     def get_collections_by_user(self, user_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT f.*, u.username, l.name as location_name
+                SELECT f.footprint_id, f.title, f.content, f.image_url, f.created_at, f.user_id, f.location_id,
+                       u.username, l.name as location_name, {display}, c.created_at
                 FROM collections c
                 JOIN footprints f ON c.footprint_id = f.footprint_id
                 JOIN users u ON f.user_id = u.user_id
                 JOIN locations l ON f.location_id = l.location_id
                 WHERE c.user_id = ?
                 ORDER BY c.created_at DESC
-            ''', (user_id,))
+            '''.format(display=display_time('f.created_at')), (user_id,))
             return [{
                 'footprint_id': row[0],
                 'title': row[1],
                 'content': row[2],
-                'created_at': row[4],
+                'created_at': row[9],
                 'username': row[7],
-                'location_name': row[8]
+                'location_name': row[8],
+                'collected_at': row[10]
             } for row in cursor.fetchall()]
 
+    @replica_read()
     def is_collected(self, user_id, footprint_id):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -670,6 +1703,20 @@ class DatabaseManager:
             ''', (user_id, footprint_id))
             return cursor.fetchone() is not None
 
+    @replica_read()
+    def is_collected_many(self, user_id, footprint_ids):
+        """一次查询返回 footprint_ids 中 user_id 已收藏的足迹 id 集合"""
+        footprint_ids = [int(i) for i in footprint_ids]
+        if not footprint_ids:
+            return set()
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT footprint_id FROM collections
+                WHERE user_id = ? AND footprint_id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(footprint_ids)))
+            return {row[0] for row in cursor.fetchall()}
+
     ###########################
     ##         fake          ##
     ###########################
@@ -681,21 +1728,22 @@ class DatabaseManager:
             available_user_ids.append(i+1)
 
         locations = [
-            {'name': 'Eiffel Tower', 'address': 'Paris', 'type': 'attraction'},
-            {'name': 'Louvre Museum', 'address': 'Paris', 'type': 'attraction'},
-            {'name': 'Big Ben', 'address': 'London', 'type': 'attraction'},
-            {'name': 'Daxing Airport', 'address': 'Beijing', 'type': 'transport'},
-            {'name': 'Beijing West Railway Station', 'address': 'Beijing', 'type': 'transport'},
-            {'name': 'Peking Duck Restaurant', 'address': 'Beijing', 'type': 'restaurant'},
-            {'name': 'Sushi Place', 'address': 'Tokyo', 'type': 'restaurant'},
-            {'name': 'Great Wall', 'address': 'Beijing', 'type': 'attraction'},
-            {'name': 'Forbidden City', 'address': 'Beijing', 'type': 'attraction'},
-            {'name': 'Tokyo Tower', 'address': 'Tokyo', 'type': 'attraction'}
+            {'name': 'Eiffel Tower', 'address': 'Paris', 'type': 'attraction', 'latitude': 48.8584, 'longitude': 2.2945},
+            {'name': 'Louvre Museum', 'address': 'Paris', 'type': 'attraction', 'latitude': 48.8606, 'longitude': 2.3376},
+            {'name': 'Big Ben', 'address': 'London', 'type': 'attraction', 'latitude': 51.5007, 'longitude': -0.1246},
+            {'name': 'Daxing Airport', 'address': 'Beijing', 'type': 'transport', 'latitude': 39.5098, 'longitude': 116.4105},
+            {'name': 'Beijing West Railway Station', 'address': 'Beijing', 'type': 'transport', 'latitude': 39.8949, 'longitude': 116.322},
+            {'name': 'Peking Duck Restaurant', 'address': 'Beijing', 'type': 'restaurant', 'latitude': 39.899, 'longitude': 116.3976},
+            {'name': 'Sushi Place', 'address': 'Tokyo', 'type': 'restaurant', 'latitude': 35.6655, 'longitude': 139.7707},
+            {'name': 'Great Wall', 'address': 'Beijing', 'type': 'attraction', 'latitude': 40.3588, 'longitude': 116.02},
+            {'name': 'Forbidden City', 'address': 'Beijing', 'type': 'attraction', 'latitude': 39.9163, 'longitude': 116.3972},
+            {'name': 'Tokyo Tower', 'address': 'Tokyo', 'type': 'attraction', 'latitude': 35.6586, 'longitude': 139.7454}
         ]
 
         available_location_ids = []
         for i, location in enumerate(locations):
-            self.create_location(location['name'], location['address'], location['type'])
+            self.create_location(location['name'], location['address'], location['type'],
+                                 location['latitude'], location['longitude'])
             available_location_ids.append(i + 1)
 
         for _ in range(10):
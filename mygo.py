@@ -1,21 +1,44 @@
+import os
+
 from flask import Flask
 
-from models import DatabaseManager
-from routers import main_blueprint, user_blueprint, trip_blueprint, footprint_blueprint
+import bootstrap
+import config
+import fragcache
+import httpcache
+import metrics
+import replica
+import slowlog
+from routers import main_blueprint, user_blueprint, trip_blueprint, footprint_blueprint, location_blueprint
 
-def create_app():
+def create_app(config_name=None):
+    """
+    config_name: config.CONFIGS 中的名称或配置类, 默认取环境变量 MYGO_CONFIG (未设置时为 development)
+    """
     app = Flask(__name__)
+    config_name = config_name or os.environ.get('MYGO_CONFIG', 'development')
+    app.config.from_object(config.CONFIGS[config_name] if isinstance(config_name, str) else config_name)
+    app.config.from_prefixed_env('MYGO')
 
-    db_manager = DatabaseManager(initial=True)
-    db_manager.insert_fake_data()
+    # 整个 app 共用一个 DatabaseManager, 视图通过 routers.get_db() 取得
+    db = bootstrap.init_app(app)
 
+    # {% cache %} 标签要在第一次加载模板之前注册
+    fragcache.init_app(app, db)
     app.register_blueprint(main_blueprint)
     app.register_blueprint(user_blueprint, url_prefix='/user')
     app.register_blueprint(trip_blueprint, url_prefix='/trip')
     app.register_blueprint(footprint_blueprint, url_prefix='/footprint')
+    app.register_blueprint(location_blueprint, url_prefix='/location')
+
+    if db.replica is not None:
+        replica.init_app(app, db)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app, db)
+    slowlog.init_app(app, db)
+    httpcache.init_app(app, db)
     return app
 
 if __name__ == '__main__':
     app = create_app()
-    app.run(debug=True)
-
+    app.run(debug=app.config.get('DEBUG', False))
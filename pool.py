@@ -0,0 +1,456 @@
+import contextvars
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# applied once when a connection is created, not on every checkout
+DEFAULT_PRAGMAS = {
+    'foreign_keys': 1,
+    'cache_size': -16000,       # KiB, i.e. 16MB page cache per connection
+    'mmap_size': 268435456,     # 256MB
+    'temp_store': 'MEMORY',
+}
+
+
+# fork 之前打开、子进程中不再使用的连接. 只保留引用而不关闭: 关闭会释放父进程持有的文件锁,
+# 最后一个连接关闭时还会 checkpoint 并删除父进程正在使用的 WAL
+_inherited = []
+
+
+def abandon(*conns):
+    """在 fork 出的子进程中丢弃从父进程继承的连接"""
+    _inherited.extend(conn for conn in conns if conn is not None)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ObservedCursor(sqlite3.Cursor):
+    """
+    统计每条语句耗时的游标: 查询语句的耗时包括 execute 和第一次 fetch*,
+    完成后调用连接上登记的 observer(conn, sql, params, seconds, rows)
+    没有 observer 时只多一次属性判断
+    """
+    _pending = None
+
+    def _emit(self, sql, params, elapsed, rows):
+        for observer in self.connection.observers:
+            observer(self.connection, sql, params, elapsed, rows)
+
+    def _flush(self):
+        if self._pending is not None:
+            sql, params, elapsed = self._pending
+            self._pending = None
+            self._emit(sql, params, elapsed, None)
+
+    def execute(self, sql, parameters=()):
+        if not self.connection.observers:
+            return super().execute(sql, parameters)
+        self._flush()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        if self.description is None:
+            self._emit(sql, parameters, elapsed, self.rowcount)
+        else:
+            self._pending = (sql, parameters, elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not self.connection.observers:
+            return super().executemany(sql, seq_of_parameters)
+        self._flush()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._emit(sql, None, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def _fetched(self, started, rows):
+        sql, params, elapsed = self._pending
+        self._pending = None
+        self._emit(sql, params, elapsed + time.perf_counter() - started, rows)
+
+    def fetchall(self):
+        if self._pending is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        if self._pending is None:
+            return super().fetchmany(size or self.arraysize)
+        started = time.perf_counter()
+        rows = super().fetchmany(size or self.arraysize)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchone(self):
+        if self._pending is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def close(self):
+        self._flush()
+        super().close()
+
+
+class ObservedConnection(sqlite3.Connection):
+    observers = ()
+
+    def cursor(self, factory=ObservedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def is_busy_error(e):
+    return isinstance(e, sqlite3.OperationalError) and (
+        'locked' in str(e) or 'busy' in str(e)
+    )
+
+
+class ConnectionPool:
+    """
+    有界连接池: 连接创建时设置一次 PRAGMA, 之后在各次调用间复用
+    参数:
+        db_path: 数据库文件
+        size: 最多同时打开的连接数
+        timeout: 连接全部被占用时等待的秒数
+        pragmas: 覆盖 DEFAULT_PRAGMAS 中的项
+        health_check_interval: 空闲超过该秒数的连接在借出前先 SELECT 1 检查
+        busy_timeout: 遇到锁时 SQLite 内部等待的秒数
+    """
+
+    def __init__(self, db_path, size=5, timeout=10.0, pragmas=None,
+                 health_check_interval=30.0, busy_timeout=5.0):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.health_check_interval = health_check_interval
+        self.busy_timeout = busy_timeout
+        # 所有连接共享同一个列表, 之后登记的 observer 对已打开的连接同样生效
+        self.observers = []
+
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._generation = 0
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'creations': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _connect(self, observed=True):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               check_same_thread=False, factory=ObservedConnection)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if observed:
+            conn.observers = self.observers
+        return conn
+
+    def add_observer(self, observer):
+        """登记语句级回调 observer(conn, sql, params, seconds, rows)"""
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self):
+        while True:
+            try:
+                conn, generation, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._open < self.size
+                    if can_create:
+                        self._open += 1
+                        generation = self._generation
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    self._count('creations')
+                    self._count('checkouts')
+                    return conn, generation
+
+                self._count('waits')
+                try:
+                    conn, generation, idle_since = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._count('timeouts')
+                    raise PoolTimeout(
+                        f"No connection available for {self.db_path} after {self.timeout}s"
+                    )
+
+            if generation != self._generation:
+                # 连接属于 close() 之前的旧文件
+                self._discard(conn)
+                continue
+            if (time.monotonic() - idle_since > self.health_check_interval
+                    and not self._is_healthy(conn)):
+                self._count('health_check_failures')
+                self._discard(conn)
+                continue
+            self._count('checkouts')
+            return conn, generation
+
+    def release(self, conn, generation):
+        if generation != self._generation:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, generation, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """
+        借出一个连接, 行为与 sqlite3 连接的 with 语句一致 (正常退出提交, 异常回滚)
+        同一线程内嵌套调用复用已借出的连接, 避免池被自己耗尽
+        """
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn, generation = self.acquire()
+        self._local.held = conn
+        self._local.depth = 1
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.held = None
+            self._local.depth = 0
+            self.release(conn, generation)
+
+    @contextmanager
+    def bind(self, conn):
+        """让当前线程内的 connection() 调用都使用给定连接 (写线程使用)"""
+        self._local.held = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.held = None
+            self._local.depth = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def close(self):
+        """关闭所有空闲连接; 正在使用的连接归还时关闭"""
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def after_fork(self):
+        """
+        在 fork 出的子进程中调用: 丢弃继承的空闲连接, 之后按需在子进程中打开新连接
+        父进程中其他线程可能正持有锁, 锁和队列都换成新的, 不去获取旧的
+        """
+        abandon(*(conn for conn, _, _ in list(self._idle.queue)))
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._open = 0
+        self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['size'] = self.size
+        return stats
+
+
+class WriteLane:
+    """
+    串行写通道: 所有写操作交给一个专用线程按顺序执行, 读操作仍走连接池并行
+    每个写任务先以 BEGIN IMMEDIATE 拿到写锁, 遇到 SQLITE_BUSY 时指数退避重试,
+    总等待时间不超过 busy_timeout
+    """
+
+    def __init__(self, pool, busy_timeout=5.0, backoff=0.005, max_backoff=0.25):
+        self.pool = pool
+        self.busy_timeout = busy_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_generation = None
+        self._stats = {
+            'writes': 0,
+            'lock_waits': 0,
+            'retries': 0,
+            'lock_wait_seconds': 0.0,
+            'busy_failures': 0,
+        }
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _connection(self):
+        if self._conn is None or self._conn_generation != self.pool.generation:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = self.pool._connect()
+            # 由 _begin 自己退避重试, 不让 SQLite 内部阻塞
+            self._conn.execute('PRAGMA busy_timeout = 0')
+            self._conn_generation = self.pool.generation
+        return self._conn
+
+    def _begin(self, conn):
+        deadline = time.monotonic() + self.busy_timeout
+        delay = self.backoff
+        waited = False
+        started = time.monotonic()
+        while True:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                break
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or time.monotonic() + delay > deadline:
+                    if is_busy_error(e):
+                        self._count('busy_failures')
+                    raise
+                if not waited:
+                    waited = True
+                    self._count('lock_waits')
+                self._count('retries')
+                time.sleep(delay * (0.5 + random.random()))
+                delay = min(delay * 2, self.max_backoff)
+        if waited:
+            self._count('lock_wait_seconds', time.monotonic() - started)
+
+    def _execute(self, func, args, kwargs):
+        conn = self._connection()
+        self._begin(conn)
+        try:
+            with self.pool.bind(conn):
+                result = func(*args, **kwargs)
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        self._count('writes')
+        return result
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            future, ctx, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(ctx.run(self._execute, func, args, kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def submit(self, func, *args, **kwargs):
+        """在写线程中执行 func 并返回其结果; 写线程内部的嵌套写直接执行"""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        if not self._thread.is_alive():
+            raise RuntimeError("Write lane has been stopped")
+        future = Future()
+        self._queue.put((future, contextvars.copy_context(), func, args, kwargs))
+        return future.result()
+
+    def after_fork(self):
+        """在 fork 出的子进程中调用: 线程不会随 fork 复制, 丢弃继承的写连接并重新启动写线程"""
+        abandon(self._conn)
+        self._conn = None
+        self._conn_generation = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,348 @@
+"""
+内存只读副本
+
+    db = DatabaseManager(replica=True, replica_staleness=1.0)
+    replica.init_app(app, db)       # 读自己的写: 写请求之后的请求 (同一客户端) 不读旧副本
+
+副本是 database.db 的一份内存拷贝 (shared cache 的内存数据库, 多个只读连接共享),
+由后台线程通过 sqlite3 backup API 复制: 本进程写入后立即唤醒, 其他进程的写入由定时检查
+PRAGMA data_version 发现. 新副本复制完成后直接替换当前副本, 正在读旧副本的连接不受影响,
+用完后旧副本释放
+
+标记为 replica_read 的读方法在副本上执行, 以下情况仍读磁盘:
+    - 副本有超过 max_staleness 秒未同步的修改
+    - 副本在当前请求 (或客户端) 最近一次写入之前复制 (read_after)
+    - exact 读取 (结果会进入读缓存) 而副本有任何未同步的修改
+"""
+import contextvars
+import itertools
+import math
+import queue
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+from pool import ObservedConnection, abandon
+
+# 当前线程正在使用的副本连接; DatabaseManager._get_connection 优先返回它
+replica_connection = contextvars.ContextVar('mygo_replica_connection', default=None)
+# 当前请求要求副本包含的最近一次写入的时间 (time.time())
+read_after = contextvars.ContextVar('mygo_read_after', default=0.0)
+
+READ_AFTER_COOKIE = 'mygo_read_after'
+
+_names = itertools.count(1)
+
+
+class Snapshot:
+    """一份内存副本; keeper 连接保持数据库存在, 读连接按需创建并复用"""
+
+    def __init__(self, name, taken_at, observers):
+        self.uri = f'file:{name}?mode=memory&cache=shared'
+        self.taken_at = taken_at
+        self.observers = observers
+        self.keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._users = 0
+        self._retired = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False,
+                               factory=ObservedConnection)
+        conn.execute('PRAGMA query_only = 1')
+        conn.observers = self.observers
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self.release(None)
+            raise
+
+    def release(self, conn):
+        if conn is not None:
+            self._idle.put(conn)
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        """不再借出; 最后一个读者归还后关闭"""
+        with self._lock:
+            self._retired = True
+            close = self._users == 0
+        if close:
+            self._close()
+
+    def abandon(self):
+        """fork 出的子进程中丢弃这份副本的连接 (不关闭)"""
+        abandon(self.keeper, *list(self._idle.queue))
+
+    def _close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.keeper.close()
+
+
+class Replica:
+    """
+    参数:
+        pool: 主库的连接池 (复制时使用相同的 PRAGMA, 读连接共享其 observer)
+        max_staleness: 副本最多落后的秒数, 超过后读请求回到主库
+        refresh_interval: 两次复制之间的最短间隔, 也是检查其他进程写入的周期
+    """
+
+    def __init__(self, pool, max_staleness=1.0, refresh_interval=None):
+        self.pool = pool
+        self.max_staleness = max_staleness
+        self.refresh_interval = refresh_interval if refresh_interval is not None else max_staleness / 2
+        self._current = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._watch_lock = threading.Lock()
+        self._watch = None
+        self._watch_generation = None
+        self._data_version = None
+        # 副本之后最早一次未同步的修改的时间; None 表示副本是最新的
+        self._dirty_since = None
+        self._changes = 0
+        self._last_refresh = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._stats = {
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'refresh_seconds': 0.0,
+            'replica_reads': 0,
+            'primary_reads': 0,
+        }
+        self._thread = threading.Thread(target=self._run, name='sqlite-replica', daemon=True)
+        self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    ###########################
+    ##        refresh        ##
+    ###########################
+
+    def _mark_dirty(self):
+        with self._lock:
+            self._changes += 1
+            if self._dirty_since is None:
+                self._dirty_since = time.time()
+
+    def notify_write(self):
+        """本进程写入后调用: 标记副本过期并唤醒复制线程"""
+        self._mark_dirty()
+        self._wakeup.set()
+
+    def _poll(self):
+        """检查其他连接/进程的提交"""
+        with self._watch_lock:
+            if self._watch is None or self._watch_generation != self.pool.generation:
+                if self._watch is not None:
+                    self._watch.close()
+                self._watch = self.pool._connect(observed=False)
+                self._watch_generation = self.pool.generation
+                self._data_version = None
+            data_version = self._watch.execute('PRAGMA data_version').fetchone()[0]
+            changed = self._data_version is not None and data_version != self._data_version
+            self._data_version = data_version
+        if changed:
+            self._mark_dirty()
+        return changed
+
+    def refresh(self):
+        """复制一份新的副本并替换当前副本"""
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        self._poll()
+        with self._lock:
+            changes = self._changes
+        started = time.perf_counter()
+        taken_at = time.time()
+        snapshot = Snapshot(f'mygo-replica-{id(self)}-{next(_names)}', taken_at, self.pool.observers)
+        try:
+            source = self.pool._connect(observed=False)
+            try:
+                source.backup(snapshot.keeper)
+            finally:
+                source.close()
+        except Exception:
+            snapshot.retire()
+            self._count('refresh_failures')
+            raise
+        with self._lock:
+            old, self._current = self._current, snapshot
+            # 复制期间又有写入时, 这些写入不一定在副本中
+            self._dirty_since = None if self._changes == changes else taken_at
+            self._last_refresh = time.monotonic()
+            self._stats['refreshes'] += 1
+            self._stats['refresh_seconds'] += time.perf_counter() - started
+        if old is not None:
+            old.retire()
+        return snapshot
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                self._poll()
+                with self._lock:
+                    needed = self._current is not None and self._dirty_since is not None
+                    wait = self._last_refresh + self.refresh_interval - time.monotonic()
+                if not needed:
+                    continue
+                if wait > 0:
+                    time.sleep(wait)
+                self.refresh()
+            except Exception as e:
+                print(f"副本复制失败: {str(e)}")
+
+    ###########################
+    ##         reads         ##
+    ###########################
+
+    def _usable(self, snapshot, after, exact):
+        if snapshot is None or snapshot.taken_at < after:
+            return False
+        with self._lock:
+            dirty_since = self._dirty_since
+        if dirty_since is None:
+            return True
+        if exact:
+            return False
+        return time.time() - dirty_since <= self.max_staleness
+
+    @contextmanager
+    def connection(self, after=0.0, exact=False):
+        """
+        借出副本上的只读连接; 副本不能满足要求时 yield None, 由调用方读主库
+        after: 副本必须在该时间之后复制; exact: 副本必须没有任何未同步的修改
+        """
+        if exact:
+            self._poll()
+        with self._lock:
+            snapshot = self._current
+        if snapshot is None:
+            # 第一次读取时才复制, 此时结构迁移已经完成
+            with self._refresh_lock:
+                with self._lock:
+                    snapshot = self._current
+                if snapshot is None:
+                    snapshot = self._refresh()
+        if not self._usable(snapshot, after, exact):
+            self._wakeup.set()
+            self._count('primary_reads')
+            yield None
+            return
+        conn = snapshot.acquire()
+        self._count('replica_reads')
+        try:
+            yield conn
+        finally:
+            snapshot.release(conn)
+
+    def snapshot_id(self):
+        """当前副本的标识, 用于 ETag (页面可能来自这份副本)"""
+        with self._lock:
+            snapshot = self._current
+        return snapshot.uri if snapshot is not None else None
+
+    def reset(self):
+        """数据库文件被删除重建后丢弃当前副本"""
+        with self._lock:
+            old, self._current = self._current, None
+            self._dirty_since = None
+        if old is not None:
+            old.retire()
+
+    def after_fork(self):
+        """在 fork 出的子进程中调用: 丢弃继承的副本和检查连接, 重新启动复制线程, 第一次读取时重新复制"""
+        if self._current is not None:
+            self._current.abandon()
+        abandon(self._watch)
+        self._current = None
+        self._watch = None
+        self._watch_generation = None
+        self._data_version = None
+        self._dirty_since = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._watch_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sqlite-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self.reset()
+        with self._watch_lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            snapshot = self._current
+            dirty_since = self._dirty_since
+        stats['age'] = round(time.time() - snapshot.taken_at, 3) if snapshot else None
+        stats['lag'] = round(time.time() - dirty_since, 3) if dirty_since else 0.0
+        return stats
+
+
+def init_app(app, db):
+    """
+    读自己的写: 写请求在 cookie 中记下写入时间, 同一客户端之后的请求要求副本在此之后复制
+    (max_staleness 之后副本必然已包含这次写入, cookie 随之过期)
+    """
+    if getattr(db, 'replica', None) is None:
+        return None
+    from flask import request
+
+    def before_request():
+        try:
+            after = float(request.cookies.get(READ_AFTER_COOKIE, 0.0))
+        except ValueError:
+            after = 0.0
+        # 线程会被之后的请求复用, 每个请求开始时都重新设置
+        read_after.set(after)
+        request.environ['mygo.read_after'] = after
+
+    def after_request(response):
+        after = read_after.get()
+        if after > request.environ.get('mygo.read_after', 0.0):
+            response.set_cookie(READ_AFTER_COOKIE, f'{after:.6f}',
+                                max_age=math.ceil(db.replica.max_staleness) + 1,
+                                httponly=True, samesite='Lax')
+        return response
+
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.extensions['mygo_replica'] = db.replica
+    return db.replica
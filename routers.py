@@ -1,9 +1,42 @@
-from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from datetime import date, datetime, timedelta
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, jsonify
+from werkzeug.local import LocalProxy
 
-from models import DatabaseManager
+from models import DEFAULT_PAGE_SIZE, TripConflict, clamp_page_size, to_day
 
-db_manager = DatabaseManager()
+
+def get_db():
+    """当前 app 共享的 DatabaseManager (由 bootstrap.init_app 创建)"""
+    return current_app.extensions['mygo_db']
+
+db_manager = LocalProxy(get_db)
+
+
+def page_args():
+    # 游标分页参数: ?cursor=<token>&page_size=<n>
+    cursor = request.args.get('cursor') or None
+    page_size = request.args.get('page_size', type=int) \
+        or current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    return cursor, clamp_page_size(page_size)
+
+def thread_args():
+    # 评论树: 每条评论预先展开的回复数和最大层数
+    return {
+        'replies': current_app.config.get('COMMENT_REPLIES', 3),
+        'max_depth': current_app.config.get('COMMENT_MAX_DEPTH', 3),
+    }
+
+def bbox_arg(value):
+    # 视口: "south,west,north,east" 即 min_lat,min_lon,max_lat,max_lon; 空值表示不限
+    if not value or not value.strip():
+        return None
+    try:
+        parts = tuple(float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError(f"Invalid bounding box: {value}")
+    if len(parts) != 4:
+        raise ValueError(f"Invalid bounding box: {value}")
+    return parts
 
 main_blueprint = Blueprint('main', __name__)
 user_blueprint = Blueprint('user', __name__)
@@ -17,8 +50,12 @@ def hello():
 
 @user_blueprint.route('/')
 def user_list():
-    users = db_manager.get_all_users()
-    return render_template('user_list.html', users=users)
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_users_page(cursor, page_size)
+    except ValueError as e:
+        return str(e), 400
+    return render_template('user_list.html', users=page['items'], page=page)
 
 
 @user_blueprint.route('/create', methods=['POST'])
@@ -41,12 +78,43 @@ def delete_user(user_id):
     return redirect(url_for('user.user_list'))
 
 
+@user_blueprint.route('/<int:user_id>/feed')
+def user_feed(user_id):
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_feed_page(user_id, cursor, page_size)
+    except ValueError as e:
+        return str(e), 400
+    return render_template('user_feed.html',
+                         user_id=user_id,
+                         footprints=page['items'],
+                         page=page)
+
+
+@user_blueprint.route('/<int:user_id>/availability')
+def user_availability(user_id):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD, 默认从今天起 AVAILABILITY_DAYS 天
+    try:
+        start = to_day(request.args.get('start') or date.today())
+        end = to_day(request.args.get('end') or
+                     start + timedelta(days=current_app.config.get('AVAILABILITY_DAYS', 90)))
+        calendar = db_manager.get_user_availability(user_id, start, end)
+    except ValueError as e:
+        return str(e), 400
+    return render_template('user_availability.html', calendar=calendar)
+
+
 @trip_blueprint.route('/')
 def trip_list():
-    trips = db_manager.get_all_trips()
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_trips_page(cursor, page_size)
+    except ValueError as e:
+        return str(e), 400
     users = db_manager.get_all_users()
     locations = db_manager.get_all_locations()
-    return render_template('trip_list.html', trips=trips, users=users, locations=locations)
+    return render_template('trip_list.html', trips=page['items'], page=page,
+                           users=users, locations=locations)
 
 
 @trip_blueprint.route('/create', methods=['POST'])
@@ -60,9 +128,12 @@ def create_trip():
         if start_day >= end_day:
             raise ValueError("End date must be after start date")
             
-        trip_id = db_manager.create_trip(participants, start_day.isoformat(), end_day.isoformat(), locations)
+        trip_id = db_manager.create_trip(participants, start_day.isoformat(), end_day.isoformat(), locations,
+                                         check_conflicts=bool(request.form.get('check_conflicts')))
         return redirect(url_for('trip.trip_list'))
     
+    except TripConflict as e:
+        return str(e), 409
     except Exception as e:
         return str(e), 400
 
@@ -120,11 +191,30 @@ footprint_blueprint = Blueprint('footprint', __name__)
 
 @footprint_blueprint.route('/')
 def footprint_list():
-    footprints = db_manager.get_all_footprints()
-    locations = db_manager.get_all_locations()  # 需要新增这个方法
+    cursor, page_size = page_args()
+    # 传入 user_id 时标出该用户已收藏的足迹 (一次额外查询)
+    user_id = request.args.get('user_id', type=int)
+    try:
+        page = db_manager.get_footprints_page(cursor, page_size, viewer_id=user_id)
+    except ValueError as e:
+        return str(e), 400
+    locations = db_manager.get_all_locations()
     return render_template('footprint_list.html', 
-                         footprints=footprints,
-                         locations=locations)
+                         footprints=page['items'],
+                         page=page,
+                         locations=locations,
+                         user_id=user_id)
+
+@footprint_blueprint.route('/popular')
+def popular_footprints():
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_popular_footprints(cursor, page_size)
+    except ValueError as e:
+        return str(e), 400
+    return render_template('footprint_popular.html',
+                         footprints=page['items'],
+                         page=page)
 
 @footprint_blueprint.route('/create', methods=['POST'])
 def create_footprint():
@@ -157,25 +247,47 @@ def search_footprints():
             'location_name': '',
             'location_types': [],
             'created_after': '',
-            'created_before': ''
+            'created_before': '',
+            'bbox': ''
         }
+        keyword = ''
         results = []
+        search_page = None
         
-        if request.method == 'POST':
+        # 地图客户端可以直接 GET ?bbox=south,west,north,east 查询视口内的足迹
+        searched = request.method == 'POST' or bool(request.args.get('bbox'))
+        if searched:
+            source = request.form if request.method == 'POST' else request.args
             filters = {
-                'username': request.form.get('username', '').strip(),
-                'location_name': request.form.get('location_name', '').strip(),
-                'location_types': request.form.getlist('location_types'),
-                'created_after': request.form.get('created_after') or '',
-                'created_before': request.form.get('created_before') or ''
+                'username': source.get('username', '').strip(),
+                'location_name': source.get('location_name', '').strip(),
+                'location_types': source.getlist('location_types'),
+                'created_after': source.get('created_after') or '',
+                'created_before': source.get('created_before') or '',
+                'bbox': source.get('bbox', '').strip()
             }
-            results = db_manager.get_footprints_by_filters(**filters)
+            query_filters = dict(filters, bbox=bbox_arg(filters['bbox']))
+            keyword = source.get('keyword', '').strip()
+            if keyword:
+                # 关键词走全文索引, 按相关度排序并分页
+                search_page = db_manager.search_footprints(
+                    keyword,
+                    page=source.get('page', 1, type=int),
+                    page_size=current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE),
+                    **query_filters
+                )
+                results = search_page['items']
+            else:
+                results = db_manager.get_footprints_by_filters(**query_filters)
             
         return render_template('footprint_search.html',
                              users=users,
                              location_types=location_types,
                              results=results,
-                             filters=filters)
+                             search_page=search_page,
+                             keyword=keyword,
+                             filters=filters,
+                             searched=searched)
     
     except Exception as e:
         return str(e), 400
@@ -239,10 +351,15 @@ def footprint_detail(footprint_id):
     if user_id:
         collected = db_manager.is_collected(user_id, footprint_id)
     
-    comments = db_manager.get_comments_by_footprint(footprint_id)
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_comment_threads(footprint_id, cursor, page_size, **thread_args())
+    except ValueError as e:
+        return str(e), 400
     return render_template('footprint_detail.html',
                          footprint=footprint,
-                         comments=comments,
+                         comments=page['items'],
+                         page=page,
                          collected=collected,  # 传递收藏状态
                          user_id=user_id)      # 传递当前用户ID
 
@@ -250,27 +367,93 @@ def footprint_detail(footprint_id):
 def add_comment(footprint_id):
     user_id = request.form.get('user_id')
     content = request.form.get('content')
+    parent_id = request.form.get('parent_id', type=int)
     if not user_id or not content:
         return "Missing parameters", 400
-    if db_manager.create_comment(int(user_id), footprint_id, content):
+    if db_manager.create_comment(int(user_id), footprint_id, content, parent_id):
         return redirect(url_for('footprint.footprint_detail', footprint_id=footprint_id))
     return "Failed to add comment", 400
 
+@footprint_blueprint.route('/<int:footprint_id>/comments/<int:comment_id>/replies')
+def comment_replies(footprint_id, comment_id):
+    cursor, page_size = page_args()
+    try:
+        page = db_manager.get_comment_replies(footprint_id, comment_id, cursor, page_size, **thread_args())
+    except ValueError as e:
+        return str(e), 400
+    return render_template('comment_replies.html',
+                         footprint_id=footprint_id,
+                         comment_id=comment_id,
+                         comments=page['items'],
+                         page=page,
+                         user_id=request.args.get('user_id', type=int))
+
 @footprint_blueprint.route('/<int:footprint_id>/collect', methods=['POST'])
 @footprint_blueprint.route('/<int:footprint_id>/collect', methods=['POST'])
 def toggle_collect(footprint_id):
     user_id = request.form.get('user_id', type=int)
     if not user_id:
         return "User ID required", 400
+    if db_manager.toggle_collection(user_id, footprint_id) is None:
+        return "Failed to update collection", 400
     
-    # 操作后重定向回详情页，并携带用户ID参数
+    # 操作后重定向回来源页面 (列表页), 否则回详情页，并携带用户ID参数
+    next_url = request.form.get('next', '')
+    if next_url.startswith('/') and not next_url.startswith('//'):
+        return redirect(next_url)
     return redirect(url_for('footprint.footprint_detail',
                            footprint_id=footprint_id,
                            user_id=user_id))
 
+@footprint_blueprint.route('/collections/<int:user_id>', methods=['POST'])
+def bulk_collect(user_id):
+    # 批量收藏/取消收藏: footprint_id 可以出现多次, action 为 collect 或 uncollect
+    footprint_ids = request.form.getlist('footprint_id', type=int)
+    action = request.form.get('action')
+    if not footprint_ids or action not in ('collect', 'uncollect'):
+        return "Missing parameters", 400
+    if action == 'collect':
+        changed = db_manager.collect_many(user_id, footprint_ids)
+    else:
+        changed = db_manager.uncollect_many(user_id, footprint_ids)
+    if changed is None:
+        return "Failed to update collections", 400
+    next_url = request.form.get('next', '')
+    if next_url.startswith('/') and not next_url.startswith('//'):
+        return redirect(next_url)
+    return redirect(url_for('footprint.user_collections', user_id=user_id))
+
 @footprint_blueprint.route('/collections/<int:user_id>')
 def user_collections(user_id):
     collections = db_manager.get_collections_by_user(user_id)
     return render_template('collection_list.html', 
                          collections=collections,
-                         user_id=user_id)
\ No newline at end of file
+                         user_id=user_id)
+
+
+location_blueprint = Blueprint('location', __name__)
+
+@location_blueprint.route('/nearby')
+def nearby_locations():
+    # ?lat=&lon=&k=&radius_km=: 最近的 k 个地点, 以及 radius_km 公里以内的足迹 (游标分页)
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    k = request.args.get('k', 10, type=int)
+    radius_km = request.args.get('radius_km', current_app.config.get('NEARBY_RADIUS_KM', 5.0), type=float)
+    locations = []
+    page = None
+    if lat is not None and lon is not None:
+        cursor, page_size = page_args()
+        try:
+            locations = db_manager.get_nearest_locations(lat, lon, k)
+            page = db_manager.get_footprints_within(lat, lon, radius_km, cursor, page_size)
+        except ValueError as e:
+            return str(e), 400
+    return render_template('location_nearby.html',
+                         locations=locations,
+                         footprints=page['items'] if page else [],
+                         page=page,
+                         lat=lat,
+                         lon=lon,
+                         k=k,
+                         radius_km=radius_km)
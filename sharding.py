@@ -0,0 +1,615 @@
+"""
+按用户水平分片
+
+    db = ShardedDatabaseManager('shards', shards=4)     # 与 DatabaseManager 相同的接口
+    create_app 中设置 DB_SHARDS = 4 (目录为 DB_SHARD_DIR) 即由 bootstrap 创建并使用
+
+    python sharding.py split [database.db] [shards] --shards 4
+    python sharding.py bench-writes [--shards 4] [--threads 8] [--seconds 3]
+
+目录中的文件:
+    catalog.db      users / locations / trips 及行程相关的表 (全局数据的唯一来源)
+    shard_<k>.db    user_id % N == k 的用户发布的足迹, 以及这些足迹的评论和收藏
+    shards.json     分片数; 打开时与参数不一致则报错
+每个分片都是完整结构的数据库 (DatabaseManager), users / locations 按相同 id 复制到所有分片,
+足迹可以直接 JOIN 用户和地点; 评论和收藏与足迹放在同一分片, 外键和计数触发器照常工作
+分片 k 的足迹和评论 id 从 k * SHARD_SPAN 开始分配, 由 id 即可找到所在分片
+
+跨分片的列表并行查询各分片 (线程池), 再按排序键归并; 各分片的写入互不阻塞
+同行者动态 (feed) 依赖跨用户的 feed_items, 分片模式下不支持; 也不支持只读副本和模板数据库
+"""
+import argparse
+import contextvars
+import heapq
+import inspect
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from models import DatabaseManager, DB_NAME, MAX_PAGE_SIZE, clamp_page_size, decode_cursor, encode_cursor
+
+# 每个分片的足迹/评论 id 区间大小
+SHARD_SPAN = 2 ** 40
+MANIFEST = 'shards.json'
+CATALOG = 'catalog.db'
+
+# 复制到每个分片的全局表: 表 -> 复制的列 (第一列为主键); 计数列由各分片的触发器维护
+GLOBAL_TABLES = {
+    'users': ('user_id', 'username', 'email'),
+    'locations': ('location_id', 'name', 'address', 'type', 'latitude', 'longitude'),
+}
+
+# 直接在 catalog 上执行的方法
+CATALOG_METHODS = {
+    'get_all_users', 'get_users_page', 'get_all_locations',
+    'get_locations_in_bbox', 'get_locations_within', 'get_nearest_locations',
+    'create_trip', 'delete_trip', 'get_all_trips', 'get_trips_page', 'get_trips_by_filters',
+    'get_trips_overlapping', 'find_trip_conflicts', 'get_user_availability',
+    'rebuild_trip_summaries',
+}
+
+
+def _empty_page():
+    return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+
+
+# 在足迹所在分片上执行的方法 -> 足迹 id 不属于任何分片时的返回值
+FOOTPRINT_METHODS = {
+    'get_footprint_detail': lambda: None,
+    'update_footprint': lambda: False,
+    'create_comment': lambda: None,
+    'get_comments_by_footprint': list,
+    'get_comments_page': _empty_page,
+    'get_comment_threads': _empty_page,
+    'get_comment_replies': _empty_page,
+    'create_collection': lambda: False,
+    'delete_collection': lambda: False,
+    'toggle_collection': lambda: None,
+    'is_collected': lambda: False,
+}
+
+
+def shard_path(directory, index):
+    return os.path.join(directory, f'shard_{index}.db')
+
+
+def _sum_stats(results):
+    """各数据库的统计相加 (数值项), 全部为空时返回 None"""
+    results = [stats for stats in results if stats]
+    if not results:
+        return None
+    total = {}
+    for stats in results:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+class ShardedPool:
+    """
+    把 catalog 和各分片的连接池当作一个池, 供 metrics / slowlog / bootstrap / wsgi 使用:
+    语句观察者登记到所有池, 统计相加, connection() 借出 catalog 的连接
+    """
+
+    def __init__(self, dbs):
+        self.dbs = dbs
+
+    def connection(self):
+        return self.dbs[0].pool.connection()
+
+    def add_observer(self, observer):
+        for db in self.dbs:
+            db.pool.add_observer(observer)
+
+    def remove_observer(self, observer):
+        for db in self.dbs:
+            db.pool.remove_observer(observer)
+
+    def stats(self):
+        return _sum_stats([db.pool.stats() for db in self.dbs])
+
+    def close(self):
+        for db in self.dbs:
+            db.pool.close()
+
+
+class ShardedDatabaseManager:
+    """
+    参数:
+        directory: 存放 catalog.db 和各分片的目录
+        shards: 分片数, 建立后不能改变
+        initial: 删除并重建所有数据库
+        db_kwargs: 传给每个 DatabaseManager 的参数 (pool_size, concurrent, cache_size 等)
+    """
+
+    def __init__(self, directory='shards', shards=4, initial=False, **db_kwargs):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.shard_count = self._check_manifest(shards, initial)
+        db_kwargs['feed_mode'] = None
+        self.catalog = DatabaseManager(os.path.join(directory, CATALOG), initial=initial, **db_kwargs)
+        self.shards = [DatabaseManager(shard_path(directory, k), initial=initial, **db_kwargs)
+                       for k in range(self.shard_count)]
+        for k, shard in enumerate(self.shards):
+            self._prepare_shard(k, shard)
+        self._prepare_catalog()
+        self.executor = ThreadPoolExecutor(max_workers=self.shard_count,
+                                           thread_name_prefix='sqlite-shard')
+        self._methods = {}
+        self.pool = ShardedPool(self._all())
+        # 分片模式不支持只读副本 (create_app 据此跳过 replica.init_app)
+        self.replica = None
+        self.recover_deletes()
+
+    def _check_manifest(self, shards, initial):
+        path = os.path.join(self.directory, MANIFEST)
+        if os.path.exists(path) and not initial:
+            with open(path) as f:
+                existing = json.load(f)['shards']
+            if existing != shards:
+                raise Exception(f"{self.directory} has {existing} shards, not {shards}")
+            return existing
+        if shards < 1:
+            raise ValueError(f"Invalid shard count: {shards}")
+        with open(path, 'w') as f:
+            json.dump({'shards': shards}, f)
+        return shards
+
+    @staticmethod
+    def _prepare_shard(index, shard):
+        """迁移到最新结构, 设置 id 区间, 去掉 feed 触发器 (分片不展开动态)"""
+        shard.migrate()
+        base = index * SHARD_SPAN
+        with shard.pool.connection() as conn:
+            conn.execute('DROP TRIGGER IF EXISTS footprints_feed_outbox')
+            for table in ('footprints', 'comments'):
+                conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (base, table))
+                conn.execute('''
+                    INSERT INTO sqlite_sequence (name, seq)
+                    SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+                ''', (table, base, table))
+            conn.commit()
+
+    def _prepare_catalog(self):
+        """catalog 中记录尚未完成的跨分片删除 (见 delete_user)"""
+        with self.catalog.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_user_deletes (
+                    user_id INTEGER PRIMARY KEY
+                )''')
+
+    def _get_connection(self):
+        return self.catalog._get_connection()
+
+    def __getattr__(self, name):
+        if name in CATALOG_METHODS:
+            return getattr(self.catalog, name)
+        if name in FOOTPRINT_METHODS:
+            method = self._methods.get(name)
+            if method is None:
+                method = self._methods[name] = self._footprint_method(name)
+            return method
+        raise AttributeError(f"{type(self).__name__} has no attribute {name!r}")
+
+    def _footprint_method(self, name):
+        signature = inspect.signature(getattr(DatabaseManager, name))
+        missing = FOOTPRINT_METHODS[name]
+
+        def method(*args, **kwargs):
+            footprint_id = signature.bind(None, *args, **kwargs).arguments['footprint_id']
+            shard = self.shard_for_footprint(footprint_id)
+            if shard is None:
+                return missing()
+            return getattr(shard, name)(*args, **kwargs)
+        method.__name__ = name
+        return method
+
+    ###########################
+    ##        routing        ##
+    ###########################
+
+    def shard_for_user(self, user_id):
+        return self.shards[int(user_id) % self.shard_count]
+
+    def shard_for_footprint(self, footprint_id):
+        """足迹 (或评论) id 所在的分片, id 无效时返回 None"""
+        try:
+            index = int(footprint_id) // SHARD_SPAN
+        except (TypeError, ValueError):
+            return None
+        return self.shards[index] if 0 <= index < self.shard_count else None
+
+    def _group_by_shard(self, footprint_ids):
+        groups = {}
+        for footprint_id in footprint_ids:
+            shard = self.shard_for_footprint(footprint_id)
+            if shard is not None:
+                groups.setdefault(id(shard), (shard, []))[1].append(int(footprint_id))
+        return list(groups.values())
+
+    def _scatter(self, func, targets=None):
+        """在线程池中对每个分片 (或 targets) 执行 func, 按顺序返回结果; 各任务沿用调用方的 contextvars"""
+        targets = self.shards if targets is None else targets
+        if len(targets) == 1:
+            return [func(targets[0])]
+        futures = [self.executor.submit(contextvars.copy_context().run, func, target)
+                   for target in targets]
+        return [future.result() for future in futures]
+
+    ###########################
+    ##     global tables     ##
+    ###########################
+
+    def _global_rows(self, table, key_ids=None):
+        columns = GLOBAL_TABLES[table]
+        query = f'SELECT {", ".join(columns)} FROM {table}'
+        params = ()
+        if key_ids is not None:
+            query += f' WHERE {columns[0]} IN (SELECT value FROM json_each(?))'
+            params = (json.dumps(list(key_ids)),)
+        with self.catalog._get_connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def _replicate(self, table, key_ids=None, prune=False):
+        rows = self._global_rows(table, key_ids)
+        columns = GLOBAL_TABLES[table]
+        self._scatter(lambda shard: shard.sync_rows(table, columns, rows, prune))
+        return len(rows)
+
+    def resync_global_tables(self):
+        """按 catalog 重新复制 users / locations 到所有分片 (复制中途失败后修复), 返回 {表: 行数}"""
+        # 先完成中断的删除, 否则正在删除的用户会被重新复制到已经删掉它的分片
+        self.recover_deletes()
+        return {table: self._replicate(table, prune=True) for table in GLOBAL_TABLES}
+
+    def create_user(self, username, email):
+        if not self.catalog.create_user(username, email):
+            return False
+        with self.catalog._get_connection() as conn:
+            user_id = conn.execute('SELECT user_id FROM users WHERE username = ?', (username,)).fetchone()[0]
+        self._replicate('users', [user_id])
+        return True
+
+    def create_location(self, name, address, location_type, latitude=None, longitude=None):
+        location_id = self.catalog.create_location(name, address, location_type, latitude, longitude)
+        self._replicate('locations', [location_id])
+        return location_id
+
+    def set_location_coordinates(self, location_id, latitude, longitude):
+        if not self.catalog.set_location_coordinates(location_id, latitude, longitude):
+            return False
+        # 分片上的 location_rtree 用于足迹的视口筛选
+        self._replicate('locations', [location_id])
+        return True
+
+    def delete_user(self, user_id):
+        """
+        先在 catalog 的 pending_user_deletes 中记下用户, 再删除各分片中的数据, 最后删除 catalog 中的用户和记录
+        中途失败时用户仍在 catalog 中, 记录也还在; recover_deletes (打开时和 resync_global_tables 时执行,
+        也可直接调用) 重新执行这些删除, 分片上的删除可以重复执行
+        """
+        with self.catalog.pool.connection() as conn:
+            if conn.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,)).fetchone() is None:
+                return False
+            conn.execute('INSERT OR IGNORE INTO pending_user_deletes (user_id) VALUES (?)', (user_id,))
+        return self._finish_delete(user_id)
+
+    def _finish_delete(self, user_id):
+        self._scatter(lambda shard: shard.delete_user(user_id))
+        deleted = self.catalog.delete_user(user_id)
+        with self.catalog.pool.connection() as conn:
+            conn.execute('DELETE FROM pending_user_deletes WHERE user_id = ?', (user_id,))
+        return deleted
+
+    def recover_deletes(self):
+        """重新执行中途失败的 delete_user, 返回完成的用户 id 列表"""
+        with self.catalog.pool.connection() as conn:
+            pending = [row[0] for row in conn.execute('SELECT user_id FROM pending_user_deletes')]
+        for user_id in pending:
+            self._finish_delete(user_id)
+        return pending
+
+    # 示例数据只通过 create_user / create_location / create_trip 写入, 按上面的方式路由
+    insert_fake_data = DatabaseManager.insert_fake_data
+
+    ###########################
+    ##       footprint       ##
+    ###########################
+
+    def create_footprint(self, user_id, title, content, location_id):
+        return self.shard_for_user(user_id).create_footprint(user_id, title, content, location_id)
+
+    @staticmethod
+    def _merge(results, key, reverse=True):
+        """各分片已按 key 排好序的结果归并成一个列表"""
+        return list(heapq.merge(*results, key=key, reverse=reverse))
+
+    def get_all_footprints(self, viewer_id=None):
+        results = self._scatter(lambda shard: shard.get_all_footprints(viewer_id))
+        return self._merge(results, key=lambda fp: fp['created_at_raw'])
+
+    def get_footprints_by_filters(self, username=None, location_name=None,
+                                  location_types=None, created_after=None,
+                                  created_before=None, viewer_id=None, bbox=None):
+        results = self._scatter(lambda shard: shard.get_footprints_by_filters(
+            username, location_name, location_types, created_after, created_before, viewer_id, bbox))
+        return self._merge(results, key=lambda fp: fp['created_at_raw'])
+
+    def _scatter_page(self, fetch, cursor, page_size, fields):
+        """
+        游标分页的归并: 每个分片用同一个游标取一页 (排序键是全局的值), 归并后
+        向后翻页取前 page_size 条, 向前翻页取后 page_size 条
+        """
+        page_size = clamp_page_size(page_size)
+        forward = True
+        if cursor:
+            forward = decode_cursor(cursor)[1] == 'next'
+        pages = self._scatter(lambda shard: fetch(shard, cursor, page_size))
+
+        def key_of(item):
+            return [item[field] for field in fields]
+
+        merged = self._merge([page['items'] for page in pages], key=key_of)
+        more = len(merged) > page_size
+        if forward:
+            items = merged[:page_size]
+            has_next = more or any(page['next_cursor'] for page in pages)
+            has_prev = cursor is not None
+        else:
+            items = merged[-page_size:]
+            has_next = cursor is not None
+            has_prev = more or any(page['prev_cursor'] for page in pages)
+        return {
+            'items': items,
+            'next_cursor': encode_cursor(key_of(items[-1]), 'next') if items and has_next else None,
+            'prev_cursor': encode_cursor(key_of(items[0]), 'prev') if items and has_prev else None,
+        }
+
+    def get_footprints_page(self, cursor=None, page_size=None, viewer_id=None):
+        return self._scatter_page(
+            lambda shard, cursor, page_size: shard.get_footprints_page(cursor, page_size, viewer_id),
+            cursor, page_size, ['created_at_raw', 'footprint_id'])
+
+    def get_popular_footprints(self, cursor=None, page_size=None):
+        return self._scatter_page(
+            lambda shard, cursor, page_size: shard.get_popular_footprints(cursor, page_size),
+            cursor, page_size, ['hot_score', 'footprint_id'])
+
+    def get_footprints_within(self, latitude, longitude, radius_km, cursor=None, page_size=None,
+                              viewer_id=None):
+        return self._scatter_page(
+            lambda shard, cursor, page_size: shard.get_footprints_within(
+                latitude, longitude, radius_km, cursor, page_size, viewer_id),
+            cursor, page_size, ['created_at_raw', 'footprint_id'])
+
+    def get_feed_page(self, user_id, cursor=None, page_size=None):
+        raise Exception("Feed is not supported in sharded mode")
+
+    def search_footprints(self, keyword, page=1, page_size=None, **filters):
+        """
+        各分片取前 page * page_size 条结果, 按 bm25 (rank) 归并后取第 page 页
+        bm25 使用各分片自己的词频统计, 跨分片的排序是近似的
+        """
+        page = max(1, int(page or 1))
+        page_size = clamp_page_size(page_size)
+        needed = page * page_size + 1
+
+        def fetch(shard):
+            items = []
+            shard_page = 1
+            batch = min(needed, MAX_PAGE_SIZE)
+            while True:
+                result = shard.search_footprints(keyword, shard_page, batch, **filters)
+                items.extend(result['items'])
+                if len(items) >= needed or not result['next_page']:
+                    return items[:needed]
+                shard_page += 1
+
+        merged = self._merge(self._scatter(fetch), key=lambda fp: fp['rank'], reverse=False)
+        return {
+            'items': merged[(page - 1) * page_size:page * page_size],
+            'page': page,
+            'next_page': page + 1 if len(merged) > page * page_size else None,
+            'prev_page': page - 1 if page > 1 else None,
+        }
+
+    ###########################
+    ##      collection       ##
+    ###########################
+
+    def collect_many(self, user_id, footprint_ids):
+        """按分片分组收藏; 各分片分别提交, 跨分片不是原子的. 任一分片失败时返回 None"""
+        groups = self._group_by_shard(footprint_ids)
+        counts = self._scatter(lambda group: group[0].collect_many(user_id, group[1]), groups)
+        return None if None in counts else sum(counts)
+
+    def uncollect_many(self, user_id, footprint_ids):
+        groups = self._group_by_shard(footprint_ids)
+        return sum(self._scatter(lambda group: group[0].uncollect_many(user_id, group[1]), groups))
+
+    def is_collected_many(self, user_id, footprint_ids):
+        groups = self._group_by_shard(footprint_ids)
+        return set().union(*self._scatter(lambda group: group[0].is_collected_many(user_id, group[1]), groups))
+
+    def get_collections_by_user(self, user_id):
+        results = self._scatter(lambda shard: shard.get_collections_by_user(user_id))
+        return self._merge(results, key=lambda fp: fp['collected_at'])
+
+    ###########################
+    ##     maintenance       ##
+    ###########################
+
+    def _all(self):
+        return [self.catalog] + self.shards
+
+    def migrate(self):
+        applied = self._scatter(lambda db: db.migrate(), self._all())
+        for k, shard in enumerate(self.shards):
+            self._prepare_shard(k, shard)
+        return applied
+
+    def reconcile_counters(self, fix=True):
+        """检查 (修正) 所有数据库的计数列, 返回 {'表.列': 不一致的行数之和}"""
+        report = {}
+        for result in self._scatter(lambda db: db.reconcile_counters(fix), self._all()):
+            for counter, drifted in result.items():
+                report[counter] = report.get(counter, 0) + drifted
+        return report
+
+    def table_state(self, tables):
+        """各数据库的表版本合在一起, 任一数据库的写入都会改变结果"""
+        versions = {}
+        updated = 0
+        for name, db in [('catalog', self.catalog)] + [(f'shard_{k}', s) for k, s in enumerate(self.shards)]:
+            db_versions, db_updated = db.table_state(tables)
+            versions.update({f'{name}.{table}': version for table, version in db_versions.items()})
+            updated = max(updated, db_updated)
+        return versions, updated
+
+    def add_change_listener(self, listener):
+        for db in self._all():
+            db.add_change_listener(listener)
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def write_stats(self):
+        return _sum_stats([db.write_stats() for db in self._all()])
+
+    def cache_stats(self):
+        return _sum_stats([db.cache_stats() for db in self._all()])
+
+    def replica_stats(self):
+        return None
+
+    def after_fork(self):
+        """在 fork 出的子进程中调用 (见 DatabaseManager.after_fork), 线程池同样重新创建"""
+        for db in self._all():
+            db.after_fork()
+        self.executor = ThreadPoolExecutor(max_workers=self.shard_count,
+                                           thread_name_prefix='sqlite-shard')
+
+    def close(self):
+        self.executor.shutdown()
+        for db in self._all():
+            db.close()
+
+
+###########################
+##         split         ##
+###########################
+
+def split(source_path, directory, shards):
+    """把单个数据库拆分到 directory 下的 shards 个分片 (覆盖已有文件), 返回 ShardedDatabaseManager"""
+    source = DatabaseManager(source_path, feed_mode=None)
+    source.migrate()
+    source.close()
+    db = ShardedDatabaseManager(directory, shards, initial=True, cache_size=0)
+    copies = [(db.catalog, [
+        ('users', 'user_id, username, email', ''),
+        ('locations', 'location_id, name, address, type, latitude, longitude', ''),
+        ('trips', 'trip_id, start_day, end_day', ''),
+        ('trip_participants', 'user_id, trip_id', ''),
+        ('trip_locations', 'location_id, trip_id', ''),
+    ])]
+    for k, shard in enumerate(db.shards):
+        base = k * SHARD_SPAN
+        owned = f'footprint_id IN (SELECT footprint_id FROM source.footprints WHERE user_id % {shards} = {k})'
+        copies.append((shard, [
+            ('users', 'user_id, username, email', ''),
+            ('locations', 'location_id, name, address, type, latitude, longitude', ''),
+            ('footprints', 'footprint_id, title, content, image_url, created_at, user_id, location_id',
+             f'WHERE user_id % {shards} = {k}',
+             f'footprint_id + {base}, title, content, image_url, created_at, user_id, location_id'),
+            ('comments', 'comment_id, content, created_at, user_id, footprint_id, parent_comment_id',
+             f'WHERE {owned} ORDER BY comment_id',
+             f'comment_id + {base}, content, created_at, user_id, footprint_id + {base}, '
+             f'parent_comment_id + {base}'),
+            ('collections', 'user_id, footprint_id, created_at', f'WHERE {owned}',
+             f'user_id, footprint_id + {base}, created_at'),
+        ]))
+    for target, tables in copies:
+        with target.pool.connection() as conn:
+            conn.execute('ATTACH DATABASE ? AS source', (source_path,))
+            try:
+                conn.execute('BEGIN')
+                conn.execute('PRAGMA defer_foreign_keys = ON')
+                for table, columns, where, *select in tables:
+                    select = select[0] if select else columns
+                    conn.execute(f'INSERT INTO main.{table} ({columns}) '
+                                 f'SELECT {select} FROM source.{table} {where}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute('DETACH DATABASE source')
+    # 计数列和行程摘要在复制时由触发器维护, 最后再统一核对一次
+    db.reconcile_counters()
+    db.rebuild_trip_summaries()
+    return db
+
+
+###########################
+##       benchmark       ##
+###########################
+
+def bench_writes(directory, shards, threads, seconds):
+    """threads 个线程持续发布足迹, 返回每秒写入数"""
+    db = ShardedDatabaseManager(directory, shards, initial=True, cache_size=0,
+                                pool_size=threads, busy_timeout=30.0, concurrent=True)
+    location_id = db.create_location('Bench Place', 'Nowhere', 'attraction')
+    for i in range(threads):
+        db.create_user(f'bench_{i}', f'bench_{i}@example.com')
+    user_ids = [row[0] for row in db._global_rows('users')]
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def work(i):
+        user_id = user_ids[i % len(user_ids)]
+        while time.perf_counter() < deadline:
+            if db.create_footprint(user_id, 'bench', 'x' * 200, location_id):
+                counts[i] += 1
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    db.close()
+    return sum(counts) / elapsed
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='MyGO sharded storage')
+    sub = parser.add_subparsers(dest='command', required=True)
+    split_parser = sub.add_parser('split', help='split a single database into shards')
+    split_parser.add_argument('db_path', nargs='?', default=DB_NAME)
+    split_parser.add_argument('directory', nargs='?', default='shards')
+    split_parser.add_argument('--shards', type=int, default=4)
+    bench_parser = sub.add_parser('bench-writes', help='compare footprint write throughput with 1 and N shards')
+    bench_parser.add_argument('--shards', type=int, default=4)
+    bench_parser.add_argument('--threads', type=int, default=8)
+    bench_parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        db = split(args.db_path, args.directory, args.shards)
+        for k, shard in enumerate(db.shards):
+            with shard.pool.connection() as conn:
+                count = conn.execute('SELECT COUNT(*) FROM footprints').fetchone()[0]
+            print(f"  shard_{k}.db  {count} footprint(s)")
+        db.close()
+    else:
+        for shards in sorted({1, args.shards}):
+            with tempfile.TemporaryDirectory() as directory:
+                rate = bench_writes(directory, shards, args.threads, args.seconds)
+            print(f"  {shards} shard(s), {args.threads} thread(s): {rate:,.0f} footprints/s")
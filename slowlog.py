@@ -0,0 +1,239 @@
+"""
+慢查询日志
+
+    slowlog.init_app(app, db_manager)       # SLOW_QUERY_LOG / SLOW_QUERY_MS, 默认不启用
+    python slowlog.py summarize slow_queries.jsonl [--top 20]
+
+超过阈值的语句写入 JSONL, 每行包括规范化后的 SQL 及其指纹、参数类型、耗时、行数、
+调用的 DatabaseManager 方法、路由, 以及当时的 EXPLAIN QUERY PLAN
+summarize 按指纹汇总, 并标出含全表扫描的查询
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from migrations import full_scans
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize(sql):
+    """去掉多余空白"""
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """常量替换为 ?, IN (?, ?, ...) 合并为 (?+), 相同结构的查询得到相同指纹"""
+    text = _STRING.sub('?', normalize(sql))
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER_LIST.sub('(?+)', text)
+    return hashlib.sha1(text.lower().encode()).hexdigest()[:12], text
+
+
+def param_shapes(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def _caller_method():
+    """调用栈中最近的 DatabaseManager 公开方法"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if (os.path.basename(code.co_filename) == 'models.py'
+                and not code.co_name.startswith(('_', '<')) and code.co_name != 'wrapper'
+                and 'self' in frame.f_locals):
+            return code.co_name
+        frame = frame.f_back
+    return None
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    return f'{request.method} {request.endpoint or request.path}'
+
+
+class SlowQueryLog:
+    """
+    连接池的语句回调: 耗时超过 threshold_ms 的语句追加到 path
+    explain=False 时不做 EXPLAIN QUERY PLAN
+    max_bytes: 文件超过该大小时轮转为 path.1 ... path.<backups>, 为空时不轮转
+    """
+
+    def __init__(self, path, threshold_ms=100.0, explain=True, max_bytes=None, backups=3):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self.logged = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _rotate(self):
+        """path -> path.1 -> path.2 ..., 超出 backups 的最旧文件被覆盖"""
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{n}'):
+                os.replace(f'{self.path}.{n}', f'{self.path}.{n + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def _plan(self, conn, sql, params):
+        if not self.explain or params is None:
+            return None
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            # 普通游标, 不再触发语句回调
+            cursor = conn.cursor(sqlite3.Cursor)
+            return [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        except sqlite3.Error as e:
+            return [f'EXPLAIN failed: {e}']
+
+    def __call__(self, conn, sql, params, seconds, rows):
+        if seconds < self.threshold:
+            return
+        fp, text = fingerprint(sql)
+        plan = self._plan(conn, sql, params)
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'fingerprint': fp,
+            'sql': text,
+            'params': param_shapes(params),
+            'ms': round(seconds * 1000, 3),
+            'rows': rows,
+            'method': _caller_method(),
+            'route': _current_route(),
+            'thread': threading.current_thread().name,
+            'plan': plan,
+            'full_scans': full_scans(plan, sql) if plan else [],
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            if self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.logged += 1
+
+
+def init_app(app, db):
+    """
+    按 app.config 中的 SLOW_QUERY_LOG (路径, 为空时不启用) 和 SLOW_QUERY_MS 登记慢查询日志
+    SLOW_QUERY_LOG_MAX_BYTES / SLOW_QUERY_LOG_BACKUPS 控制轮转
+    """
+    path = app.config.get('SLOW_QUERY_LOG')
+    if not path:
+        return None
+    log = SlowQueryLog(path, app.config.get('SLOW_QUERY_MS', 100.0),
+                       app.config.get('SLOW_QUERY_EXPLAIN', True),
+                       max_bytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES'),
+                       backups=app.config.get('SLOW_QUERY_LOG_BACKUPS', 3))
+    db.pool.add_observer(log)
+    app.extensions['mygo_slowlog'] = log
+    return log
+
+
+###########################
+##       summarize       ##
+###########################
+
+def read_entries(path):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"skipping malformed line {n}", file=sys.stderr)
+    return entries
+
+
+def summarize(entries):
+    """按指纹汇总, 按总耗时从大到小排序"""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'methods': set(),
+            'routes': set(),
+            'plan': entry.get('plan'),
+            'full_scans': set(),
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        if entry.get('method'):
+            group['methods'].add(entry['method'])
+        if entry.get('route'):
+            group['routes'].add(entry['route'])
+        group['full_scans'].update(entry.get('full_scans') or [])
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+        for key in ('methods', 'routes', 'full_scans'):
+            group[key] = sorted(group[key])
+    return sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)
+
+
+def print_summary(groups, top=20):
+    for group in groups[:top]:
+        flag = '  <-- full scan' if group['full_scans'] else ''
+        print(f"== {group['fingerprint']}  x{group['count']}  total {group['total_ms']:.1f} ms  "
+              f"avg {group['avg_ms']:.1f} ms  max {group['max_ms']:.1f} ms{flag}")
+        print(f"   {group['sql'][:200]}")
+        print(f"   methods: {', '.join(group['methods']) or '-'}   routes: {', '.join(group['routes']) or '-'}")
+        for detail in group['full_scans']:
+            print(f"     {detail}")
+    scans = sum(1 for g in groups if g['full_scans'])
+    print(f"{len(groups)} distinct slow queries, {scans} with full table scans")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='slow query log tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    summarize_parser = sub.add_parser('summarize')
+    summarize_parser.add_argument('path')
+    summarize_parser.add_argument('--top', type=int, default=20)
+    summarize_parser.add_argument('--json', action='store_true', help='print the groups as JSON')
+    args = parser.parse_args()
+
+    groups = summarize(read_entries(args.path))
+    if args.json:
+        print(json.dumps(groups, indent=2, ensure_ascii=False))
+    else:
+        print_summary(groups, args.top)
@@ -0,0 +1,93 @@
+"""create_app 的各个配置与启动时的数据库准备"""
+import pytest
+
+import bootstrap
+import config
+from models import DatabaseManager
+from mygo import create_app
+
+
+def profile(base, tmp_path, **overrides):
+    """把数据库文件放到 tmp_path 下的配置类"""
+    values = {'DATABASE_PATH': str(tmp_path / 'app.db')}
+    if base.__dict__.get('DB_TEMPLATE') or overrides.get('DB_TEMPLATE'):
+        values['DB_TEMPLATE'] = str(tmp_path / 'template.db')
+    values.update(overrides)
+    return type(base.__name__, (base,), values)
+
+
+def start(config_class):
+    app = create_app(config_class)
+    db = app.extensions['mygo_db']
+    response = app.test_client().get('/')
+    return app, db, response
+
+
+def user_count(path):
+    db = DatabaseManager(path, auto_migrate=False)
+    try:
+        with db.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('name', sorted(config.CONFIGS))
+def test_every_profile_starts(name, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    base = config.CONFIGS[name]
+    assert not base.SLOW_QUERY_LOG
+    _, db, response = start(profile(base, tmp_path))
+    try:
+        assert response.status_code == 200
+    finally:
+        db.close()
+    # 示例数据: development 直接插入, testing 来自自动生成的模板, production 为空库
+    expected = 0 if name == 'production' else 15
+    assert user_count(str(tmp_path / 'app.db')) == expected
+    assert (tmp_path / 'template.db').exists() == (name == 'testing')
+
+
+def test_second_start_keeps_rows(tmp_path):
+    settings = profile(config.DevelopmentConfig, tmp_path)
+    _, db, _ = start(settings)
+    db.create_user('kept', 'kept@example.com')
+    db.close()
+
+    _, db, response = start(settings)
+    try:
+        assert response.status_code == 200
+        # 已有用户: 不清空, 也不再插入示例数据
+        assert [user['username'] for user in db.get_all_users()].count('kept') == 1
+        assert len(db.get_all_users()) == 16
+    finally:
+        db.close()
+
+
+def test_prepare_seeds_only_empty_database(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'seed.db'))
+    try:
+        assert bootstrap.prepare(db, fake_data=True) is True
+        assert bootstrap.prepare(db, fake_data=True) is False
+        assert len(db.get_all_users()) == 15
+    finally:
+        db.close()
+
+
+def test_template_is_copied_and_reset(tmp_path):
+    template = bootstrap.build_template(str(tmp_path / 'template.db'))
+    settings = profile(config.ProductionConfig, tmp_path, DB_TEMPLATE=template)
+    _, db, _ = start(settings)
+    db.create_user('extra', 'extra@example.com')
+    db.close()
+    assert user_count(str(tmp_path / 'app.db')) == 16
+    # 模板本身不受影响
+    assert user_count(template) == 15
+
+    # 文件已存在时不再复制; DB_RESET 时重新从模板得到干净的数据库
+    _, db, _ = start(settings)
+    db.close()
+    assert user_count(str(tmp_path / 'app.db')) == 16
+    _, db, _ = start(profile(config.ProductionConfig, tmp_path, DB_TEMPLATE=template, DB_RESET=True))
+    db.close()
+    assert user_count(str(tmp_path / 'app.db')) == 15
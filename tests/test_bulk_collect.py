@@ -0,0 +1,59 @@
+"""批量收藏/取消收藏: 一个事务, 中途失败全部回滚"""
+import pytest
+
+from models import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'collect.db'), initial=True)
+    for name in ('alice', 'bob'):
+        db.create_user(name, f'{name}@example.com')
+    db.create_location('Tower', 'Paris', 'attraction')
+    for k in range(1, 6):
+        db.create_footprint(1, f'fp {k}', 'text', 1)
+    yield db
+    db.close()
+
+
+def collected(db, user_id=2):
+    return db.is_collected_many(user_id, range(1, 10))
+
+
+def collection_counts(db):
+    with db.pool.connection() as conn:
+        return [row[0] for row in conn.execute('SELECT collection_count FROM footprints ORDER BY footprint_id')]
+
+
+def test_collect_many_skips_existing_and_missing(db):
+    assert db.create_collection(2, 1) is True
+    # 1 已收藏, 99 不存在, 3 重复出现
+    assert db.collect_many(2, [1, 3, 3, 4, 99]) == 2
+    assert collected(db) == {1, 3, 4}
+    assert collection_counts(db) == [1, 0, 1, 1, 0]
+
+    assert db.uncollect_many(2, [1, 4, 5]) == 2
+    assert collected(db) == {3}
+    assert collection_counts(db) == [0, 0, 1, 0, 0]
+
+
+def test_partial_failure_rolls_back(db):
+    db.create_collection(2, 1)
+    # 第三条足迹的插入失败 (模拟磁盘错误等), 前面已插入的行也要回滚
+    with db.pool.connection() as conn:
+        conn.execute('''
+            CREATE TRIGGER fail_on_third BEFORE INSERT ON collections
+            WHEN NEW.footprint_id = 3
+            BEGIN SELECT RAISE(ABORT, 'simulated failure'); END''')
+    versions = db.cache.table_state(['collections'])[0]
+
+    assert db.collect_many(2, [2, 3, 4]) is None
+    assert collected(db) == {1}
+    assert collection_counts(db) == [1, 0, 0, 0, 0]
+    assert db.cache.table_state(['collections'])[0] == versions
+
+
+def test_unknown_user_collects_nothing(db):
+    assert db.collect_many(42, [1, 2]) is None
+    assert collection_counts(db) == [0] * 5
+    assert db.collect_many(2, []) == 0
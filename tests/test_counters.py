@@ -0,0 +1,94 @@
+"""触发器维护的计数列、热度排序与 reconcile"""
+import pytest
+
+from models import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'counters.db'), initial=True, cache_size=0)
+    for name in ('alice', 'bob', 'carol'):
+        db.create_user(name, f'{name}@example.com')
+    db.create_location('Tower', 'Paris', 'attraction')
+    db.create_location('Harbour', 'Oslo', 'attraction')
+    yield db
+    db.close()
+
+
+def counters(db, sql, *params):
+    with db.pool.connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def test_counters_follow_writes(db):
+    first = db.create_footprint(1, 'first', 'text', 1)
+    second = db.create_footprint(1, 'second', 'text', 1)
+    db.create_footprint(2, 'third', 'text', 2)
+    top = db.create_comment(2, first, 'nice')
+    db.create_comment(3, first, 'reply', parent_id=top)
+    db.create_comment(1, first, 'thanks', parent_id=top)
+    db.create_collection(2, first)
+    db.create_collection(3, first)
+    db.create_collection(3, second)
+
+    assert counters(db, 'SELECT comment_count, collection_count FROM footprints WHERE footprint_id = ?',
+                    first) == (3, 2)
+    assert counters(db, 'SELECT comment_count, collection_count FROM footprints WHERE footprint_id = ?',
+                    second) == (0, 1)
+    assert counters(db, 'SELECT footprint_count FROM users WHERE user_id = 1') == (2,)
+    assert counters(db, 'SELECT reply_count FROM comments WHERE comment_id = ?', top) == (2,)
+    assert counters(db, 'SELECT footprint_count FROM locations WHERE location_id = 1') == (2,)
+
+    # 改地点: 两个地点的计数一减一加; 取消收藏: 收藏数减一
+    db.update_footprint(second, 'second', 'text', 2)
+    db.delete_collection(3, first)
+    assert counters(db, 'SELECT footprint_count FROM locations WHERE location_id = 1') == (1,)
+    assert counters(db, 'SELECT footprint_count FROM locations WHERE location_id = 2') == (2,)
+    assert counters(db, 'SELECT collection_count FROM footprints WHERE footprint_id = ?', first) == (1,)
+    assert not any(db.reconcile_counters(fix=False).values())
+
+
+def test_popular_order_follows_interactions(db):
+    quiet = db.create_footprint(1, 'quiet', 'text', 1)
+    busy = db.create_footprint(1, 'busy', 'text', 1)
+    collected = db.create_footprint(1, 'collected', 'text', 1)
+    with db.pool.connection() as conn:
+        conn.execute('UPDATE footprints SET created_at = 1700000000')
+    db.create_comment(2, busy, 'one')
+    db.create_comment(3, busy, 'two')
+    db.create_comment(2, busy, 'three')
+    db.create_collection(2, collected)
+    db.create_collection(3, collected)
+
+    order = [fp['footprint_id'] for fp in db.get_popular_footprints()['items']]
+    # 收藏按 2 计: collected = 4, busy = 3, quiet = 0
+    assert order == [collected, busy, quiet]
+
+
+def test_reconcile_repairs_drift(db):
+    footprint_id = db.create_footprint(1, 'fp', 'text', 1)
+    comment_id = db.create_comment(2, footprint_id, 'nice')
+    db.create_comment(3, footprint_id, 'reply', parent_id=comment_id)
+    db.create_collection(2, footprint_id)
+    # 绕过触发器的修改 (如批量导入) 造成计数不一致
+    with db.pool.connection() as conn:
+        conn.execute('UPDATE footprints SET comment_count = 7, collection_count = 0')
+        conn.execute('UPDATE users SET footprint_count = 5 WHERE user_id = 2')
+        conn.execute('UPDATE comments SET reply_count = 0')
+
+    report = db.reconcile_counters(fix=False)
+    assert report == {
+        'footprints.comment_count': 1,
+        'footprints.collection_count': 1,
+        'users.footprint_count': 1,
+        'locations.footprint_count': 0,
+        'comments.reply_count': 1,
+    }
+    # dry run 不修改
+    assert db.reconcile_counters(fix=False) == report
+
+    assert db.reconcile_counters(fix=True) == report
+    assert not any(db.reconcile_counters(fix=False).values())
+    assert counters(db, 'SELECT comment_count, collection_count FROM footprints') == (2, 1)
+    assert counters(db, 'SELECT footprint_count FROM users WHERE user_id = 2') == (0,)
+    assert counters(db, 'SELECT reply_count FROM comments WHERE comment_id = ?', comment_id) == (1,)
@@ -0,0 +1,57 @@
+"""删除有足迹、评论和时间线条目的用户"""
+import pytest
+
+from models import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'users.db'), initial=True)
+    yield db
+    db.close()
+
+
+def test_delete_user_with_fake_data(db):
+    db.insert_fake_data()
+    db.create_footprint(1, 'mine', 'text', 1)
+    assert db.delete_user(1) is True
+    assert all(user['user_id'] != 1 for user in db.get_all_users())
+
+
+def test_delete_user_removes_dependent_rows(db):
+    for name in ('alice', 'bob'):
+        db.create_user(name, f'{name}@example.com')
+    location_id = db.create_location('Tower', 'Paris', 'attraction')
+    db.create_trip([1, 2], '2024-05-01', '2024-05-03', [location_id])
+    mine = db.create_footprint(1, 'lighthouse', 'sunset at the lighthouse', location_id)
+    theirs = db.create_footprint(2, 'harbour', 'boats', location_id)
+    db.create_comment(2, mine, 'nice')
+    db.create_collection(2, mine)
+    db.create_comment(1, theirs, 'great')
+    db.create_collection(1, theirs)
+    # 同步展开: 两人的足迹都在对方的时间线里
+    assert [item['footprint_id'] for item in db.get_feed_page(2)['items']] == [mine]
+
+    assert db.delete_user(1) is True
+    assert db.delete_user(1) is False
+
+    with db.pool.connection() as conn:
+        def count(sql, *params):
+            return conn.execute(sql, params).fetchone()[0]
+
+        assert count('SELECT COUNT(*) FROM footprints WHERE user_id = 1') == 0
+        assert count('SELECT COUNT(*) FROM comments WHERE user_id = 1 OR footprint_id = ?', mine) == 0
+        assert count('SELECT COUNT(*) FROM collections WHERE user_id = 1 OR footprint_id = ?', mine) == 0
+        assert count('SELECT COUNT(*) FROM feed_items WHERE user_id = 1 OR footprint_id = ?', mine) == 0
+        assert count('SELECT COUNT(*) FROM feed_outbox') == 0
+        assert count('SELECT COUNT(*) FROM trip_participants WHERE user_id = 1') == 0
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+    assert db.search_footprints('lighthouse')['items'] == []
+    assert db.get_feed_page(2)['items'] == []
+    # 计数列由触发器同步更新, reconcile 没有需要修正的行
+    assert not any(db.reconcile_counters(fix=False).values())
+    detail = db.get_footprint_detail(theirs)
+    assert (detail['comment_count'], detail['collection_count']) == (0, 0)
+    with db.pool.connection() as conn:
+        assert conn.execute('SELECT footprint_count FROM locations WHERE location_id = ?',
+                            (location_id,)).fetchone()[0] == 1
@@ -0,0 +1,74 @@
+"""迁移 5: 文本时间戳转成 UTC 秒数"""
+import calendar
+import sqlite3
+from datetime import datetime
+
+import migrations
+from models import DatabaseManager
+
+STAMPS = ['2024-05-01 12:30:00', '2024-05-01 23:59:59', '2024-05-02 00:00:00']
+
+
+def epoch(text):
+    return calendar.timegm(datetime.strptime(text, '%Y-%m-%d %H:%M:%S').timetuple())
+
+
+def old_database(path):
+    """迁移到版本 4 并写入文本时间戳, 即迁移 5 之前的数据库"""
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, target=4)
+    assert migrations.current_version(conn) == 4
+    conn.execute("INSERT INTO users (username, email) VALUES ('alice', 'alice@example.com')")
+    conn.execute("INSERT INTO locations (name, address, type) VALUES ('Tower', 'Paris', 'attraction')")
+    for n, stamp in enumerate(STAMPS, 1):
+        conn.execute('INSERT INTO footprints (title, content, created_at, user_id, location_id) '
+                     'VALUES (?, ?, ?, 1, 1)', (f'fp {n}', 'text', stamp))
+        conn.execute('INSERT INTO comments (content, created_at, user_id, footprint_id) VALUES (?, ?, 1, ?)',
+                     ('nice', stamp, n))
+        conn.execute('INSERT INTO collections (user_id, footprint_id, created_at) VALUES (1, ?, ?)', (n, stamp))
+    conn.commit()
+    conn.close()
+
+
+def test_text_timestamps_become_epoch(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_database(path)
+
+    db = DatabaseManager(path)
+    try:
+        db.migrate()
+        with db.pool.connection() as conn:
+            assert migrations.current_version(conn) == migrations.LATEST_VERSION
+            for table in ('footprints', 'comments', 'collections'):
+                rows = conn.execute(f'SELECT typeof(created_at), created_at FROM {table} ORDER BY rowid').fetchall()
+                assert rows == [('integer', epoch(stamp)) for stamp in STAMPS], table
+
+        # 显示格式不变, 按时间筛选走整数比较
+        detail = db.get_footprint_detail(1)
+        assert detail['created_at'] == '2024-05-01 12:30'
+        found = db.get_footprints_by_filters(created_after='2024-05-01T23:00:00')
+        assert sorted(fp['footprint_id'] for fp in found) == [2, 3]
+        # 新写入的行同样是整数
+        db.create_footprint(1, 'new', 'text', 1)
+        with db.pool.connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM footprints WHERE typeof(created_at) != 'integer'"
+                                ).fetchone()[0] == 0
+    finally:
+        db.close()
+
+
+def test_migration_is_idempotent(tmp_path):
+    path = str(tmp_path / 'old.db')
+    old_database(path)
+    conn = sqlite3.connect(path)
+    try:
+        assert migrations.migrate(conn, target=5) == [5]
+        before = conn.execute('SELECT created_at FROM footprints ORDER BY rowid').fetchall()
+        # 已是整数的行不会被再次转换
+        steps = {version: steps for version, _, steps in migrations.MIGRATIONS}[5]
+        for step in steps:
+            conn.execute(step)
+        assert conn.execute('SELECT created_at FROM footprints ORDER BY rowid').fetchall() == before
+        assert migrations.migrate(conn, target=5) == []
+    finally:
+        conn.close()
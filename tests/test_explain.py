@@ -0,0 +1,39 @@
+"""explain 报告中的全表扫描判定"""
+from migrations import full_scans, internal_statement
+
+
+def test_subqueries_and_ctes_are_not_full_scans():
+    sql = '''WITH RECURSIVE roots AS (SELECT comment_id FROM (SELECT comment_id FROM comments)),
+             tree(comment_id) AS (SELECT comment_id FROM roots UNION ALL
+                                  SELECT c.comment_id FROM tree t JOIN comments c ON c.parent_comment_id = t.comment_id)
+             SELECT * FROM tree t JOIN comments c ON c.comment_id = t.comment_id'''
+    plan = [
+        'MATERIALIZE tree',
+        'SETUP',
+        'CO-ROUTINE roots',
+        'CO-ROUTINE (subquery-1)',
+        'SEARCH comments USING COVERING INDEX idx_comments_thread (footprint_id=? AND parent_comment_id=?)',
+        'SCAN (subquery-1)',
+        'SCAN roots',
+        'RECURSIVE STEP',
+        'SCAN t',
+        'SEARCH c USING INTEGER PRIMARY KEY (rowid=?)',
+        'SCAN t',
+    ]
+    assert full_scans(plan, sql) == []
+
+
+def test_table_scans_are_reported():
+    plan = [
+        'SCAN l',
+        'SCAN location_rtree VIRTUAL TABLE INDEX 2:D0B1D2B3',
+        'SCAN CONSTANT ROW',
+        'SEARCH u USING INTEGER PRIMARY KEY (rowid=?)',
+    ]
+    assert full_scans(plan, 'SELECT * FROM locations l JOIN location_rtree r JOIN users u') == ['SCAN l']
+
+
+def test_extension_statements_are_internal():
+    assert internal_statement("SELECT stat FROM 'main'.sqlite_stat1 WHERE tbl = 'trip_rtree_rowid'")
+    assert internal_statement("SELECT length(data) FROM 'main'.'trip_rtree_node' WHERE nodeno = 1")
+    assert not internal_statement('SELECT user_id, username, email FROM users')
@@ -0,0 +1,33 @@
+"""后台展开线程的空轮询不进入写方法"""
+import time
+
+import feed
+from models import DatabaseManager
+
+
+def test_idle_worker_does_not_write(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'feed.db'), initial=True, cache_size=0, feed_mode=None)
+    db.create_user('alice', 'alice@example.com')
+    db.create_user('bob', 'bob@example.com')
+    location_id = db.create_location('Tower', 'Paris', 'attraction')
+    db.create_trip([1, 2], '2024-05-01', '2024-05-03', [location_id])
+    writes = []
+    process = db.process_feed_outbox
+    db.process_feed_outbox = lambda: writes.append(1) or process()
+
+    worker = feed.FeedWorker(db, interval=0.01)
+    try:
+        time.sleep(0.2)
+        assert writes == []
+
+        db.create_footprint(1, 'hello', 'text', location_id)
+        worker.notify()
+        deadline = time.time() + 5
+        while worker.processed < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert worker.processed == 1
+        assert not db.feed_outbox_pending()
+        assert db.get_feed_page(2)['items'][0]['title'] == 'hello'
+    finally:
+        worker.stop()
+        db.close()
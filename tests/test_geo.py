@@ -0,0 +1,125 @@
+"""R*Tree 地理查询与暴力计算 (逐个地点算大圆距离) 的结果一致"""
+import random
+
+import pytest
+
+from models import DatabaseManager, haversine_km
+
+# (纬度, 经度): 普通城市、180° 经线两侧、靠近北极
+CENTERS = [(48.86, 2.35), (-17.7, 179.9), (-17.7, -179.9), (88.5, 40.0)]
+TYPES = ['attraction', 'restaurant', 'transport']
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    db = DatabaseManager(str(tmp_path_factory.mktemp('geo') / 'geo.db'), initial=True, cache_size=0)
+    rng = random.Random(24)
+    user_id = db.create_user('alice', 'alice@example.com')
+    for k in range(400):
+        lat, lon = rng.choice(CENTERS)
+        lat = max(-90.0, min(90.0, lat + rng.uniform(-1.5, 1.5)))
+        lon = (lon + rng.uniform(-1.5, 1.5) + 540) % 360 - 180
+        location_id = db.create_location(f'place {k}', 'somewhere', rng.choice(TYPES), lat, lon)
+        for n in range(rng.randint(0, 2)):
+            db.create_footprint(user_id, f'fp {k}-{n}', 'text', location_id)
+    # 没有坐标的地点不参与地理查询
+    db.create_location('nowhere', 'unknown', 'attraction')
+    yield db
+    db.close()
+
+
+def all_locations(db):
+    with db.pool.connection() as conn:
+        return conn.execute('SELECT location_id, latitude, longitude, type FROM locations '
+                            'WHERE latitude IS NOT NULL').fetchall()
+
+
+def brute_within(db, lat, lon, radius_km, location_types=None):
+    """由近到远的 location_id 列表"""
+    found = []
+    for location_id, la, lo, location_type in all_locations(db):
+        if location_types and location_type not in location_types:
+            continue
+        distance = haversine_km(lat, lon, la, lo)
+        if distance <= radius_km:
+            found.append((distance, location_id))
+    return [location_id for _, location_id in sorted(found)]
+
+
+QUERIES = [
+    (48.86, 2.35, 50), (48.86, 2.35, 120), (-17.7, 179.95, 80),
+    (-17.7, -179.99, 150), (89.9, -100.0, 200), (0.0, 0.0, 100),
+]
+
+
+@pytest.mark.parametrize('lat, lon, radius_km', QUERIES)
+def test_within_matches_brute_force(db, lat, lon, radius_km):
+    found = db.get_locations_within(lat, lon, radius_km)
+    assert [location['location_id'] for location in found] == brute_within(db, lat, lon, radius_km)
+    for location in found:
+        assert location['distance_km'] == pytest.approx(
+            haversine_km(lat, lon, location['latitude'], location['longitude']))
+    typed = db.get_locations_within(lat, lon, radius_km, location_types=['transport'])
+    assert [location['location_id'] for location in typed] == brute_within(db, lat, lon, radius_km, ['transport'])
+
+
+@pytest.mark.parametrize('lat, lon, k', [(48.86, 2.35, 5), (-17.7, 180.0, 30), (10.0, 100.0, 7), (89.0, 0.0, 12)])
+def test_nearest_matches_brute_force(db, lat, lon, k):
+    found = db.get_nearest_locations(lat, lon, k=k)
+    assert [location['location_id'] for location in found] == brute_within(db, lat, lon, 20040)[:k]
+    # 限制最大距离时可能不足 k 个
+    limited = db.get_nearest_locations(lat, lon, k=k, max_distance_km=60)
+    assert [location['location_id'] for location in limited] == brute_within(db, lat, lon, 60)[:k]
+
+
+@pytest.mark.parametrize('box', [
+    (47.5, 1.0, 50.0, 3.5),
+    (-19.0, 179.0, -16.0, -179.0),  # 跨越 180° 经线
+    (87.0, -180.0, 90.0, 180.0),
+])
+def test_bbox_matches_brute_force(db, box):
+    min_lat, min_lon, max_lat, max_lon = box
+
+    def inside(lat, lon):
+        if not min_lat <= lat <= max_lat:
+            return False
+        if min_lon <= max_lon:
+            return min_lon <= lon <= max_lon
+        return lon >= min_lon or lon <= max_lon
+
+    expected = {location_id for location_id, lat, lon, _ in all_locations(db) if inside(lat, lon)}
+    found = db.get_locations_in_bbox(*box)
+    assert {location['location_id'] for location in found} == expected
+    assert len(found) == len(expected)
+
+
+def test_footprints_within_matches_brute_force(db):
+    lat, lon, radius_km = -17.7, 179.95, 100
+    nearby = set(brute_within(db, lat, lon, radius_km))
+    with db.pool.connection() as conn:
+        expected = {row[0] for row in conn.execute('SELECT footprint_id, location_id FROM footprints')
+                    if row[1] in nearby}
+    seen = []
+    cursor = None
+    while True:
+        page = db.get_footprints_within(lat, lon, radius_km, cursor=cursor, page_size=9)
+        seen += [footprint['footprint_id'] for footprint in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert expected and sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
+
+
+def test_moved_location_follows_rtree(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'move.db'), initial=True, cache_size=0)
+    try:
+        location_id = db.create_location('Tower', 'Paris', 'attraction', 48.8584, 2.2945)
+        assert [location['location_id'] for location in db.get_locations_within(48.86, 2.35, 10)] == [location_id]
+        db.set_location_coordinates(location_id, 59.91, 10.75)
+        assert db.get_locations_within(48.86, 2.35, 10) == []
+        assert [location['location_id'] for location in db.get_locations_within(59.9, 10.7, 10)] == [location_id]
+        db.set_location_coordinates(location_id, None, None)
+        assert db.get_locations_within(59.9, 10.7, 10) == []
+    finally:
+        db.close()
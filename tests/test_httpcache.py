@@ -0,0 +1,92 @@
+"""条件请求: ETag / Last-Modified, 写入后失效"""
+import sqlite3
+
+import pytest
+
+import config
+from mygo import create_app
+
+
+def make_app(tmp_path, **overrides):
+    values = {'DATABASE_PATH': str(tmp_path / 'app.db'), 'DB_LAZY_INIT': False}
+    values.update(overrides)
+    return create_app(type('Settings', (config.DevelopmentConfig,), values))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    yield app
+    app.extensions['mygo_db'].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_unchanged_page_returns_304(client):
+    first = client.get('/user/')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    again = revalidate(client, '/user/', etag)
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+    # 查询字符串不同, ETag 也不同
+    assert client.get('/user/?page_size=5').headers['ETag'] != etag
+
+
+def test_write_invalidates_etag(app, client):
+    db = app.extensions['mygo_db']
+    etag = client.get('/user/').headers['ETag']
+
+    # 与用户列表无关的表的写入不影响
+    db.create_location('Tower', 'Paris', 'attraction')
+    assert revalidate(client, '/user/', etag).status_code == 304
+
+    db.create_user('newcomer', 'newcomer@example.com')
+    changed = revalidate(client, '/user/?page_size=50', etag)
+    response = revalidate(client, '/user/', etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'newcomer' in changed.data
+
+
+def test_write_from_other_connection_invalidates(app, client, tmp_path):
+    db = app.extensions['mygo_db']
+    user_id = db.create_user('author', 'author@example.com')
+    footprint_id = db.create_footprint(user_id, 'Original', 'text', db.create_location('Tower', 'Paris', 'attraction'))
+    url = f'/footprint/{footprint_id}'
+    first = client.get(url)
+    assert first.status_code == 200
+    conn = sqlite3.connect(str(tmp_path / 'app.db'))
+    with conn:
+        conn.execute("UPDATE footprints SET title = 'Retitled' WHERE footprint_id = ?", (footprint_id,))
+    conn.close()
+
+    response = revalidate(client, url, first.headers['ETag'])
+    assert response.status_code == 200
+    assert b'Retitled' in response.data
+
+
+def test_if_modified_since_fallback(client):
+    first = client.get('/user/')
+    response = client.get('/user/', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def test_disabled(tmp_path):
+    app = make_app(tmp_path, HTTP_CACHE_ENABLED=False)
+    try:
+        response = app.test_client().get('/user/')
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+    finally:
+        app.extensions['mygo_db'].close()
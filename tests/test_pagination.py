@@ -0,0 +1,88 @@
+"""游标 (keyset) 分页: 前后翻页、排序键相同的行、非法游标"""
+import pytest
+
+import config
+from models import DatabaseManager, encode_cursor
+from mygo import create_app
+
+FOOTPRINTS = 25
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'pages.db'), initial=True)
+    for k in range(1, 24):
+        db.create_user(f'user{k}', f'user{k}@example.com')
+    location_id = db.create_location('Tower', 'Paris', 'attraction')
+    for k in range(FOOTPRINTS):
+        db.create_footprint(k % 3 + 1, f'fp {k}', 'text', location_id)
+    # 每 5 条足迹的 created_at 相同, 只能靠 footprint_id 区分先后
+    with db.pool.connection() as conn:
+        conn.execute('UPDATE footprints SET created_at = 1700000000 + (footprint_id - 1) / 5')
+    yield db
+    db.close()
+
+
+def expected_footprints(db):
+    with db.pool.connection() as conn:
+        return [row[0] for row in conn.execute(
+            'SELECT footprint_id FROM footprints ORDER BY created_at DESC, footprint_id DESC')]
+
+
+def walk(fetch, page_size):
+    """从第一页按 next_cursor 翻到最后一页, 返回每页的 (页面, 游标)"""
+    pages = []
+    cursor = None
+    while True:
+        page = fetch(cursor, page_size)
+        pages.append((page, cursor))
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_footprint_pages_cover_ties_once(db):
+    pages = walk(db.get_footprints_page, 7)
+    ids = [item['footprint_id'] for page, _ in pages for item in page['items']]
+    assert ids == expected_footprints(db)
+    assert [len(page['items']) for page, _ in pages] == [7, 7, 7, 4]
+    assert pages[0][0]['prev_cursor'] is None
+
+
+def test_prev_cursor_returns_previous_page(db):
+    pages = walk(db.get_footprints_page, 7)
+    for (previous, _), (page, _) in zip(pages, pages[1:]):
+        back = db.get_footprints_page(page['prev_cursor'], 7)
+        assert back['items'] == previous['items']
+        # 回到的那一页可以继续向后翻
+        assert db.get_footprints_page(back['next_cursor'], 7)['items'] == page['items']
+
+
+def test_user_pages_round_trip(db):
+    pages = walk(db.get_users_page, 10)
+    ids = [item['user_id'] for page, _ in pages for item in page['items']]
+    assert ids == list(range(1, 24))
+    last = pages[-1][0]
+    assert db.get_users_page(last['prev_cursor'], 10)['items'] == pages[-2][0]['items']
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    encode_cursor([1]),                          # 键的个数不对
+    encode_cursor([1700000000, 3], 'sideways'),  # 方向不对
+])
+def test_bad_cursor_is_rejected(db, cursor):
+    with pytest.raises(ValueError):
+        db.get_footprints_page(cursor, 7)
+
+
+def test_bad_cursor_route_returns_400(tmp_path):
+    settings = type('Settings', (config.DevelopmentConfig,), {'DATABASE_PATH': str(tmp_path / 'app.db')})
+    app = create_app(settings)
+    try:
+        client = app.test_client()
+        assert client.get('/user/').status_code == 200
+        assert client.get('/user/?cursor=garbage').status_code == 400
+        assert client.get('/footprint/?cursor=garbage').status_code == 400
+    finally:
+        app.extensions['mygo_db'].close()
@@ -0,0 +1,75 @@
+"""读缓存: 本连接的写入和其他连接的提交都使缓存失效"""
+import sqlite3
+
+import pytest
+
+from models import DatabaseManager
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    db = DatabaseManager(path, initial=True, cache_size=0)
+    db.create_user('alice', 'alice@example.com')
+    db.create_location('Tower', 'Paris', 'attraction')
+    db.close()
+    return path
+
+
+@pytest.fixture
+def db(path):
+    db = DatabaseManager(path)
+    yield db
+    db.close()
+
+
+def usernames(db):
+    return sorted(user['username'] for user in db.get_all_users())
+
+
+def test_repeated_reads_hit_the_cache(db):
+    assert usernames(db) == ['alice']
+    assert usernames(db) == ['alice']
+    assert db.cache_stats()['hits'] == 1
+
+
+def test_own_write_invalidates(db):
+    assert usernames(db) == ['alice']
+    db.create_user('bob', 'bob@example.com')
+    assert usernames(db) == ['alice', 'bob']
+
+
+def test_write_from_other_manager_invalidates(db, path):
+    assert usernames(db) == ['alice']
+    other = DatabaseManager(path, cache_size=0)
+    try:
+        other.create_user('carol', 'carol@example.com')
+    finally:
+        other.close()
+    # data_version 变化后读 table_versions, 只有 users 的代数加一
+    assert usernames(db) == ['alice', 'carol']
+    assert db.cache_stats()['hits'] == 0
+
+
+def test_write_from_plain_connection_invalidates_only_changed_tables(db, path):
+    assert usernames(db) == ['alice']
+    assert [l['name'] for l in db.get_all_locations()] == ['Tower']
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE users SET username = 'alicia' WHERE user_id = 1")
+    conn.close()
+
+    assert usernames(db) == ['alicia']
+    # locations 没有变化, 仍然命中
+    hits = db.cache_stats()['hits']
+    assert [l['name'] for l in db.get_all_locations()] == ['Tower']
+    assert db.cache_stats()['hits'] == hits + 1
+
+
+def test_disabled_cache(path):
+    db = DatabaseManager(path, cache_size=0)
+    try:
+        assert db.cache_stats() is None
+        assert usernames(db) == ['alice']
+    finally:
+        db.close()
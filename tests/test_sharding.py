@@ -0,0 +1,99 @@
+"""ShardedDatabaseManager.delete_user 中途失败后的恢复"""
+import pytest
+
+from sharding import ShardedDatabaseManager
+
+
+def open_db(path):
+    return ShardedDatabaseManager(str(path), shards=3, cache_size=0)
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = open_db(tmp_path)
+    for name in ('alice', 'bob', 'carol', 'dave'):
+        db.create_user(name, f'{name}@example.com')
+    location_id = db.create_location('Tower', 'Paris', 'attraction')
+    # 用户 2 / 3 / 4 的足迹分别在分片 2 / 0 / 1; alice (1) 的评论和收藏跟着足迹分布到各分片
+    footprints = [db.create_footprint(user_id, f'fp {user_id}', 'text', location_id) for user_id in (2, 3, 4)]
+    for footprint_id in footprints:
+        db.create_comment(1, footprint_id, 'nice')
+        db.create_collection(1, footprint_id)
+    yield db
+    db.close()
+
+
+def user_rows(db, user_id):
+    """每个数据库中与 user_id 有关的行数"""
+    counts = []
+    for part in db._all():
+        with part.pool.connection() as conn:
+            counts.append(sum(conn.execute(sql, (user_id,)).fetchone()[0] for sql in (
+                'SELECT COUNT(*) FROM users WHERE user_id = ?',
+                'SELECT COUNT(*) FROM footprints WHERE user_id = ?',
+                'SELECT COUNT(*) FROM comments WHERE user_id = ?',
+                'SELECT COUNT(*) FROM collections WHERE user_id = ?',
+            )))
+    return counts
+
+
+def pending(db):
+    with db.catalog.pool.connection() as conn:
+        return [row[0] for row in conn.execute('SELECT user_id FROM pending_user_deletes')]
+
+
+def fail_on(monkeypatch, shard):
+    def broken(user_id):
+        raise Exception("disk I/O error")
+    monkeypatch.setattr(shard, 'delete_user', broken)
+
+
+def test_delete_user_removes_rows_everywhere(sharded):
+    assert all(user_rows(sharded, 1))
+    assert sharded.delete_user(1) is True
+    assert user_rows(sharded, 1) == [0, 0, 0, 0]
+    assert pending(sharded) == []
+    assert sharded.delete_user(1) is False
+
+
+def test_failed_delete_is_recorded_and_recovered(sharded, monkeypatch):
+    fail_on(monkeypatch, sharded.shards[2])
+    with pytest.raises(Exception):
+        sharded.delete_user(1)
+
+    # 用户仍在 catalog 中, 删除记录在 pending_user_deletes
+    assert user_rows(sharded, 1)[0] == 1
+    assert user_rows(sharded, 1)[3] > 0
+    assert pending(sharded) == [1]
+
+    monkeypatch.undo()
+    assert sharded.recover_deletes() == [1]
+    assert user_rows(sharded, 1) == [0, 0, 0, 0]
+    assert pending(sharded) == []
+    # 其他用户不受影响
+    assert all(user_rows(sharded, 2)[i] for i in (0, 3))
+
+
+def test_resync_does_not_resurrect_pending_user(sharded, monkeypatch):
+    fail_on(monkeypatch, sharded.shards[0])
+    with pytest.raises(Exception):
+        sharded.delete_user(1)
+    monkeypatch.undo()
+
+    sharded.resync_global_tables()
+    assert user_rows(sharded, 1) == [0, 0, 0, 0]
+
+
+def test_reopen_finishes_pending_delete(sharded, monkeypatch, tmp_path):
+    fail_on(monkeypatch, sharded.shards[1])
+    with pytest.raises(Exception):
+        sharded.delete_user(1)
+    monkeypatch.undo()
+    sharded.close()
+
+    reopened = open_db(tmp_path)
+    try:
+        assert user_rows(reopened, 1) == [0, 0, 0, 0]
+        assert pending(reopened) == []
+    finally:
+        reopened.close()
@@ -0,0 +1,27 @@
+"""慢查询日志默认关闭, 开启后按大小轮转"""
+from flask import Flask
+
+import slowlog
+
+
+def test_disabled_without_path():
+    app = Flask(__name__)
+    app.config['SLOW_QUERY_LOG'] = None
+    assert slowlog.init_app(app, db=None) is None
+
+
+def test_rotation_keeps_backups(tmp_path):
+    path = tmp_path / 'logs' / 'slow.jsonl'
+    log = slowlog.SlowQueryLog(str(path), threshold_ms=0, explain=False, max_bytes=300, backups=2)
+    for n in range(20):
+        log(None, f'SELECT * FROM users WHERE user_id = {n}', (), 0.5, 1)
+
+    assert log.logged == 20
+    assert sorted(p.name for p in path.parent.iterdir()) == ['slow.jsonl', 'slow.jsonl.1', 'slow.jsonl.2']
+    for p in path.parent.iterdir():
+        assert p.stat().st_size < 300 + 1024
+    # 超出 backups 的最旧记录被丢弃
+    newest = slowlog.read_entries(str(path))
+    older = slowlog.read_entries(str(path) + '.1')
+    assert newest[-1]['ms'] == 500.0
+    assert older and len(newest) + len(older) < 20
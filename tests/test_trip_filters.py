@@ -0,0 +1,242 @@
+"""get_trips_by_filters 与原来多次查询实现的等价性"""
+import json
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import DatabaseManager
+
+
+def reference_trips_by_filters(conn, participants,
+                               start_after=None, start_before=None,
+                               end_after=None, end_before=None, arrived_locations=None):
+    """
+    单条 SQL 之前的实现 (最多五次查询 + Python 求交集), 作为对照
+    唯一的改动: participants=None 原来会抛出 TypeError, 这里视为不按参与者筛选
+    """
+    cursor = conn.cursor()
+
+    if participants is None:
+        cursor.execute('SELECT trip_id FROM trips')
+        candidate_ids = [str(row[0]) for row in cursor.fetchall()]
+    else:
+        participant_query = '''
+            SELECT t.trip_id
+            FROM trips t
+            JOIN trip_participants tp ON t.trip_id = tp.trip_id
+            WHERE tp.user_id IN ({})
+            GROUP BY t.trip_id
+            HAVING COUNT(DISTINCT tp.user_id) = ?
+        '''.format(','.join(['?']*len(participants)))
+
+        cursor.execute(participant_query, participants + [len(participants)])
+        candidate_ids = [str(row[0]) for row in cursor.fetchall()]
+
+    if arrived_locations:
+        location_query = '''
+            SELECT t.trip_id
+            FROM trips t
+            JOIN trip_locations tl ON t.trip_id = tl.trip_id
+            WHERE tl.location_id IN ({})
+            GROUP BY t.trip_id
+            HAVING COUNT(DISTINCT tl.location_id) = ?
+        '''.format(','.join(['?']*len(arrived_locations)))
+        cursor.execute(location_query, arrived_locations + [len(arrived_locations)])
+        candidate_ids_2 = [str(row[0]) for row in cursor.fetchall()]
+        candidate_ids = list(set(candidate_ids) & set(candidate_ids_2))
+
+    if not candidate_ids:
+        return []
+
+    time_query = '''
+        SELECT t.trip_id, t.start_day, t.end_day
+        FROM trips t
+        WHERE t.trip_id IN ({})
+    '''.format(','.join(['?']*len(candidate_ids)))
+
+    time_conditions = []
+    time_params = []
+    if start_after:
+        time_conditions.append("t.start_day >= ?")
+        time_params.append(start_after)
+    if start_before:
+        time_conditions.append("t.start_day <= ?")
+        time_params.append(start_before)
+    if end_after:
+        time_conditions.append("t.end_day >= ?")
+        time_params.append(end_after)
+    if end_before:
+        time_conditions.append("t.end_day <= ?")
+        time_params.append(end_before)
+
+    if time_conditions:
+        time_query += " AND " + " AND ".join(time_conditions)
+
+    cursor.execute(time_query, candidate_ids + time_params)
+    trip_data = cursor.fetchall()
+
+    if not trip_data:
+        return []
+
+    trip_ids = [str(t[0]) for t in trip_data]
+    participant_query = f'''
+        SELECT tp.trip_id, u.user_id, u.username
+        FROM trip_participants tp
+        JOIN users u ON tp.user_id = u.user_id
+        WHERE tp.trip_id IN ({','.join(trip_ids)})
+    '''
+    cursor.execute(participant_query)
+    participant_map = {}
+    for row in cursor.fetchall():
+        trip_id = row[0]
+        if trip_id not in participant_map:
+            participant_map[trip_id] = []
+        participant_map[trip_id].append({
+            'user_id': row[1],
+            'username': row[2]
+        })
+
+    location_query = f'''
+        SELECT tl.trip_id, l.location_id, l.name
+        FROM trip_locations tl
+        JOIN locations l ON tl.location_id = l.location_id
+        WHERE tl.trip_id IN ({','.join(trip_ids)})
+    '''
+    cursor.execute(location_query)
+    location_map = {}
+    for row in cursor.fetchall():
+        trip_id = row[0]
+        if trip_id not in location_map:
+            location_map[trip_id] = []
+        location_map[trip_id].append({
+            'location_id': row[1],
+            'locationname': row[2]
+        })
+
+    return [{
+        'trip_id': t[0],
+        'start_day': datetime.strptime(t[1], "%Y-%m-%d").date(),
+        'end_day': datetime.strptime(t[2], "%Y-%m-%d").date(),
+        'participants': participant_map.get(t[0], []),
+        'locations': location_map.get(t[0], []),
+    } for t in trip_data]
+
+
+def normalized(trips):
+    """旧实现中行程内参与者/地点的顺序取决于执行计划, 比较前按 id 排序; 行程本身的顺序原样比较"""
+    return [dict(trip,
+                 participants=sorted(trip['participants'], key=lambda p: p['user_id']),
+                 locations=sorted(trip['locations'], key=lambda l: l['location_id']))
+            for trip in trips]
+
+
+USERS = 25
+LOCATIONS = 15
+TRIPS = 400
+FIRST_DAY = date(2023, 1, 1)
+# SQLite 3.32 之前 SQLITE_MAX_VARIABLE_NUMBER 的默认值
+VARIABLE_LIMIT = 999
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    rng = random.Random(6)
+    db = DatabaseManager(str(tmp_path_factory.mktemp('trips') / 'trips.db'), initial=True)
+    for k in range(1, USERS + 1):
+        db.create_user(f'user{k}', f'user{k}@example.com')
+    for k in range(1, LOCATIONS + 1):
+        db.create_location(f'place{k}', f'street {k}', 'attraction')
+    for _ in range(TRIPS):
+        start = FIRST_DAY + timedelta(days=rng.randrange(365))
+        end = start + timedelta(days=rng.randint(1, 15))
+        db.create_trip(rng.sample(range(1, USERS + 1), rng.randint(1, 4)),
+                       start.isoformat(), end.isoformat(),
+                       rng.sample(range(1, LOCATIONS + 1), rng.randint(0, 3)))
+    yield db
+    db.close()
+
+
+def random_day(rng):
+    if rng.random() < 0.5:
+        return None
+    return (FIRST_DAY + timedelta(days=rng.randrange(-10, 390))).isoformat()
+
+
+def random_ids(rng, count):
+    roll = rng.random()
+    if roll < 0.15:
+        return None
+    if roll < 0.25:
+        return []
+    # 偶尔带上不存在的 id
+    return rng.sample(range(1, count + 3), rng.randint(1, 3))
+
+
+def test_random_filters_match_reference(db):
+    rng = random.Random(2024)
+    matched = 0
+    for _ in range(2000):
+        participants = random_ids(rng, USERS)
+        locations = random_ids(rng, LOCATIONS)
+        days = dict(start_after=random_day(rng), start_before=random_day(rng),
+                    end_after=random_day(rng), end_before=random_day(rng))
+        actual = db.get_trips_by_filters(participants, arrived_locations=locations, **days)
+        with db.pool.connection() as conn:
+            expected = reference_trips_by_filters(conn, participants, arrived_locations=locations, **days)
+        assert normalized(actual) == normalized(expected), (participants, locations, days)
+        matched += bool(expected)
+    # 确认随机条件确实命中了足够多的行程
+    assert matched > 200
+
+
+def test_participants_none_and_empty(db):
+    with db.pool.connection() as conn:
+        everything = reference_trips_by_filters(conn, None)
+    assert len(everything) == TRIPS
+    assert normalized(db.get_trips_by_filters(None)) == normalized(everything)
+    assert normalized(db.get_trips_by_filters()) == normalized(everything)
+    # 空参与者列表: 与旧实现一样不匹配任何行程; 空地点列表: 不按地点筛选
+    assert db.get_trips_by_filters([]) == []
+    assert normalized(db.get_trips_by_filters([1], arrived_locations=[])) == normalized(
+        [trip for trip in everything if any(p['user_id'] == 1 for p in trip['participants'])])
+
+
+def test_id_sets_beyond_variable_limit(db):
+    everything = db.get_trips_by_filters(None)
+    trip_id = everything[0]['trip_id']
+    members = [p['user_id'] for p in everything[0]['participants']]
+    places = [l['location_id'] for l in everything[0]['locations']]
+    # 给一个行程补齐 VARIABLE_LIMIT + 100 个地点, 使“全部到访”的大集合确实有匹配
+    many = list(range(1, VARIABLE_LIMIT + 100))
+    padding = list(range(10_000, 10_000 + VARIABLE_LIMIT + 10))
+    with db.pool.connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO locations (location_id, name, address, type) VALUES (?, ?, ?, ?)',
+                         [(k, f'place{k}', '', 'attraction') for k in many])
+        conn.executemany('INSERT INTO trip_locations (location_id, trip_id) VALUES (?, ?)',
+                         [(k, trip_id) for k in many if k not in places])
+    try:
+        # 嵌套调用复用同一个连接, 在这个连接上把变量上限降到 SQLite 3.32 之前的默认值
+        with db.pool.connection() as conn:
+            default_limit = conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, VARIABLE_LIMIT)
+            try:
+                # 旧实现为每个 id 绑定一个变量, 超过上限即报错; 新实现以 JSON 数组绑定
+                with pytest.raises(sqlite3.OperationalError, match='too many SQL variables'):
+                    reference_trips_by_filters(conn, members + padding)
+                with pytest.raises(sqlite3.OperationalError, match='too many SQL variables'):
+                    reference_trips_by_filters(conn, members, arrived_locations=many)
+                assert db.get_trips_by_filters(members + padding) == []
+                assert db.get_trips_by_filters(None, arrived_locations=places + padding) == []
+                found = db.get_trips_by_filters(members, arrived_locations=many)
+                assert [trip['trip_id'] for trip in found] == [trip_id]
+                assert len(found[0]['locations']) == len(many)
+                found = db.get_trips_by_filters(None, arrived_locations=many)
+                assert [trip['trip_id'] for trip in found] == [trip_id]
+            finally:
+                conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, default_limit)
+    finally:
+        with db.pool.connection() as conn:
+            conn.execute('DELETE FROM trip_locations WHERE trip_id = ? AND location_id NOT IN '
+                         '(SELECT value FROM json_each(?))', (trip_id, json.dumps(places)))
+            conn.execute('DELETE FROM locations WHERE location_id > ?', (LOCATIONS,))
@@ -0,0 +1,48 @@
+"""
+WSGI 入口 (pre-fork 服务器)
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+app 在 gunicorn master 中创建一次 (preload_app): 迁移和模板数据库的复制只执行一次, Jinja 模板也在
+fork 之前编译, 由各 worker 共享. master 在 fork 之前关闭自己的连接; 每个 worker fork 之后调用
+after_fork 丢弃继承的数据库句柄、重启后台线程, warmup 之后才开始接受请求, 退出时 shutdown
+配置默认取 production, 可用 MYGO_CONFIG 修改
+"""
+import os
+
+from mygo import create_app
+
+
+def compile_templates(app):
+    """编译所有模板, 放进 Jinja 的模板缓存; 返回模板数"""
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def before_fork(app):
+    """master 中 fork worker 之前调用: 关闭启动时 (迁移等) 打开的连接, worker 不会继承打开的连接"""
+    app.extensions['mygo_db'].pool.close()
+
+
+def after_fork(app):
+    """worker 中 fork 之后、第一次访问数据库之前调用"""
+    app.extensions['mygo_db'].after_fork()
+
+
+def warmup(app):
+    """worker 接受请求之前: 打开连接, 把用户和地点列表读进读缓存"""
+    db = app.extensions['mygo_db']
+    with app.app_context():
+        db.get_all_users()
+        db.get_all_locations()
+
+
+def shutdown(app):
+    """worker 退出时: 等写线程处理完队列中的写入, 停止后台线程, 关闭连接"""
+    app.extensions['mygo_db'].close()
+
+
+app = create_app(os.environ.get('MYGO_CONFIG', 'production'))
+compile_templates(app)